@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# encoding: utf8
+"""Script to build the file of precomputed per-Pokémon tables, read by the
+site when `spline-pokedex.precomputed_file` is set.
+
+Usage: precompute-tables.py path/to/config.ini
+
+Run it again whenever the pokedex database is reloaded; the site ignores the
+file if the data has changed since it was built.  The data version is a
+checksum of the database's contents.  If `spline-pokedex.data_version` is
+set, it's used instead, so change it whenever the data changes.
+"""
+from __future__ import print_function
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+import pyramid.paster
+
+from splinext.pokedex import db
+from splinext.pokedex import precompute
+# Importing these registers what they know how to precompute
+import splinext.pokedex.breeding
+import splinext.pokedex.encounters
+import splinext.pokedex.helditems
+import splinext.pokedex.movetables
+
+def main(ini_file):
+    settings = pyramid.paster.get_appsettings(ini_file, name='main')
+    db.connect(settings)
+    precompute.connect(settings)
+
+    filename = settings.get('spline-pokedex.precomputed_file')
+    if not filename:
+        print("spline-pokedex.precomputed_file isn't set", file=sys.stderr)
+        return 1
+
+    version = precompute.data_version()
+    print("Building {0} for data version {1}".format(filename, version))
+
+    # Write to a temporary directory, so the site never sees half a file.
+    # Some dbm backends add their own suffixes, or use more than one file, so
+    # move over whatever turns up
+    directory, basename = os.path.split(os.path.abspath(filename))
+    temp_directory = tempfile.mkdtemp(dir=directory)
+    try:
+        precompute.PrecomputedStore.write_file(
+            os.path.join(temp_directory, basename), version,
+            precompute.produce_all())
+        for name in os.listdir(temp_directory):
+            os.rename(os.path.join(temp_directory, name),
+                      os.path.join(directory, name))
+    finally:
+        shutil.rmtree(temp_directory)
+
+    print("Done")
+    return 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2:
+        print(__doc__, file=sys.stderr)
+        sys.exit(1)
+    sys.exit(main(sys.argv[1]))
@@ -21,6 +21,7 @@ setup(
         "waitress>=1.2.1", # development server
         #"Babel>=0.9.5", # needed for translation work only, can do without
 
+        'numpy',
         'pokedex',
         'SQLAlchemy>=0.7.5,<1.2.0b1',
         'zope.sqlalchemy',
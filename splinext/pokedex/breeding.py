@@ -0,0 +1,294 @@
+# encoding: utf8
+"""Who can breed with whom, worked out once for the whole Pokédex."""
+from __future__ import absolute_import
+
+from collections import defaultdict, namedtuple
+
+import numpy
+from sqlalchemy.orm import joinedload
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+from . import searchindex
+
+DITTO_EGG_GROUP_ID = 13
+NO_EGGS_EGG_GROUP_ID = 15
+
+def gender_class(gender_rate):
+    """Reduces a gender rate to what matters for breeding: 'genderless',
+    'male' or 'female' for single-gender Pokémon, and 'mixed' otherwise.
+    """
+    if gender_rate == -1:
+        return 'genderless'
+    elif gender_rate == 0:
+        return 'male'
+    elif gender_rate == 8:
+        return 'female'
+    else:
+        return 'mixed'
+
+BreedingIndex = namedtuple('BreedingIndex',
+    ['species_egg_groups', 'species_gender_classes', 'compatible_families',
+     'pokemon_species'])
+
+def _compatible_families(egg_group_ids, gender, species_egg_groups,
+                         species_gender_classes, base_forms, ditto_ids):
+    """Returns the sorted ids of the base forms of every family compatible
+    with a Pokémon in the given egg groups and gender class.
+    """
+    if gender == 'genderless':
+        # Genderless; Ditto only
+        return sorted(ditto_ids)
+    elif NO_EGGS_EGG_GROUP_ID in egg_group_ids:
+        # No Eggs group
+        return []
+
+    egg_group_ids = set(egg_group_ids)
+    compatible = []
+    for species_id, other_egg_group_ids in species_egg_groups.items():
+        if DITTO_EGG_GROUP_ID in other_egg_group_ids:
+            # Ditto can breed with anything
+            compatible.append(species_id)
+            continue
+
+        # Can only breed with pokémon we share an egg group with...
+        if not egg_group_ids.intersection(other_egg_group_ids):
+            continue
+        # ... and only the base form of each family is listed
+        if species_id not in base_forms:
+            continue
+
+        other_gender = species_gender_classes[species_id]
+        # Can't breed with genderless pokémon
+        if other_gender == 'genderless':
+            continue
+        # Male-only pokémon can't breed with other male-only pokémon
+        # Female-only pokémon can't breed with other female-only pokémon
+        if gender in ('male', 'female') and other_gender == gender:
+            continue
+
+        compatible.append(species_id)
+
+    compatible.sort()
+    return compatible
+
+@precompute.index
+def breeding_index():
+    """Returns a `BreedingIndex`.
+
+    `species_egg_groups` maps species ids to a sorted tuple of egg group ids,
+    and `species_gender_classes` maps them to their `gender_class`.
+    `compatible_families` maps `(egg_group_ids, gender_class)` to the sorted
+    ids of every compatible "base form", for every combination that exists.
+    `pokemon_species` maps Pokémon ids to their species ids.
+    """
+    session = db.pokedex_session
+
+    species_egg_groups = defaultdict(list)
+    for species_id, egg_group_id in session.query(
+            t.PokemonEggGroup.species_id, t.PokemonEggGroup.egg_group_id):
+        species_egg_groups[species_id].append(egg_group_id)
+    species_egg_groups = dict(
+        (species_id, tuple(sorted(egg_group_ids)))
+        for species_id, egg_group_ids in species_egg_groups.items())
+
+    parents = {}
+    species_gender_classes = {}
+    ditto_ids = []
+    for species_id, identifier, parent_id, gender_rate in session.query(
+            t.PokemonSpecies.id, t.PokemonSpecies.identifier,
+            t.PokemonSpecies.evolves_from_species_id,
+            t.PokemonSpecies.gender_rate):
+        parents[species_id] = parent_id
+        species_gender_classes[species_id] = gender_class(gender_rate)
+        if identifier == u'ditto':
+            ditto_ids.append(species_id)
+
+    # To simplify the list considerably, we only want the BASE FORM of every
+    # compatible family.  The base form is either:
+    # - a Pokémon that has breeding groups and no evolution parent, or
+    # - a Pokémon whose parent has no breeding groups (i.e. 15 only)
+    #   and no evolution parent.
+    # ASSUMPTION: Every base-form Pokémon in a breedable family can breed.
+    # ASSUMPTION: Every family has the same breeding groups throughout.
+    base_forms = set()
+    for species_id, parent_id in parents.items():
+        if parent_id is None:
+            base_forms.add(species_id)
+        elif parents[parent_id] is None and NO_EGGS_EGG_GROUP_ID in \
+            species_egg_groups.get(parent_id, ()):
+
+            base_forms.add(species_id)
+
+    compatible_families = {}
+    for species_id, egg_group_ids in species_egg_groups.items():
+        key = egg_group_ids, species_gender_classes[species_id]
+        if key not in compatible_families:
+            compatible_families[key] = _compatible_families(
+                egg_group_ids, key[1], species_egg_groups,
+                species_gender_classes, base_forms, ditto_ids)
+
+    return BreedingIndex(
+        species_egg_groups=species_egg_groups,
+        species_gender_classes=species_gender_classes,
+        compatible_families=compatible_families,
+        pokemon_species=dict(session.query(t.Pokemon.id,
+                                           t.Pokemon.species_id)),
+    )
+
+def compatible_families(species):
+    """Returns the base forms of every family `species` can breed with, in
+    id order.
+    """
+    index = breeding_index()
+    key = (index.species_egg_groups.get(species.id, ()),
+           index.species_gender_classes[species.id])
+    species_ids = index.compatible_families.get(key, [])
+    if not species_ids:
+        return []
+
+    families = db.pokedex_session.query(t.PokemonSpecies) \
+        .filter(t.PokemonSpecies.id.in_(species_ids)) \
+        .options(joinedload('default_form')) \
+        .order_by(t.PokemonSpecies.id)
+    return families.all()
+
+
+### Chain breeding
+
+def _build_breeding_graph(move_id, version_group_id):
+    """Returns the egg group graph for passing down a move, as stored in
+    the precomputed store.
+
+    Breeding only really cares about egg group combinations, not the
+    individual Pokémon; for all intents and purposes, any (5, 9) Pokémon can
+    be replaced by any other.  So every egg group with a Pokémon that learns
+    the move is a node, indexed in id order, and every Pokémon in two egg
+    groups is an edge between them.  The graph is a dict of `egg_groups`,
+    their `adjacency` lists, and the ids of the `pokemon` in each.
+    """
+    index = breeding_index()
+    pokemon_ids = searchindex.learnset_index().pokemon_learning(
+        [move_id], [version_group_id])
+
+    # XXX this should exclude Ditto and unbreedables
+    pokemon_by_egg_group = defaultdict(list)
+    edges = set()
+    for pokemon_id in pokemon_ids.tolist():
+        species_id = index.pokemon_species[pokemon_id]
+        egg_group_ids = index.species_egg_groups.get(species_id, ())
+        for egg_group_id in egg_group_ids:
+            pokemon_by_egg_group[egg_group_id].append(pokemon_id)
+        # Pokémon in only one egg group aren't useful as edges
+        if len(egg_group_ids) == 2:
+            edges.add(egg_group_ids)
+
+    egg_group_ids = sorted(pokemon_by_egg_group)
+    nodes = dict((egg_group_id, i)
+                 for i, egg_group_id in enumerate(egg_group_ids))
+    adjacency = [[] for _ in egg_group_ids]
+    for a, b in sorted(edges):
+        adjacency[nodes[a]].append(nodes[b])
+        adjacency[nodes[b]].append(nodes[a])
+
+    return dict(
+        egg_groups=egg_group_ids,
+        adjacency=adjacency,
+        pokemon=[pokemon_by_egg_group[egg_group_id]
+                 for egg_group_id in egg_group_ids],
+    )
+
+def breeding_graph(move_id, version_group_id):
+    """Returns the egg group graph for passing down a move in a version
+    group, from the precomputed store if possible.
+    """
+    return precompute.store.get_or_build('breeding-graphs',
+        u'{0}/{1}'.format(move_id, version_group_id),
+        lambda: _build_breeding_graph(move_id, version_group_id))
+
+@precompute.producer
+def precompute_breeding_graphs():
+    """Yields store entries for every move's breeding graph in every version
+    group, for `bin/precompute-tables.py`.
+    """
+    learnset = searchindex.learnset_index()
+    pairs = set(zip(learnset.move_ids.tolist(),
+                    learnset.version_group_ids.tolist()))
+    for move_id, version_group_id in sorted(pairs):
+        yield 'breeding-graphs', u'{0}/{1}'.format(move_id, version_group_id), \
+            _build_breeding_graph(move_id, version_group_id)
+
+def _depths(adjacency, start):
+    """Returns each node's distance from the `start` nodes, counting them as
+    1, or 0 for nodes that can't be reached.
+    """
+    depths = numpy.zeros(len(adjacency), dtype=int)
+    frontier = numpy.zeros(len(adjacency), dtype=bool)
+    frontier[start] = True
+
+    depth = 1
+    while frontier.any():
+        depths[frontier] = depth
+        frontier = adjacency[frontier].any(axis=0) & (depths == 0)
+        depth += 1
+
+    return depths
+
+def chain_breeding_tree(target, move_id, version_group_id):
+    u"""Returns a tree of egg groups for passing a move down to `target`, and
+    a dict of the Pokémon in each egg group that learn the move.
+
+    Each node of the tree is a dict of `node`, an `EggGroup` (or 'me' for
+    the target itself), and `adjacent`, its children.  Egg groups are placed
+    as close to the target as possible; one can appear under several parents
+    on the same level.
+    """
+    graph = breeding_graph(move_id, version_group_id)
+    egg_group_ids = graph['egg_groups']
+    nodes = dict((egg_group_id, i)
+                 for i, egg_group_id in enumerate(egg_group_ids))
+
+    adjacency = numpy.zeros((len(egg_group_ids), len(egg_group_ids)),
+                            dtype=bool)
+    for i, neighbors in enumerate(graph['adjacency']):
+        adjacency[i, neighbors] = True
+
+    # The target is sort of an anonymous node with edges to its own egg
+    # groups, so those are the first level
+    start = [nodes[egg_group_id] for egg_group_id
+             in breeding_index().species_egg_groups.get(target.species_id, ())
+             if egg_group_id in nodes]
+    depths = _depths(adjacency, start)
+    reachable = numpy.flatnonzero(depths).tolist()
+
+    egg_groups = dict(
+        (egg_group.id, egg_group) for egg_group
+        in db.pokedex_session.query(t.EggGroup)
+            .filter(t.EggGroup.id.in_([egg_group_ids[i] for i in reachable])))
+    pokemon_ids = set(pokemon_id for i in reachable
+                      for pokemon_id in graph['pokemon'][i])
+    pokemon = {}
+    if pokemon_ids:
+        pokemon = dict(
+            (one_pokemon.id, one_pokemon) for one_pokemon
+            in db.pokedex_session.query(t.Pokemon)
+                .filter(t.Pokemon.id.in_(pokemon_ids)))
+
+    # Children of a node are its neighbors on the next level down; nodes are
+    # already in egg group id order
+    tree = dict((i, dict(node=egg_groups[egg_group_ids[i]], adjacent=[]))
+                for i in reachable)
+    for i in reachable:
+        tree[i]['adjacent'] = [
+            tree[j] for j in numpy.flatnonzero(
+                adjacency[i] & (depths == depths[i] + 1)).tolist()]
+    root = dict(node='me', adjacent=[tree[i] for i in sorted(set(start))])
+
+    pokemon_by_egg_group = dict(
+        (egg_groups[egg_group_ids[i]],
+         [pokemon[pokemon_id] for pokemon_id in graph['pokemon'][i]])
+        for i in reachable)
+
+    return root, pokemon_by_egg_group
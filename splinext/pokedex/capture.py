@@ -0,0 +1,239 @@
+# encoding: utf8
+u"""Capture chances, worked out for lots of balls and conditions at once.
+
+`capture_chances` is `pokedex.formulae.capture_chance` over NumPy arrays:
+every argument broadcasts, so a whole table of balls, HP, levels or statuses
+costs one pass.
+"""
+from __future__ import absolute_import, division
+
+import numpy
+
+# Every bonus any ball gives, as used by the capture rate gadget.  Nest and
+# Timer Balls scale smoothly between 10 and 40; the Park Ball is special
+BALL_BONUSES = range(10, 41) + [2550]
+CAPTURE_BONUSES = [10, 20, 30, 40, 80]
+CAPTURE_MODIFIERS = [-20, 0, 20, 30, 40]
+
+# Status bonuses, and the ailments that give them
+STATUS_BONUSES = [
+    (u'', 10),
+    (u'PAR/BRN/PSN', 15),
+    (u'SLP/FRZ', 20),
+]
+
+# Species that evolve with a Moon Stone, for the Moon Ball
+MOON_STONE_SPECIES = frozenset([
+    u'nidoran-m', u'nidorina', u'nidoqueen',
+    u'nidoran-f', u'nidorino', u'nidoking',
+    u'cleffa', u'clefairy', u'clefable',
+    u'igglybuff', u'jigglypuff', u'wigglytuff',
+    u'skitty', u'delcatty',
+])
+
+# Heavy Ball capture modifiers, by weight class.  The second is -20 too; sic,
+# game bug
+HEAVY_BALL_MODIFIERS = [-20, -20, 20, 30, 40]
+
+def weight_class(weight):
+    """Returns a Pokémon's Heavy Ball weight class, from 0 to 4.  Heavy Ball
+    partitions by 102.4 kg; weights are stored as...  hectograms.  So.
+    """
+    return min(int((weight - 1) / 1024), 4)
+
+def capture_chances(capture_rate, percent_hp, ball_bonus=10,
+                    status_bonus=10, capture_bonus=10, capture_modifier=0):
+    """Vectorized `pokedex.formulae.capture_chance`.
+
+    The arguments broadcast together, and the result has an extra last axis
+    of five chances: capture, then the ball shaking three, two, one, or zero
+    times.
+    """
+    # HG/SS Pokéballs modify capture rate rather than the ball bonus
+    capture_rate = numpy.clip(
+        numpy.asarray(capture_rate) * capture_bonus // 10 + capture_modifier,
+        1, 255)
+
+    base_chance = numpy.floor(
+        capture_rate * ball_bonus // 10 * (1 - 2/3 * percent_hp)
+    ).astype(int)
+    base_chance = numpy.maximum(base_chance * status_bonus // 10, 1)
+
+    # Shake index involves integer sqrt.  Lots of floors.
+    shake_index = 1048560 // numpy.floor(numpy.sqrt(numpy.floor(
+        numpy.sqrt(16711680 // base_chance)))).astype(int)
+
+    # The Pokémon has four chances to escape; each shake fails with
+    # probability (1 - shake_index / 65536)
+    p = shake_index / 65536
+    chances = numpy.stack(
+        [p ** 4, p ** 3 * (1 - p), p ** 2 * (1 - p), p * (1 - p), 1 - p],
+        axis=-1)
+
+    # Iff base_chance < 255, then shake_index < 65535; otherwise it's a
+    # guaranteed capture
+    chances[shake_index >= 65535] = [1.0, 0, 0, 0, 0]
+    return chances
+
+class ChanceTable(object):
+    """Capture chances for one Pokémon in one situation, with every bonus
+    that any ball can give.
+
+    Call it like `capture_chance`, with any of `ball_bonus`, `capture_bonus`
+    and `capture_modifier` from the lists above.
+    """
+
+    def __init__(self, capture_rate, percent_hp, status_bonus=10):
+        self.ball_bonuses = dict(
+            (bonus, i) for i, bonus in enumerate(BALL_BONUSES))
+        self.capture_bonuses = dict(
+            (bonus, i) for i, bonus in enumerate(CAPTURE_BONUSES))
+        self.capture_modifiers = dict(
+            (modifier, i) for i, modifier in enumerate(CAPTURE_MODIFIERS))
+
+        self.chances = capture_chances(capture_rate, percent_hp,
+            ball_bonus=numpy.array(BALL_BONUSES)[:, None, None],
+            status_bonus=status_bonus,
+            capture_bonus=numpy.array(CAPTURE_BONUSES)[None, :, None],
+            capture_modifier=numpy.array(CAPTURE_MODIFIERS)[None, None, :])
+
+    def __call__(self, ball_bonus=10, capture_bonus=10, capture_modifier=0):
+        return tuple(self.chances[
+            self.ball_bonuses[ball_bonus],
+            self.capture_bonuses[capture_bonus],
+            self.capture_modifiers[capture_modifier],
+        ].tolist())
+
+
+def expected_attempts(chances, turns=()):
+    u"""Returns the expected number of attempts to catch a Pokémon, when the
+    chance to catch it changes over time.
+
+    `chances` has the chance for each stretch of turns along its last axis,
+    and `turns` is how many turns each of them lasts, except for the last,
+    which lasts forever.  For example, a Quick Ball has two chances, and
+    `turns` of `[1]`.
+    """
+    chances = numpy.asarray(chances, dtype=float)
+    turns = numpy.asarray(turns, dtype=int)
+    finite = chances[..., :-1]
+    misses = 1 - finite
+
+    # Chance of missing every turn of each stretch, the turn before each one
+    # starts, and the chance of getting that far
+    missed_stretch = misses ** turns
+    starts = numpy.cumsum(turns) - turns
+    reached = numpy.cumprod(numpy.concatenate(
+        [numpy.ones_like(missed_stretch[..., :1]), missed_stretch[..., :-1]],
+        axis=-1), axis=-1)
+
+    # Sum of p * q**(k - 1) * (start + k) for k from 1 to n, as a geometric
+    # series: start * (1 - q**n) + (1 - (n + 1) q**n + n q**(n + 1)) / p
+    stretches = starts * (1 - missed_stretch) + (
+        1 - (turns + 1) * missed_stretch
+        + turns * misses * missed_stretch
+    ) / finite
+
+    # The rest of infinity is the usual expected value with the final chance,
+    # factoring in that turns have already passed
+    everything_missed = numpy.prod(missed_stretch, axis=-1)
+    return (reached * stretches).sum(axis=-1) \
+        + everything_missed * (1 / chances[..., -1] + turns.sum())
+
+
+### Heatmaps
+
+# Nest Balls are no better from level 30 up, and Timer Balls from turn 30
+NEST_BALL_LEVELS = range(1, 31)
+TIMER_BALL_TURNS = range(1, 31)
+
+def species_balls(pokemon):
+    """Returns `(ball identifier, bonuses)` for the balls whose bonuses
+    depend only on the Pokémon itself, with `bonuses` as keyword arguments
+    for `capture_chances`.
+    """
+    is_moony = pokemon.species.identifier in MOON_STONE_SPECIES
+    is_skittish = pokemon.base_stat('speed', 0) >= 100
+    is_nettable = any(type_.identifier in ('bug', 'water')
+                      for type_ in pokemon.types)
+
+    return [
+        (u'poke-ball', dict()),
+        (u'great-ball', dict(ball_bonus=15)),
+        (u'ultra-ball', dict(ball_bonus=20)),
+        (u'moon-ball', dict(capture_bonus=40 if is_moony else 10)),
+        (u'heavy-ball', dict(capture_modifier=
+            HEAVY_BALL_MODIFIERS[weight_class(pokemon.weight)])),
+        (u'fast-ball', dict(capture_bonus=40 if is_skittish else 10)),
+        (u'net-ball', dict(ball_bonus=30 if is_nettable else 10)),
+    ]
+
+def _grid(array):
+    # Four decimal places is plenty for a heatmap, and keeps the JSON small
+    return numpy.round(array, 4).tolist()
+
+def heatmap(capture_rate, balls, percent_hp):
+    """Returns capture chances and expected attempts for every ball, over
+    every status and HP in `percent_hp`, as a JSON-able dict.
+
+    `balls` is a list like the one from `species_balls`.  Grids are indexed
+    by status, as in `STATUS_BONUSES`, then by HP.  The Nest Ball's are also
+    by level first, and the Timer Ball's by turn.  The Timer and Quick Balls'
+    expected attempts are for a battle starting from the first turn.
+    """
+    percent_hp = numpy.asarray(percent_hp)
+    status_bonus = numpy.array([bonus for _, bonus in STATUS_BONUSES])
+
+    def chances(ball_bonus=10, capture_bonus=10, capture_modifier=0):
+        # Whatever shape the bonuses are, with status and HP after that
+        expand = lambda bonus: numpy.asarray(bonus)[..., None, None]
+        return capture_chances(capture_rate, percent_hp,
+            ball_bonus=expand(ball_bonus),
+            status_bonus=status_bonus[:, None],
+            capture_bonus=expand(capture_bonus),
+            capture_modifier=expand(capture_modifier),
+        )[..., 0]
+
+    # Everything with a fixed bonus is done at once
+    fixed = chances(
+        ball_bonus=[bonuses.get('ball_bonus', 10) for _, bonuses in balls],
+        capture_bonus=[bonuses.get('capture_bonus', 10)
+                       for _, bonuses in balls],
+        capture_modifier=[bonuses.get('capture_modifier', 0)
+                          for _, bonuses in balls],
+    )
+    result = {}
+    for (identifier, _), grid in zip(balls, fixed):
+        result[identifier] = dict(
+            chance=_grid(grid),
+            expected_attempts=_grid(1 / grid),
+        )
+
+    nest = chances(ball_bonus=[max(10, 40 - level)
+                               for level in NEST_BALL_LEVELS])
+    result[u'nest-ball'] = dict(
+        levels=NEST_BALL_LEVELS,
+        chance=_grid(nest),
+        expected_attempts=_grid(1 / nest),
+    )
+
+    # Turns go last, so expected_attempts can see them all at once
+    timer = chances(ball_bonus=[min(40, turn + 10)
+                                for turn in TIMER_BALL_TURNS])
+    result[u'timer-ball'] = dict(
+        turns=TIMER_BALL_TURNS,
+        chance=_grid(timer),
+        expected_attempts=_grid(expected_attempts(
+            numpy.rollaxis(timer, 0, timer.ndim),
+            [1] * (len(TIMER_BALL_TURNS) - 1))),
+    )
+
+    quick = chances(ball_bonus=[40, 10])
+    result[u'quick-ball'] = dict(
+        turns=[1, 2],
+        chance=_grid(quick),
+        expected_attempts=_grid(expected_attempts(
+            numpy.rollaxis(quick, 0, quick.ndim), [1])),
+    )
+
+    return result
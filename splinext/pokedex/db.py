@@ -44,6 +44,17 @@ def connect(settings):
         pokedex_lookup.rebuild_index()
 
 
+def standalone_session():
+    """Returns a new session in the current language, outside the request's
+    transaction, for work that outlives the request, such as streaming a
+    response.  Whoever asks for it has to close it.
+    """
+    return MultilangSession(
+        bind=pokedex_session.get_bind(),
+        default_language_id=pokedex_session.default_language_id,
+    )
+
+
 # Quick access to a few database objects
 def get_by_identifier_query(table, identifier):
     """Returns a query to find a single row in the given table by identifier.
@@ -0,0 +1,184 @@
+# encoding: utf8
+"""Wild encounter data, boiled down ahead of time.
+
+The encounter table has a row for every slot in every area in every game,
+which is far more than any page actually shows.  Here those rows are
+collapsed into summaries: one per Pokémon, version, method, area, and set of
+condition values, with the rarities of identical level ranges added
+together.  Summaries are stored in `precompute.store` per Pokémon and per
+location area, as compact tuples of ids:
+
+    (other_id, version_id, method_id, condition_value_ids, levels)
+
+where `other_id` is the location area id for a Pokémon's summaries and the
+Pokémon id for an area's, and `levels` is a list of
+`(min_level, max_level, rarity)`.
+"""
+from __future__ import absolute_import
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.orm import joinedload
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+EncounterSummary = namedtuple('EncounterSummary', ['pokemon', 'version',
+    'method', 'location_area', 'condition_values', 'levels'])
+
+def _summarize(criterion=None):
+    """Collapses the encounters matching `criterion` (or all of them) into
+    summaries.
+
+    Returns a dict mapping `(pokemon_id, location_area_id, version_id,
+    method_id, condition_value_ids)` to a list of `(min_level, max_level,
+    rarity)`.
+    """
+    session = db.pokedex_session
+
+    cv_q = session.query(
+        t.EncounterConditionValueMap.encounter_id,
+        t.EncounterConditionValueMap.encounter_condition_value_id)
+    q = session.query(
+        t.Encounter.id,
+        t.Encounter.pokemon_id,
+        t.Encounter.location_area_id,
+        t.Encounter.version_id,
+        t.EncounterSlot.encounter_method_id,
+        t.EncounterSlot.rarity,
+        t.Encounter.min_level,
+        t.Encounter.max_level,
+    ).join(t.Encounter.slot)
+    if criterion is not None:
+        cv_q = cv_q.join(t.Encounter,
+            t.EncounterConditionValueMap.encounter_id == t.Encounter.id) \
+            .filter(criterion)
+        q = q.filter(criterion)
+
+    condition_values = defaultdict(list)
+    for encounter_id, condition_value_id in cv_q:
+        condition_values[encounter_id].append(condition_value_id)
+
+    # key => (min_level, max_level) => rarity
+    summaries = defaultdict(lambda: defaultdict(int))
+    for (encounter_id, pokemon_id, area_id, version_id, method_id,
+            rarity, min_level, max_level) in q:
+        key = (pokemon_id, area_id, version_id, method_id,
+               tuple(sorted(condition_values[encounter_id])))
+        # Combine "level 3-4, 50%" and "level 3-4, 20%" into "level 3-4, 70%".
+        summaries[key][min_level, max_level] += rarity or 0
+
+    return dict(
+        (key, sorted((min_level, max_level, rarity)
+                     for (min_level, max_level), rarity in levels.items()))
+        for key, levels in summaries.items()
+    )
+
+def _pokemon_rows(summaries):
+    return sorted(
+        (area_id, version_id, method_id, list(condition_value_ids), levels)
+        for (pokemon_id, area_id, version_id, method_id, condition_value_ids),
+            levels in summaries.items())
+
+def _area_rows(summaries):
+    return sorted(
+        (pokemon_id, version_id, method_id, list(condition_value_ids), levels)
+        for (pokemon_id, area_id, version_id, method_id, condition_value_ids),
+            levels in summaries.items())
+
+def pokemon_encounter_rows(pokemon_id):
+    return precompute.store.get_or_build('pokemon-encounters', pokemon_id,
+        lambda: _pokemon_rows(_summarize(
+            t.Encounter.pokemon_id == pokemon_id)))
+
+def area_encounter_rows(area_id):
+    return precompute.store.get_or_build('area-encounters', area_id,
+        lambda: _area_rows(_summarize(
+            t.Encounter.location_area_id == area_id)))
+
+@precompute.producer
+def precompute_encounters():
+    """Yields store entries for every Pokémon's and area's summaries, for
+    `bin/precompute-tables.py`.
+    """
+    summaries = _summarize()
+
+    by_pokemon = defaultdict(dict)
+    by_area = defaultdict(dict)
+    for key, levels in summaries.items():
+        pokemon_id, area_id = key[0], key[1]
+        by_pokemon[pokemon_id][key] = levels
+        by_area[area_id][key] = levels
+
+    for pokemon_id, pokemon_summaries in by_pokemon.items():
+        yield 'pokemon-encounters', pokemon_id, _pokemon_rows(pokemon_summaries)
+    for area_id, area_summaries in by_area.items():
+        yield 'area-encounters', area_id, _area_rows(area_summaries)
+
+
+def _load(table, ids, *options):
+    """Fetches the rows of `table` with the given ids, as a dict, in a single
+    query.
+    """
+    ids = set(ids)
+    if not ids:
+        return {}
+    q = db.pokedex_session.query(table).filter(table.id.in_(ids))
+    return dict((row.id, row) for row in q.options(*options))
+
+def _hydrate(rows, pokemon={}, location_areas={}):
+    """Turns rows of `(pokemon_id, location_area_id, version_id, method_id,
+    condition_value_ids, levels)` into `EncounterSummary`s of real objects.
+
+    Objects already at hand can be passed in as dicts of id to object, to
+    save fetching them again.
+    """
+    versions = _load(t.Version, (row[2] for row in rows),
+        joinedload('version_group.generation'))
+    methods = _load(t.EncounterMethod, (row[3] for row in rows))
+    condition_values = _load(t.EncounterConditionValue,
+        (cv_id for row in rows for cv_id in row[4]),
+        joinedload('condition'))
+
+    pokemon = dict(pokemon)
+    pokemon.update(_load(t.Pokemon,
+        (row[0] for row in rows if row[0] not in pokemon),
+        joinedload('species')))
+    location_areas = dict(location_areas)
+    location_areas.update(_load(t.LocationArea,
+        (row[1] for row in rows if row[1] not in location_areas),
+        joinedload('location.region')))
+
+    summaries = []
+    for (pokemon_id, area_id, version_id, method_id, condition_value_ids,
+            levels) in rows:
+        summaries.append(EncounterSummary(
+            pokemon=pokemon[pokemon_id],
+            location_area=location_areas[area_id],
+            version=versions[version_id],
+            method=methods[method_id],
+            condition_values=tuple(
+                condition_values[cv_id] for cv_id in condition_value_ids),
+            levels=[dict(min_level=min_level, max_level=max_level,
+                         rarity=rarity)
+                    for min_level, max_level, rarity in levels],
+        ))
+
+    return summaries
+
+def pokemon_encounters(pokemon):
+    """Returns a list of `EncounterSummary`s for the given Pokémon."""
+    rows = [(pokemon.id,) + tuple(row)
+            for row in pokemon_encounter_rows(pokemon.id)]
+    return _hydrate(rows, pokemon={pokemon.id: pokemon})
+
+def area_encounters(location_areas):
+    """Returns a list of `EncounterSummary`s for the given location areas."""
+    rows = []
+    for location_area in location_areas:
+        for row in area_encounter_rows(location_area.id):
+            rows.append((row[0], location_area.id) + tuple(row[1:]))
+    return _hydrate(rows, location_areas=dict(
+        (location_area.id, location_area) for location_area in location_areas))
@@ -0,0 +1,255 @@
+# encoding: utf8
+"""Evolution chain structure, worked out once for every chain at a time."""
+from __future__ import absolute_import
+
+from collections import defaultdict, namedtuple
+
+from sqlalchemy.orm import joinedload, subqueryload
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+# Relationships on `PokemonEvolution` that evolution descriptions might need,
+# keyed by the column that says whether they're used at all
+EVOLUTION_RELATIONSHIPS = [
+    ('trigger_item_id', 'trigger_item'),
+    ('gender_id', 'gender'),
+    ('location_id', 'location'),
+    ('held_item_id', 'held_item'),
+    ('known_move_id', 'known_move'),
+    ('known_move_type_id', 'known_move_type'),
+    ('party_species_id', 'party_species'),
+    ('party_type_id', 'party_type'),
+    ('trade_species_id', 'trade_species'),
+]
+
+ChainLayout = namedtuple('ChainLayout', ['rows', 'relationships'])
+
+def _chain_rows(species_ids, parents, children, babies):
+    """Lays out one chain as a table.
+
+    Format is a matrix as follows:
+    [
+      [ '', Eevee, Vaporeon, '' ]
+      [ None, None, Jolteon, None ]
+      [ None, None, Flareon, None ]
+      ... etc ...
+    ]
+    That is, each row is a physical row in the resulting table, and each
+    contains four elements, one per column: Baby, Base, Stage 1, Stage 2.
+    The Pokémon are actually `[species_id, span]` pairs, where the span is
+    used as the HTML cell's rowspan -- e.g., Eevee has a total of seven
+    descendents, so it would need to span 7 rows.
+    """
+    # Strategy: build this table going backwards.
+    # Take each leaf in id order, and build the path going back up to its
+    # root.  Remember all of the nodes seen along the way, and stick later
+    # paths to a seen node if one exists.
+    rows = []
+    seen_nodes = {}
+    leaves = sorted(species_id for species_id in species_ids
+                    if not children[species_id])
+    for leaf in leaves:
+        # root, parent_n, ... parent2, parent1, leaf
+        current_path = []
+
+        current_id = leaf
+        while current_id is not None:
+            # The loop bails just after current_id is no longer the root, so
+            # this will give us the root after the loop ends; we need to know
+            # if it's a baby to see whether to indent the entire table below
+            root_id = current_id
+
+            if current_id in seen_nodes:
+                current_node = seen_nodes[current_id]
+                # Don't need to repeat this node; the first instance will
+                # have a rowspan
+                current_path.insert(0, None)
+            else:
+                current_node = [current_id, 0]
+                current_path.insert(0, current_node)
+                seen_nodes[current_id] = current_node
+
+            # This node has one more row to span: our current leaf
+            current_node[1] += 1
+
+            current_id = parents[current_id]
+
+        # We want every path to have four nodes: baby, basic, stage 1 and 2.
+        # Every root node is basic, unless it's defined as being a baby.
+        # So first, add an empty baby node at the beginning if this is not
+        # a baby.
+        # We use an empty string to indicate an empty cell, as opposed to a
+        # complete lack of cell due to a tall cell from an earlier row.
+        if not babies[root_id]:
+            current_path.insert(0, '')
+        # Now pad to four if necessary.
+        while len(current_path) < 4:
+            current_path.append('')
+
+        rows.append(current_path)
+
+    return rows
+
+@precompute.index
+def chain_layouts():
+    """Returns a dict of evolution chain id to `ChainLayout`.
+
+    `rows` is the table described in `_chain_rows`; `relationships` is the
+    set of `PokemonEvolution` relationships that the chain's evolution
+    methods refer to.
+    """
+    session = db.pokedex_session
+
+    chains = defaultdict(list)
+    parents = {}
+    children = defaultdict(list)
+    babies = {}
+    species_chains = {}
+    q = session.query(
+        t.PokemonSpecies.id,
+        t.PokemonSpecies.evolution_chain_id,
+        t.PokemonSpecies.evolves_from_species_id,
+        t.PokemonSpecies.is_baby,
+    )
+    for species_id, chain_id, parent_id, is_baby in q:
+        chains[chain_id].append(species_id)
+        species_chains[species_id] = chain_id
+        parents[species_id] = parent_id
+        babies[species_id] = is_baby
+        if parent_id is not None:
+            children[parent_id].append(species_id)
+
+    relationships = defaultdict(set)
+    for evolution in session.query(t.PokemonEvolution):
+        chain_id = species_chains[evolution.evolved_species_id]
+        for column, relationship in EVOLUTION_RELATIONSHIPS:
+            if getattr(evolution, column) is not None:
+                relationships[chain_id].add(relationship)
+
+    return dict(
+        (chain_id, ChainLayout(
+            rows=_chain_rows(species_ids, parents, children, babies),
+            relationships=frozenset(relationships[chain_id]),
+        ))
+        for chain_id, species_ids in chains.items()
+    )
+
+# Where a species sits in its evolution chain:
+# - `stage` is 'baby', 'basic', or 'stageN' for a species N evolutions past
+#   basic; babies don't count towards N
+# - `position` is 'first', 'middle', 'last', or 'only'
+# - `branching` means it has more than one evolution (e.g. Tyrogue), and
+#   `branched` means its parent does (e.g. Shedinja)
+# - `root_id` is the species the chain starts from
+# - `chain_position` orders the chain's species so that each comes right
+#   before its own evolutions, as in the evolution chain sort
+SpeciesTopology = namedtuple('SpeciesTopology', [
+    'stage', 'position', 'branching', 'branched', 'root_id', 'chain_position',
+])
+
+def _stage(species_id, parents, babies):
+    if babies[species_id]:
+        return u'baby'
+
+    depth = 0
+    parent_id = parents[species_id]
+    while parent_id is not None and not babies[parent_id]:
+        depth += 1
+        parent_id = parents[parent_id]
+
+    if depth == 0:
+        return u'basic'
+    return u'stage{0}'.format(depth)
+
+def _position(has_parent, has_children):
+    if has_parent:
+        return u'middle' if has_children else u'last'
+    else:
+        return u'first' if has_children else u'only'
+
+@precompute.index
+def species_topology():
+    """Returns a dict of species id to `SpeciesTopology`, for every species.
+
+    Chains can be any length.
+    """
+    parents = {}
+    children = defaultdict(list)
+    babies = {}
+    orders = {}
+    q = db.pokedex_session.query(
+        t.PokemonSpecies.id,
+        t.PokemonSpecies.evolves_from_species_id,
+        t.PokemonSpecies.is_baby,
+        t.PokemonSpecies.order,
+    )
+    for species_id, parent_id, is_baby, order in q:
+        parents[species_id] = parent_id
+        babies[species_id] = is_baby
+        orders[species_id] = order
+        if parent_id is not None:
+            children[parent_id].append(species_id)
+
+    topology = {}
+    roots = sorted((species_id for species_id, parent_id in parents.items()
+                    if parent_id is None), key=orders.get)
+    for root_id in roots:
+        # Walk the chain depth-first, so everything comes after its parent
+        # and before its siblings
+        chain_position = 0
+        stack = [root_id]
+        while stack:
+            species_id = stack.pop()
+            parent_id = parents[species_id]
+            own_children = sorted(children[species_id], key=orders.get)
+            topology[species_id] = SpeciesTopology(
+                stage=_stage(species_id, parents, babies),
+                position=_position(parent_id is not None,
+                                   bool(own_children)),
+                branching=len(own_children) > 1,
+                branched=parent_id is not None and
+                    len(children[parent_id]) > 1,
+                root_id=root_id,
+                chain_position=chain_position,
+            )
+            chain_position += 1
+            stack.extend(reversed(own_children))
+
+    return topology
+
+def evolution_table(species):
+    """Returns the evolution table for `species`'s chain, as described in
+    `_chain_rows`, except with nodes as dictionaries with 'species' and
+    'span' keys.
+    """
+    layout = chain_layouts()[species.evolution_chain_id]
+
+    # Prefetch the evolution details, but only the ones this chain uses
+    options = [
+        subqueryload('evolutions'),
+        joinedload('evolutions.trigger'),
+        joinedload('default_form'),
+    ]
+    options.extend(joinedload('evolutions.' + relationship)
+                   for relationship in sorted(layout.relationships))
+    family = db.pokedex_session.query(t.PokemonSpecies) \
+        .filter(t.PokemonSpecies.evolution_chain_id ==
+                species.evolution_chain_id) \
+        .options(*options)
+    family = dict((member.id, member) for member in family)
+
+    table = []
+    for row in layout.rows:
+        table_row = []
+        for cell in row:
+            if cell == '' or cell is None:
+                table_row.append(cell)
+            else:
+                species_id, span = cell
+                table_row.append({'species': family[species_id], 'span': span})
+        table.append(table_row)
+
+    return table
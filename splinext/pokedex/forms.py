@@ -3,9 +3,11 @@
 
 import re
 
+import numpy
 from sqlalchemy.sql import and_, or_
 from wtforms import ValidationError, fields, widgets
-from wtforms.ext.sqlalchemy.fields import QuerySelectMultipleField
+from wtforms.ext.sqlalchemy.fields import (
+    QuerySelectField, QuerySelectMultipleField)
 
 try:
     from wtforms.fields.core import UnboundField
@@ -13,6 +15,7 @@ except ImportError:
     from wtforms.fields import UnboundField
 
 import splinext.pokedex.db as db
+import splinext.pokedex.precompute as precompute
 
 
 class FakeMultiDict(dict):
@@ -123,16 +126,107 @@ class MultiCheckboxField(fields.SelectMultipleField):
     option_widget = widgets.CheckboxInput()
 
 
-class QueryCheckboxSelectMultipleField(QuerySelectMultipleField):
+@precompute.index
+def _cached_choices():
+    """Choice lists for `CachedQueryMixin` fields, keyed by query factory and
+    language.
+    """
+    return {}
+
+class CachedQueryMixin(object):
+    """Mixin for the SQLAlchemy query fields.  Runs `query_factory` once per
+    data version and language, rather than every time a form is built, and
+    only keeps each choice's pk, id, and label.
+
+    Only rows that are actually selected get loaded, by id.
+    """
+
+    def _choices(self):
+        """Returns the model and a list of `(pk, id, label)`."""
+        key = (self.query_factory, db.pokedex_session.default_language_id)
+        cache = _cached_choices()
+        if key not in cache:
+            rows = list(self.query_factory())
+            model = type(rows[0]) if rows else None
+            cache[key] = model, [
+                (unicode(self.get_pk(row)), row.id, self.get_label(row))
+                for row in rows]
+        return cache[key]
+
+    def _load(self, ids):
+        """Returns the rows with the given ids, in the same order."""
+        model, choices = self._choices()
+        if not ids:
+            return []
+        rows = db.pokedex_session.query(model).filter(model.id.in_(ids))
+        rows = dict((row.id, row) for row in rows)
+        return [rows[id] for id in ids]
+
+
+class CachedQuerySelectField(CachedQueryMixin, QuerySelectField):
+    """A QuerySelectField whose choices are cached; see `CachedQueryMixin`."""
+
+    def _get_data(self):
+        if self._formdata is not None:
+            model, choices = self._choices()
+            for pk, id, label in choices:
+                if pk == self._formdata:
+                    self._set_data(self._load([id])[0])
+                    break
+        return self._data
+
+    data = property(_get_data, QuerySelectField._set_data)
+
+    def iter_choices(self):
+        if self.allow_blank:
+            yield (u'__None', self.blank_text, self.data is None)
+
+        selected_id = getattr(self.data, 'id', None)
+        for pk, id, label in self._choices()[1]:
+            yield (pk, label, id == selected_id)
+
+    def pre_validate(self, form):
+        data = self.data
+        if data is not None:
+            ids = [id for pk, id, label in self._choices()[1]]
+            if data.id not in ids:
+                raise ValidationError(self.gettext(u'Not a valid choice'))
+        elif self._formdata or not self.allow_blank:
+            raise ValidationError(self.gettext(u'Not a valid choice'))
+
+
+class QueryCheckboxSelectMultipleField(CachedQueryMixin,
+                                       QuerySelectMultipleField):
     """
     Works the same as a QuerySelectMultipleField, except using checkboxes
-    rather than a selectbox.
+    rather than a selectbox, and caching the choices; see
+    `CachedQueryMixin`.
 
     Iterating over the field yields the checkbox subfields.
     """
     widget = widgets.ListWidget(prefix_label=False)
     option_widget = widgets.CheckboxInput()
 
+    def _get_data(self):
+        formdata = self._formdata
+        if formdata is not None:
+            ids = [id for pk, id, label in self._choices()[1]
+                   if pk in formdata]
+            self._invalid_formdata = len(ids) < len(formdata)
+            self._set_data(self._load(ids))
+        return self._data
+
+    data = property(_get_data, QuerySelectMultipleField._set_data)
+
+    def iter_choices(self):
+        selected_ids = set(row.id for row in self.data)
+        for pk, id, label in self._choices()[1]:
+            yield (pk, label, id in selected_ids)
+
+    def pre_validate(self, form):
+        if self._invalid_formdata:
+            raise ValidationError(self.gettext(u'Not a valid choice'))
+
 
 class PokedexLookupField(fields.StringField):
     u"""Provides a lookup box for naming something in the Pokédex."""
@@ -304,6 +398,26 @@ class RangeQueryEvaluator(object):
 
         return or_(*clauses)
 
+    def mask(self, values):
+        """Same as calling this, but for a NumPy array instead of a column.
+        Returns a boolean array; NaNs never match.
+        """
+        mask = numpy.zeros(len(values), dtype=bool)
+        with numpy.errstate(invalid='ignore'):
+            for thing in self.partitions:
+                if isinstance(thing, tuple):
+                    a, b = thing
+                    if a is None:
+                        mask |= values <= b
+                    elif b is None:
+                        mask |= values >= a
+                    else:
+                        mask |= (values >= a) & (values <= b)
+                else:
+                    mask |= values == thing
+
+        return mask
+
 class RangeTextField(fields.StringField):
     """Parses a string of the form 'a, b, c-e'.
 
@@ -0,0 +1,255 @@
+# encoding: utf8
+u"""Working out a Pokémon's genes (IVs) from its stats.
+
+Every stat is calculated for all 32 possible genes at every data point at
+once, as NumPy arrays, and the genes that fit every data point are kept.
+Possible genes for a stat are passed around as a bitmask, with bit n set if
+gene n is possible, so that Hidden Power and characteristics can narrow them
+down with a single `&`.
+"""
+from __future__ import absolute_import, division
+
+from collections import namedtuple
+
+import numpy
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+GENES = numpy.arange(32)
+MAX_LEVEL = 100
+
+def calculated_stats(base_stats, levels, genes, efforts, natures, is_hp):
+    """Vectorized `pokedex.formulae.calculated_stat` and `calculated_hp`.
+
+    All the arguments are arrays that broadcast together; `is_hp` picks the
+    HP formula, and `natures` are multipliers, which HP ignores.
+    """
+    raw = (base_stats * 2 + genes + efforts // 4) * levels // 100
+    stat = numpy.floor((raw + 5) * natures).astype(int)
+    # Shedinja always has 1 HP
+    hp = numpy.where(base_stats == 1, 1, raw + 10 + levels)
+    return numpy.where(is_hp, hp, stat)
+
+
+### Bitmasks
+
+def to_bits(mask):
+    """Turns a boolean array with 32 genes along the last axis into bitmasks.
+    """
+    return (numpy.asarray(mask, dtype=numpy.int64) << GENES).sum(axis=-1)
+
+def to_genes(bits):
+    """Returns the list of genes set in `bits`."""
+    return [gene for gene in GENES.tolist() if bits >> gene & 1]
+
+ALL_GENES = int(to_bits(numpy.ones(32, dtype=bool)))
+_PARITY_BITS = [int(to_bits(GENES % 2 == n)) for n in range(2)]
+_MOD_5_BITS = [int(to_bits(GENES % 5 == n)) for n in range(5)]
+
+def _at_most(gene):
+    if gene < 0:
+        return 0
+    return ALL_GENES & ((2 << gene) - 1)
+
+def _at_least(gene):
+    return ALL_GENES & ~((1 << gene) - 1)
+
+def _lowest(bits):
+    return (bits & -bits).bit_length() - 1
+
+def _highest(bits):
+    return bits.bit_length() - 1
+
+
+### Solving
+
+Solution = namedtuple('Solution', ['genes', 'ranges', 'next_useful_level'])
+
+def solve(base_stats, natures, is_hp, levels, stats, efforts):
+    """Works out which genes fit a set of data points.
+
+    `base_stats`, `natures` and `is_hp` have one entry per stat.  `levels`
+    has one per data point, and `stats` and `efforts` are data points by
+    stats.  A base stat of zero means it's unknown, so any gene will do.
+
+    Returns a `Solution`.  `genes` is the bitmask of possible genes for each
+    stat.  `ranges` is an array of the lowest and highest possible value of
+    each stat, by data point.  `next_useful_level` is the lowest level, from
+    the last data point up, at which any stat would differ between its
+    lowest and highest possible gene, given the effort at the highest level.
+    """
+    base_stats = numpy.asarray(base_stats, dtype=int)
+    natures = numpy.asarray(natures, dtype=float)
+    is_hp = numpy.asarray(is_hp, dtype=bool)
+    levels = numpy.asarray(levels, dtype=int)
+    stats = numpy.asarray(stats, dtype=int)
+    efforts = numpy.asarray(efforts, dtype=int)
+
+    # Data points × stats × genes
+    calculated = calculated_stats(
+        base_stats[None, :, None], levels[:, None, None], GENES,
+        efforts[:, :, None], natures[None, :, None], is_hp[None, :, None])
+    ranges = calculated[:, :, [0, -1]]
+
+    known = base_stats != 0
+    matches = (calculated == stats[:, :, None]).all(axis=0)
+    matches[~known] = True
+
+    # Stats that have possible genes left could still be narrowed down by
+    # levelling up.  Only ever look at the effort from the highest level;
+    # nb, that's the last data point if several share it
+    useful = known & matches.any(axis=1)
+    lowest = matches.argmax(axis=1)
+    highest = 31 - matches[:, ::-1].argmax(axis=1)
+    top = len(levels) - 1 - levels[::-1].argmax()
+
+    # Levels × stats
+    future_levels = numpy.arange(levels[-1], MAX_LEVEL + 1)[:, None]
+    differs = calculated_stats(base_stats, future_levels, lowest,
+                               efforts[top], natures, is_hp) \
+           != calculated_stats(base_stats, future_levels, highest,
+                               efforts[top], natures, is_hp)
+    differs = (differs & useful).any(axis=1)
+    if differs.any():
+        next_useful_level = int(future_levels[differs.argmax(), 0])
+    else:
+        next_useful_level = MAX_LEVEL
+
+    return Solution(
+        genes=[int(bits) for bits in to_bits(matches)],
+        ranges=ranges,
+        next_useful_level=next_useful_level,
+    )
+
+
+### Constraints
+
+def hidden_power_bits(type_index):
+    """Returns a bitmask of possible genes for each stat, in Hidden Power
+    order, for Hidden Power to have the `type_index`th type (Fighting is 0).
+    """
+    # Hidden Power's type is x * 15 // 63, where bit n of x is the lowest
+    # bit of the nth stat's gene.  hp_type * 63 / 15 is the LOWER bound for
+    # x, though you need to ceil() it to find the lower integral bound.
+    # The same thing for (hp_type + 1) is the lower bound for the next type,
+    # which is one more than our upper bound.
+    min_x = -(-type_index * 63 // 15)
+    max_x = -(-(type_index + 1) * 63 // 15) - 1
+
+    # If min_x and max_x have the same leftmost n bits, so will every integer
+    # between them, and those stats are definitely odd or definitely even
+    bits = [ALL_GENES] * 6
+    for n in range(6):
+        mask = 63 ^ ((1 << n) - 1)
+        if min_x & mask == max_x & mask:
+            for stat_index in range(n, 6):
+                bits[stat_index] = _PARITY_BITS[(min_x >> stat_index) & 1]
+            break
+
+    return bits
+
+def apply_characteristic(genes, stat_index, gene_mod_5):
+    """Narrows down a list of bitmasks, given a characteristic saying that
+    the stat at `stat_index` has the highest gene, which is `gene_mod_5`
+    mod 5.
+    """
+    genes = [int(bits) for bits in genes]
+    genes[stat_index] &= _MOD_5_BITS[gene_mod_5]
+
+    # No other stat can be higher than the hinted stat can be...
+    max_gene = _highest(genes[stat_index])
+    genes = [bits & _at_most(max_gene) for bits in genes]
+
+    # ...and the hinted stat can't be lower than any other can be
+    if all(genes):
+        min_gene = max(_lowest(bits) for bits in genes)
+        genes[stat_index] &= _at_least(min_gene)
+    else:
+        genes[stat_index] = 0
+
+    return genes
+
+def constrain(genes, hidden_power_order, hidden_power_type=None,
+              characteristic=None):
+    """Narrows down a list of bitmasks with what's known about Hidden Power
+    and the characteristic.
+
+    `hidden_power_order` lists the indices of the stats in Hidden Power
+    order.  `hidden_power_type` is a type index, as for `hidden_power_bits`,
+    and `characteristic` is a `(stat_index, gene_mod_5)` pair.
+    """
+    genes = list(genes)
+
+    if hidden_power_type is not None:
+        for stat_index, bits in zip(hidden_power_order,
+                                    hidden_power_bits(hidden_power_type)):
+            genes[stat_index] &= bits
+
+    # Characteristic; needs to be last since it imposes a maximum
+    if characteristic is not None:
+        genes = apply_characteristic(genes, *characteristic)
+
+    return genes
+
+def hidden_power(genes):
+    """Returns Hidden Power's type index (Fighting is 0) and power, given an
+    exact gene for each stat, in Hidden Power order.
+    """
+    # HP uses bit 0 of each gene for the type, and bit 1 for the power.
+    # These bits are used to make new six-bit numbers, where HP goes to bit
+    # 0, Attack to bit 1, etc.
+    type_det = 0
+    power_det = 0
+    for i, gene in enumerate(genes):
+        type_det += (gene & 0x01) << i
+        power_det += (gene & 0x02) >> 1 << i
+
+    return type_det * 15 // 63, power_det * 40 // 63 + 30
+
+
+### Base stats
+
+BaseStatTable = namedtuple('BaseStatTable',
+    ['stats', 'hidden_power_order', 'pokemon_index', 'base_stats'])
+
+@precompute.index
+def base_stat_table():
+    """Returns a `BaseStatTable`.
+
+    `stats` are the identifiers of the stats a Pokémon has outside battle,
+    in id order, and `hidden_power_order` gives their indices in Hidden
+    Power order.  `base_stats` has a row of base stats for every Pokémon,
+    with zero for any it's missing, and `pokemon_index` maps Pokémon
+    identifiers to rows.
+    """
+    stats = db.pokedex_session.query(t.Stat) \
+        .filter(t.Stat.is_battle_only == False) \
+        .order_by(t.Stat.id) \
+        .all()
+    stat_index = dict((stat.id, i) for i, stat in enumerate(stats))
+    hidden_power_order = sorted(range(len(stats)),
+                                key=lambda i: stats[i].game_index)
+
+    pokemon = db.pokedex_session.query(t.Pokemon.id, t.Pokemon.identifier) \
+        .order_by(t.Pokemon.id) \
+        .all()
+    row_index = dict((pokemon_id, i)
+                     for i, (pokemon_id, _) in enumerate(pokemon))
+
+    base_stats = numpy.zeros((len(pokemon), len(stats)), dtype=int)
+    for pokemon_id, stat_id, base_stat in db.pokedex_session.query(
+            t.PokemonStat.pokemon_id,
+            t.PokemonStat.stat_id,
+            t.PokemonStat.base_stat):
+        if stat_id in stat_index:
+            base_stats[row_index[pokemon_id], stat_index[stat_id]] = base_stat
+
+    return BaseStatTable(
+        stats=[stat.identifier for stat in stats],
+        hidden_power_order=hidden_power_order,
+        pokemon_index=dict((identifier, row_index[pokemon_id])
+                           for pokemon_id, identifier in pokemon),
+        base_stats=base_stats,
+    )
@@ -0,0 +1,133 @@
+# encoding: utf8
+"""Wild held items, grouped ahead of time.
+
+Held items are stored separately per version due to *rizer shenanigans
+(grumble).  Items also sometimes change over version groups within a
+generation.  So in some 99.9% of cases we want to merge them to some extent,
+usually collapsing an entire version group or an entire generation.  Thus
+pages get them as:
+
+    generation => { (version, ...) => ( (item, rarity), ... ) }
+
+The grouping only depends on ids, so it's done for every Pokémon at once and
+kept in `precompute.store` as:
+
+    [ [generation_id, [ [version_ids, [ [item_id, rarity], ... ]], ... ]], ... ]
+"""
+from __future__ import absolute_import
+
+from collections import defaultdict
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+# Held items weren't a thing before gen 3
+FIRST_GENERATION_ID = 3
+
+def _generation_versions():
+    """Returns a list of `(generation_id, [version_ids])`, in id order."""
+    generation_versions = defaultdict(list)
+    q = db.pokedex_session.query(t.Version.id, t.VersionGroup.generation_id) \
+        .join(t.Version.version_group) \
+        .order_by(t.Version.id)
+    for version_id, generation_id in q:
+        generation_versions[generation_id].append(version_id)
+    return sorted(generation_versions.items())
+
+def _group_held_items(first_generation_id, pokemon_items,
+                      generation_versions):
+    """Groups one Pokémon's held items.
+
+    `pokemon_items` is a list of `(version_id, item_id, rarity)`.
+    """
+    version_items = defaultdict(list)
+    for version_id, item_id, rarity in pokemon_items:
+        version_items[version_id].append((item_id, rarity))
+
+    grouped = []
+    for generation_id, version_ids in generation_versions:
+        # Versions with no items count too, so we know which ones are empty
+        if generation_id < max(FIRST_GENERATION_ID, first_generation_id):
+            continue
+
+        # Group by item list, in version order...
+        inverted = defaultdict(list)
+        for version_id in version_ids:
+            inverted[tuple(version_items[version_id])].append(version_id)
+
+        # ... then flip back to versions as keys
+        grouped.append([generation_id, sorted(
+            [grouped_version_ids, [list(item) for item in items]]
+            for items, grouped_version_ids in inverted.items()
+        )])
+
+    return grouped
+
+def _pokemon_items_query():
+    return db.pokedex_session.query(
+            t.PokemonItem.pokemon_id,
+            t.PokemonItem.version_id,
+            t.PokemonItem.item_id,
+            t.PokemonItem.rarity,
+        ) \
+        .order_by(t.PokemonItem.pokemon_id, t.PokemonItem.version_id,
+                  t.PokemonItem.item_id)
+
+def _first_generation_query():
+    return db.pokedex_session.query(
+            t.Pokemon.id, t.PokemonSpecies.generation_id) \
+        .join(t.Pokemon.species)
+
+def build_held_items(pokemon_id):
+    _, first_generation_id = _first_generation_query() \
+        .filter(t.Pokemon.id == pokemon_id).one()
+    pokemon_items = [row[1:] for row in _pokemon_items_query()
+                     .filter(t.PokemonItem.pokemon_id == pokemon_id)]
+    return _group_held_items(first_generation_id, pokemon_items,
+                             _generation_versions())
+
+@precompute.producer
+def precompute_held_items():
+    """Yields store entries for every Pokémon's held items, for
+    `bin/precompute-tables.py`.
+    """
+    generation_versions = _generation_versions()
+
+    pokemon_items = defaultdict(list)
+    for row in _pokemon_items_query():
+        pokemon_items[row[0]].append(row[1:])
+
+    for pokemon_id, first_generation_id in _first_generation_query():
+        yield 'pokemon-held-items', pokemon_id, _group_held_items(
+            first_generation_id, pokemon_items[pokemon_id],
+            generation_versions)
+
+def held_items(pokemon):
+    """Returns the held items for a Pokémon, as described above."""
+    grouped = precompute.store.get_or_build('pokemon-held-items', pokemon.id,
+        lambda: build_held_items(pokemon.id))
+
+    session = db.pokedex_session
+    generations = dict((generation.id, generation)
+                       for generation in session.query(t.Generation))
+    versions = dict((version.id, version)
+                    for version in session.query(t.Version))
+    item_ids = set(item_id for generation_id, groups in grouped
+                           for version_ids, items in groups
+                           for item_id, rarity in items)
+    items = {}
+    if item_ids:
+        items = dict((item.id, item) for item in session.query(t.Item)
+                     .filter(t.Item.id.in_(item_ids)))
+
+    result = {}
+    for generation_id, groups in grouped:
+        generation_items = result[generations[generation_id]] = {}
+        for version_ids, item_rarities in groups:
+            version_tuple = tuple(versions[id] for id in version_ids)
+            generation_items[version_tuple] = tuple(
+                (items[item_id], rarity) for item_id, rarity in item_rarities)
+
+    return result
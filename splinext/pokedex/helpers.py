@@ -326,20 +326,77 @@ def scale_sizes(size_dict, dimensions=1):
 def _no_icon(pokemon):
     return u""
 
-def apply_pokemon_template(template, pokemon, get_icon=_no_icon, _=_):
-    u"""`template` should be a string.Template object.
-
-    Uses safe_substitute to inject some fields from the Pokémon into the
-    template.
-
-    This cheerfully returns a literal, so be sure to escape the original format
-    string BEFORE passing it to Template!
+def template_fields(template):
+    u"""Returns the set of field names that a string.Template substitutes."""
+    fields = set()
+    for match in template.pattern.finditer(template.template):
+        field = match.group('named') or match.group('braced')
+        if field:
+            fields.add(field)
+    return fields
+
+class CompiledTemplate(object):
+    u"""A string.Template, along with just the fields it needs.
+
+    `field_groups` is a list of `(fields, relations, fill)`.  For each group
+    with any field in the template, `fill(d, thing, ...)` is called to put
+    those fields in the substitution dict `d`, and `relations` are what
+    should be loaded onto every thing beforehand.  Fields that no group claims
+    go to the `fallback` group instead, if there is one.
+
+    Calling this with a thing returns the filled-in template, as a literal,
+    so be sure to escape the original format string BEFORE passing it to
+    Template!
     """
 
-    d = dict(
-        icon=get_icon(pokemon),
+    def __init__(self, template, field_groups, fallback=None):
+        self.template = template
+        self.fills = []
+        self.relations = []
+
+        fields = template_fields(template)
+        unclaimed = set(fields)
+        for group_fields, relations, fill in field_groups:
+            unclaimed.difference_update(group_fields)
+            if fields.intersection(group_fields):
+                self._use(relations, fill)
+
+        if fallback and unclaimed:
+            relations, fill = fallback
+            self._use(relations, fill)
+
+    def _use(self, relations, fill):
+        if fill in self.fills:
+            return
+        self.fills.append(fill)
+        for relation in relations:
+            if relation not in self.relations:
+                self.relations.append(relation)
+
+    def __call__(self, thing, *args):
+        d = {}
+        for fill in self.fills:
+            fill(d, thing, *args)
+        return h.literal(self.template.safe_substitute(d))
+
+
+def _names(things):
+    return u'/'.join(thing.name for thing in things)
+
+def _nth_name(things, n):
+    if len(things) > n:
+        return things[n].name
+    return u''
+
+def _pokemon_icon(d, pokemon, get_icon, _):
+    d['icon'] = get_icon(pokemon)
+
+def _pokemon_name(d, pokemon, get_icon, _):
+    d['name'] = pokemon.default_form.name
+
+def _pokemon_basics(d, pokemon, get_icon, _):
+    d.update(
         id=pokemon.species.id,
-        name=pokemon.default_form.name,
 
         height=format_height_imperial(pokemon.height),
         height_ft=format_height_imperial(pokemon.height),
@@ -353,94 +410,142 @@ def apply_pokemon_template(template, pokemon, get_icon=_no_icon, _=_):
         base_experience=pokemon.base_experience,
         capture_rate=pokemon.species.capture_rate,
         base_happiness=pokemon.species.base_happiness,
+        hatch_counter=pokemon.species.hatch_counter,
+        steps_to_hatch=(pokemon.species.hatch_counter + 1) * 255,
     )
 
-    # "Lazy" loading, to avoid hitting other tables if unnecessary.  This is
-    # very chumpy and doesn't distinguish between literal text and fields (e.g.
-    # '$type' vs 'type'), but that's very unlikely to happen, and it's not a
-    # big deal if it does
-    if 'type' in template.template:
-        types = pokemon.types
-        d['type'] = u'/'.join(type_.name for type_ in types)
-        d['type1'] = types[0].name
-        d['type2'] = types[1].name if len(types) > 1 else u''
-
-    if 'egg_group' in template.template:
-        egg_groups = pokemon.species.egg_groups
-        d['egg_group'] = u'/'.join(group.name for group in egg_groups)
-        d['egg_group1'] = egg_groups[0].name
-        d['egg_group2'] = egg_groups[1].name if len(egg_groups) > 1 else u''
-
-    if 'ability' in template.template:
-        abilities = pokemon.abilities
-        d['ability'] = u'/'.join(ability.name for ability in abilities)
-        d['ability1'] = abilities[0].name
-        d['ability2'] = abilities[1].name if len(abilities) > 1 else u''
-        if pokemon.hidden_ability:
-            d['hidden_ability'] = pokemon.hidden_ability.name
-        else:
-            d['hidden_ability'] = u''
-
-    if 'color' in template.template:
-        d['color'] = pokemon.species.color.name
-
-    if 'habitat' in template.template:
-        if pokemon.species.habitat:
-            d['habitat'] = pokemon.species.habitat.name
-        else:
-            d['habitat'] = ''
-
-    if 'shape' in template.template:
-        if pokemon.species.shape:
-            d['shape'] = pokemon.species.shape.name
-        else:
-            d['shape'] = ''
-
-    if 'hatch_counter' in template.template:
-        d['hatch_counter'] = pokemon.species.hatch_counter
-
-    if 'steps_to_hatch' in template.template:
-        d['steps_to_hatch'] = (pokemon.species.hatch_counter + 1) * 255
-
-    if 'stat' in template.template or \
-       'hp' in template.template or \
-       'attack' in template.template or \
-       'defense' in template.template or \
-       'speed' in template.template or \
-       'effort' in template.template:
-        d['effort'] = u', '.join("{0} {1}".format(_.effort, _.stat.name)
-                                 for _ in pokemon.stats if _.effort)
-
-        d['stats'] = u'/'.join(str(_.base_stat) for _ in pokemon.stats)
-
-        for pokemon_stat in pokemon.stats:
-            key = pokemon_stat.stat.name.lower().replace(' ', '_')
-            d[key] = pokemon_stat.base_stat
+def _pokemon_types(d, pokemon, get_icon, _):
+    types = pokemon.types
+    d['type'] = _names(types)
+    d['type1'] = types[0].name
+    d['type2'] = _nth_name(types, 1)
+
+def _pokemon_egg_groups(d, pokemon, get_icon, _):
+    egg_groups = pokemon.species.egg_groups
+    d['egg_group'] = _names(egg_groups)
+    d['egg_group1'] = egg_groups[0].name
+    d['egg_group2'] = _nth_name(egg_groups, 1)
+
+def _pokemon_abilities(d, pokemon, get_icon, _):
+    abilities = pokemon.abilities
+    d['ability'] = _names(abilities)
+    d['ability1'] = abilities[0].name
+    d['ability2'] = _nth_name(abilities, 1)
+
+def _pokemon_hidden_ability(d, pokemon, get_icon, _):
+    if pokemon.hidden_ability:
+        d['hidden_ability'] = pokemon.hidden_ability.name
+    else:
+        d['hidden_ability'] = u''
+
+def _species_name(attr):
+    def fill(d, pokemon, get_icon, _):
+        thing = getattr(pokemon.species, attr)
+        d[attr] = thing.name if thing else ''
+    return fill
+
+def _pokemon_stats(d, pokemon, get_icon, _):
+    d['effort'] = u', '.join("{0} {1}".format(_.effort, _.stat.name)
+                             for _ in pokemon.stats if _.effort)
+
+    d['stats'] = u'/'.join(str(_.base_stat) for _ in pokemon.stats)
+
+    # Each stat is also a field by itself, named after the stat
+    for pokemon_stat in pokemon.stats:
+        key = pokemon_stat.stat.name.lower().replace(' ', '_')
+        d[key] = pokemon_stat.base_stat
+
+# Relations are as for `hydration.load_pokemon`
+_pokemon_field_groups = [
+    (['icon'], ['default_form'], _pokemon_icon),
+    (['name'], ['default_form'], _pokemon_name),
+    (['id', 'height', 'height_ft', 'height_m',
+      'weight', 'weight_lb', 'weight_kg',
+      'gender', 'genus', 'base_experience', 'capture_rate',
+      'base_happiness', 'hatch_counter', 'steps_to_hatch'],
+     [], _pokemon_basics),
+    (['type', 'type1', 'type2'], ['types'], _pokemon_types),
+    (['egg_group', 'egg_group1', 'egg_group2'],
+     ['species.egg_groups'], _pokemon_egg_groups),
+    (['ability', 'ability1', 'ability2'], ['abilities'], _pokemon_abilities),
+    (['hidden_ability'], ['hidden_ability'], _pokemon_hidden_ability),
+    (['color'], ['species.color'], _species_name('color')),
+    (['habitat'], ['species.habitat'], _species_name('habitat')),
+    (['shape'], ['species.shape'], _species_name('shape')),
+    (['effort', 'stats'], ['stats.stat'], _pokemon_stats),
+]
+
+def compile_pokemon_template(template):
+    u"""Returns a `CompiledTemplate` that fills `template`, a string.Template,
+    with fields from a Pokémon.
+
+    Anything that isn't a known field might be a stat, like $hp or
+    $special_attack.
+    """
+    return CompiledTemplate(template, _pokemon_field_groups,
+                            fallback=(['stats.stat'], _pokemon_stats))
 
-    return h.literal(template.safe_substitute(d))
+def apply_pokemon_template(template, pokemon, get_icon=_no_icon, _=_):
+    u"""`template` should be a string.Template object, or better yet, one
+    already compiled by `compile_pokemon_template`.
 
-def apply_move_template(template, move):
-    u"""`template` should be a string.Template object.
+    Uses safe_substitute to inject some fields from the Pokémon into the
+    template.
 
-    Uses safe_substitute to inject some fields from the move into the template,
-    just like the above.
+    This cheerfully returns a literal, so be sure to escape the original format
+    string BEFORE passing it to Template!
     """
+    if not isinstance(template, CompiledTemplate):
+        template = compile_pokemon_template(template)
+    return template(pokemon, get_icon, _)
 
-    d = dict(
+
+def _move_basics(d, move):
+    d.update(
         id=move.id,
         name=move.name,
-        type=move.type.name,
-        damage_class=move.damage_class.name,
         pp=move.pp,
         power=move.power,
         accuracy=move.accuracy,
 
         priority=move.priority,
         effect_chance=move.effect_chance,
-        effect=move.move_effect.short_effect,
     )
 
-    return h.literal(template.safe_substitute(d))
+def _move_type(d, move):
+    d['type'] = move.type.name
+
+def _move_damage_class(d, move):
+    d['damage_class'] = move.damage_class.name
+
+def _move_effect(d, move):
+    d['effect'] = move.move_effect.short_effect
+
+# Relations are paths for joinedload
+_move_field_groups = [
+    (['id', 'name', 'pp', 'power', 'accuracy', 'priority', 'effect_chance'],
+     [], _move_basics),
+    (['type'], ['type'], _move_type),
+    (['damage_class'], ['damage_class'], _move_damage_class),
+    (['effect'], ['move_effect', 'move_effect.prose_local'], _move_effect),
+]
+
+def compile_move_template(template):
+    u"""Returns a `CompiledTemplate` that fills `template`, a string.Template,
+    with fields from a move.
+    """
+    return CompiledTemplate(template, _move_field_groups)
+
+def apply_move_template(template, move):
+    u"""`template` should be a string.Template object, or one compiled by
+    `compile_move_template`.
+
+    Uses safe_substitute to inject some fields from the move into the template,
+    just like the above.
+    """
+    if not isinstance(template, CompiledTemplate):
+        template = compile_move_template(template)
+    return template(move)
 
 
 class DownloadSizer(object):
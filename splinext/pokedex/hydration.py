@@ -0,0 +1,171 @@
+# encoding: utf8
+"""Batched loading of relations onto objects that have already been fetched.
+
+Eagerloading a has-many with a join repeats the parent row once per child,
+and doing several at once multiplies them together.  Instead, each relation
+here is fetched with its own `IN (...)` queries, a bounded number of ids at a
+time, and the results are attached to the parents directly, as though
+SQLAlchemy had loaded them itself.  Nothing is reloaded if it's already
+there.  Related rows are loaded in the same session as their parents.
+"""
+from __future__ import absolute_import
+
+from collections import defaultdict
+
+import pokedex.db.tables as t
+from sqlalchemy import inspect
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import db
+
+# Most databases get unhappy somewhere past a few thousand bind parameters
+CHUNK_SIZE = 500
+
+def chunks(sequence, size=CHUNK_SIZE):
+    """Yields successive lists of at most `size` things from `sequence`."""
+    sequence = list(sequence)
+    for start in xrange(0, len(sequence), size):
+        yield sequence[start:start + size]
+
+def attach(objects, key, fetch, uselist=True, owner_key=lambda obj: obj.id):
+    """Loads the relation `key` for each of `objects` that hasn't got it yet.
+
+    `fetch` is called with the objects' session and chunks of owner ids, as
+    given by `owner_key`, and should return `(owner_id, related)` pairs, in
+    the order the relation is meant to be sorted in.  Owners with nothing get
+    an empty list, or None if `uselist` is false.
+    """
+    objects = [obj for obj in objects if key in inspect(obj).unloaded]
+    if not objects:
+        return
+    session = object_session(objects[0]) or db.pokedex_session
+    owner_ids = set(owner_key(obj) for obj in objects)
+    owner_ids.discard(None)
+
+    related = defaultdict(list)
+    for chunk in chunks(sorted(owner_ids)):
+        for owner_id, thing in fetch(session, chunk):
+            related[owner_id].append(thing)
+
+    for obj in objects:
+        things = related.get(owner_key(obj), [])
+        if uselist:
+            set_committed_value(obj, key, things)
+        else:
+            set_committed_value(obj, key, things[0] if things else None)
+
+def load_in_order(table, ids, *options, **kwargs):
+    """Fetches the rows of `table` with the given ids, in the same order.
+
+    Rows are loaded with the `session` keyword argument, if given, or else
+    the usual session.
+    """
+    session = kwargs.pop('session', None) or db.pokedex_session
+    rows = {}
+    for chunk in chunks(ids):
+        for row in session.query(table) \
+                .filter(table.id.in_(chunk)) \
+                .options(*options):
+            rows[row.id] = row
+    return [rows[id] for id in ids]
+
+
+### Pokémon relations
+
+def _default_forms(session, ids):
+    return ((form.pokemon_id, form) for form in
+        session.query(t.PokemonForm)
+        .filter(t.PokemonForm.pokemon_id.in_(ids))
+        .filter(t.PokemonForm.is_default == True))
+
+def _types(session, ids):
+    return session.query(t.PokemonType.pokemon_id, t.Type) \
+        .filter(t.Type.id == t.PokemonType.type_id) \
+        .filter(t.PokemonType.pokemon_id.in_(ids)) \
+        .order_by(t.PokemonType.pokemon_id, t.PokemonType.slot)
+
+def _abilities(is_hidden):
+    def fetch(session, ids):
+        return session.query(t.PokemonAbility.pokemon_id, t.Ability) \
+            .filter(t.Ability.id == t.PokemonAbility.ability_id) \
+            .filter(t.PokemonAbility.pokemon_id.in_(ids)) \
+            .filter(t.PokemonAbility.is_hidden == is_hidden) \
+            .order_by(t.PokemonAbility.pokemon_id, t.PokemonAbility.slot)
+    return fetch
+
+def _stats(session, ids):
+    return ((stat.pokemon_id, stat) for stat in
+        session.query(t.PokemonStat)
+        .filter(t.PokemonStat.pokemon_id.in_(ids))
+        .order_by(t.PokemonStat.pokemon_id, t.PokemonStat.stat_id))
+
+def _stat_kinds(session, ids):
+    return ((stat.id, stat) for stat in
+        session.query(t.Stat).filter(t.Stat.id.in_(ids)))
+
+def _egg_groups(session, ids):
+    return session.query(t.PokemonEggGroup.species_id, t.EggGroup) \
+        .filter(t.EggGroup.id == t.PokemonEggGroup.egg_group_id) \
+        .filter(t.PokemonEggGroup.species_id.in_(ids)) \
+        .order_by(t.PokemonEggGroup.species_id, t.EggGroup.id)
+
+def _species(session, ids):
+    return ((species.id, species) for species in
+        session.query(t.PokemonSpecies)
+        .filter(t.PokemonSpecies.id.in_(ids)))
+
+def _by_id(table):
+    def fetch(session, ids):
+        return ((row.id, row) for row in
+            session.query(table).filter(table.id.in_(ids)))
+    return fetch
+
+def load_pokemon(pokemon, relations):
+    """Loads each of `relations` onto a list of Pokémon.  Their species are
+    loaded first if 'species' is one of them; otherwise, they should be
+    loaded already.
+
+    The relations are named as for `joinedload_all`; only the ones that
+    `pokemon_search`, the custom list templates and the comparison gadget
+    need are supported.
+    """
+    if 'species' in relations:
+        attach(pokemon, 'species', _species, uselist=False,
+               owner_key=lambda p: p.species_id)
+    species = list(set(p.species for p in pokemon))
+
+    for relation in relations:
+        if relation == 'species':
+            # Already done
+            pass
+        elif relation == 'default_form':
+            attach(pokemon, 'default_form', _default_forms, uselist=False)
+        elif relation == 'types':
+            attach(pokemon, 'types', _types)
+        elif relation == 'abilities':
+            attach(pokemon, 'abilities', _abilities(False))
+        elif relation == 'hidden_ability':
+            attach(pokemon, 'hidden_ability', _abilities(True),
+                   uselist=False)
+        elif relation == 'stats.stat':
+            attach(pokemon, 'stats', _stats)
+            stats = set(stat for p in pokemon for stat in p.stats)
+            attach(stats, 'stat', _stat_kinds, uselist=False,
+                   owner_key=lambda stat: stat.stat_id)
+        elif relation == 'species.egg_groups':
+            attach(species, 'egg_groups', _egg_groups)
+        elif relation == 'species.color':
+            attach(species, 'color', _by_id(t.PokemonColor), uselist=False,
+                   owner_key=lambda s: s.color_id)
+        elif relation == 'species.habitat':
+            attach(species, 'habitat', _by_id(t.PokemonHabitat),
+                   uselist=False, owner_key=lambda s: s.habitat_id)
+        elif relation == 'species.shape':
+            attach(species, 'shape', _by_id(t.PokemonShape), uselist=False,
+                   owner_key=lambda s: s.shape_id)
+        elif relation == 'species.parent_species':
+            attach(species, 'parent_species', _species, uselist=False,
+                   owner_key=lambda s: s.evolves_from_species_id)
+        else:
+            raise ValueError("Don't know how to load {0!r}".format(relation))
@@ -5,7 +5,12 @@ trainer size comparison on Pokémon pages and the Pokémon search.
 
 import re
 
+import pokedex.db.tables as t
+
 from splinext.pokedex import db
+from splinext.pokedex import precompute
+
+PARSE_CACHE_SIZE = 1000
 
 si_prefixes = {
     'yotta': 1e24,      'yocto': 1e-24,
@@ -135,34 +140,145 @@ weight_abbrs = {
 }
 
 
-def parse_size(size, height_or_weight):
-    u"""Parses a string that looks remotely like a height or weight.
+def _unit_spellings(units):
+    u"""Returns a dict of every lowercase spelling of a unit that `parse_size`
+    accepts, to how many base units it's worth.
+    """
+    # Chump fix for plural names.  Some units end in 's', and should take
+    # precedence
+    spellings = dict((name + 's', value) for name, value in units.items())
+    spellings.update(units)
+    return spellings
+
+# Some slightly special munging for a few units
+height_spellings = _unit_spellings(height_units)
+height_spellings.update({
+    'feet':     height_units['foot'],
+    '\'':      height_units['foot'],
+    'inches':   height_units['inch'],
+    '"':        height_units['inch'],
+})
+weight_spellings = _unit_spellings(weight_units)
+
+# Everything a size can be made of, for each kind of size, worked out up
+# front: (unit spellings, abbreviations, size of a Pokémon unit)
+grammars = {
+    'height': (height_spellings, height_abbrs, 0.1),
+    'weight': (weight_spellings, weight_abbrs, 0.1),
+}
 
-    Pokémon names may be used in lieu of unit strings.  SI prefixes are allowed
-    on any unit.  Yes.  Any.
+# This monstrosity breaks on things that look like numbers, BUT assumes that
+# dots not preceded by a space go on the end of the unit, not the beginning
+# of the number
+number_re = re.compile(
+    ur'(?x) ( (?: (?: [0-9]+ | (?<=[\s.]) ) [,.] )? [0-9]+ )')
 
-    `size` is the string to parse.  `height_or_weight` should be either
-    'height' or 'weight'.
 
-    Returns a number of Pokémon units.  Height in decimeters; weight in
-    hectograms.
+@precompute.index
+def _pokemon_size_tables():
+    """Returns a dict of `pokemon_sizes` tables, by language."""
+    return {}
 
-    This function assumes the input is valid.  If it dies for any reason, the
-    input is bogus.
+def pokemon_sizes():
+    u"""Returns a dict of every default Pokémon's species name, lowercased and
+    in the current language, to a dict of its height and weight.
+
+    Names shared by more than one Pokémon are left out, since they don't say
+    which one is meant.
+    """
+    language_id = db.pokedex_session.default_language_id
+    tables = _pokemon_size_tables()
+    if language_id not in tables:
+        sizes = {}
+        shared = set()
+        q = db.pokedex_session.query(
+                t.PokemonSpecies.names_table.name,
+                t.Pokemon.height,
+                t.Pokemon.weight,
+            ) \
+            .select_from(t.Pokemon) \
+            .join(t.Pokemon.species) \
+            .join(t.PokemonSpecies.names_local) \
+            .filter(t.Pokemon.is_default == True)
+        for name, height, weight in q:
+            name = name.lower()
+            if name in sizes:
+                shared.add(name)
+            sizes[name] = dict(height=height, weight=weight)
+        for name in shared:
+            del sizes[name]
+
+        tables[language_id] = sizes
+    return tables[language_id]
+
+
+def _possible_units(unit_chunks, abbrs):
+    u"""Returns every way of reading a unit, as `(prefix, chunks)` tuples, in
+    order of preference.  `prefix` is a valid SI prefix or None.
+    """
+    # There are several possibilities here:
+    # - SI prefix might be part of the first chunk, the entire first chunk,
+    #   or absent
+    # - Unit name could be one or more chunks
+    # - Entire first chunk could be an abbreviation
+    # Run through each of these.  Remember, no-prefix and no-abbr win.
+
+    possible_units = []  # (prefix, chunks) tuples
+
+    # No prefix
+    possible_units.append(( None, unit_chunks ))
+
+    # Prefix in first chunk
+    possible_prefix = unit_chunks[0].lower()
+    if possible_prefix in si_prefixes:
+        possible_units.append(( possible_prefix, unit_chunks[1:] ))
+
+    # Prefix as part of first chunk
+    for prefix_length in (3, 4, 5):
+        possible_prefix = unit_chunks[0][0:prefix_length]
+        possible_prefix = possible_prefix.lower()
+
+        if possible_prefix in si_prefixes:
+            chunks_sans_prefix = [ unit_chunks[0][prefix_length:] ] \
+                               + unit_chunks[1:]
+            possible_units.append(( possible_prefix, chunks_sans_prefix ))
+
+    # Abbreviations don't get spaces; "k m" is meaningless.
+    # Also, abbreviations are the only place where case matters, and only
+    # for the prefix
+    if len(unit_chunks) == 1:
+        unit = unit_chunks[0]
+        if unit[-1] == '.':
+            unit = unit[0:-1]
+
+        for prefix_length in (0, 1, 2):
+            prefix, abbr = unit[0:prefix_length], unit[prefix_length:]
+            abbr = abbr.lower()
+
+            if (not prefix or prefix in si_abbrs) \
+                and abbr in abbrs:
+
+                possible_units.append((
+                    si_abbrs[prefix] if prefix else None,
+                    [ abbrs[abbr] ]
+                ))
+
+    return possible_units
+
+def _parse(size, height_or_weight):
+    u"""Breaks a size down into parts, without looking up any Pokémon.
+
+    Returns a list of `(amount, pokemon)` tuples.  `amount` is the part's
+    size in Pokémon units, if it's in a real unit.  Otherwise it's None, and
+    `pokemon` lists `(number, name)` for each way of reading the unit as a
+    Pokémon, in order of preference; `number` includes any SI prefix.
     """
 
     # XXX commas should be handled better, in these two cases:
     # - 1,000,000 miles
     # - 5 feet, 6 inches
 
-    if height_or_weight == 'height':
-        units = height_units
-        abbrs = height_abbrs
-        pokemon_unit = 0.1
-    elif height_or_weight == 'weight':
-        units = weight_units
-        abbrs = weight_abbrs
-        pokemon_unit = 0.1
+    spellings, abbrs, pokemon_unit = grammars[height_or_weight]
 
     # A size looks like:
     # [NUMBER] [SI PREFIX] [UNIT]
@@ -180,14 +296,8 @@ def parse_size(size, height_or_weight):
 
     # So!  First, break into what absolutely must be parts: a non-number
     # followed by a number must be a new part.
-    # This monstrosity breaks on things that look like numbers, BUT assumes
-    # that dots not preceded by a space go on the end of the unit, not the
-    # beginning of the number
     size = size.strip()
-    rough_parts = re.split(
-        ur'(?x) ( (?: (?: [0-9]+ | (?<=[\s.]) ) [,.] )? [0-9]+ )',
-        size
-    )
+    rough_parts = number_re.split(size)
 
     # The first element will be either an empty string or a lone unit name...
     if rough_parts[0]:
@@ -206,9 +316,8 @@ def parse_size(size, height_or_weight):
         elif rough_parts[-3] == '\'':
             rough_parts[-1] = 'inch'
 
-    # Okay, now clean this up a bit.  Break into tuples of (num, unit, unit,
-    # ...), remove whitespace everywhere, and turn the numbers into actual
-    # numbers
+    # Alright!  Go through the individual units and try to turn them into
+    # something intelligible
     parts = []
     while rough_parts:
         number = rough_parts.pop(0).strip()
@@ -220,68 +329,11 @@ def parse_size(size, height_or_weight):
         # Divide '   mega  metre  ' into ('mega', 'metre')
         unit_chunks = unit.split()
 
-        parts.append((number, unit_chunks))
-
-
-
-    # Alright!  Got a list of individual units.  Awesome.
-    # Now go through them and try to turn them into something intelligible.
-    # Use a while loop, because the list might be modified in-flight
-    result = 0.0
-    while parts:
-        done = False
-        number, unit_chunks = parts.pop(0)
-
         if len(unit_chunks) == 0:
             # What?
             raise ValueError
 
-        # There are several possibilities here:
-        # - SI prefix might be part of the first chunk, the entire first chunk,
-        #   or absent
-        # - Unit name could be one or more chunks
-        # - Entire first chunk could be an abbreviation
-        # Run through each of these.  Remember, no-prefix and no-abbr win.
-
-        possible_units = []  # (prefix, chunks) tuples
-
-        # No prefix
-        possible_units.append(( None, unit_chunks ))
-
-        # Prefix in first chunk
-        possible_prefix = unit_chunks[0].lower()
-        if possible_prefix in si_prefixes:
-            possible_units.append(( possible_prefix, unit_chunks[1:] ))
-
-        # Prefix as part of first chunk
-        for prefix_length in (3, 4, 5):
-            possible_prefix = unit_chunks[0][0:prefix_length]
-            possible_prefix = possible_prefix.lower()
-
-            if possible_prefix in si_prefixes:
-                chunks_sans_prefix = [ unit_chunks[0][prefix_length:] ] \
-                                   + unit_chunks[1:]
-                possible_units.append(( possible_prefix, chunks_sans_prefix ))
-
-        # Abbreviations don't get spaces; "k m" is meaningless.
-        # Also, abbreviations are the only place where case matters, and only
-        # for the prefix
-        if len(unit_chunks) == 1:
-            unit = unit_chunks[0]
-            if unit[-1] == '.':
-                unit = unit[0:-1]
-
-            for prefix_length in (0, 1, 2):
-                prefix, abbr = unit[0:prefix_length], unit[prefix_length:]
-                abbr = abbr.lower()
-
-                if (not prefix or prefix in si_abbrs) \
-                    and abbr in abbrs:
-
-                    possible_units.append((
-                        si_abbrs[prefix] if prefix else None,
-                        [ abbrs[abbr] ]
-                    ))
+        possible_units = _possible_units(unit_chunks, abbrs)
 
         # Prefix in possible_units is now guaranteed to be valid or None, so
         # part of the problem is solved.
@@ -290,52 +342,92 @@ def parse_size(size, height_or_weight):
             base_unit = u''.join(base_unit_chunks)  # unit names have no spaces
             base_unit = base_unit.lower()
 
-            # Some slightly special munging for a few units:
-            if base_unit in ('feet', '\''):
-                base_unit = 'foot'
-            elif base_unit in ('inches', '"'):
-                base_unit = 'inch'
+            if not base_unit:
+                # A lone prefix, like "1 kilo"
+                raise ValueError
 
-            # Chump fix for plural names.  Some units end in 's', and should
-            # take precedence
-            if base_unit not in units and base_unit[-1] == 's':
-                base_unit = base_unit[0:-1]
-
-            if base_unit in units:
+            if base_unit in spellings:
                 # Successful match!  Convert and we are DONE
-                result += number * units[base_unit] \
-                        * si_prefixes.get(prefix, 1.0) / pokemon_unit
-                done = True
+                parts.append((
+                    number * spellings[base_unit]
+                        * si_prefixes.get(prefix, 1.0) / pokemon_unit,
+                    None,
+                ))
                 break
+        else:
+            # Otherwise, each unit might be a Pokémon name.
+            # In violation of my own rule, this will try "meganium" as a
+            # mega-nium before a Pokémon.  But I'm not aware of any Pokémon
+            # that cause problems here
+            # TODO should this allow forms?
+            parts.append((None, [
+                (number * si_prefixes.get(prefix, 1.0),
+                 u' '.join(pokemon_name_chunks))
+                for prefix, pokemon_name_chunks in possible_units
+            ]))
 
-        if done:
-            continue
+    return parts
 
-        # Now try again, assuming each unit might be a Pokémon name.
-        # This is actually sort of an optimization; in violation of my own
-        # rule, it will try "meganium" as a mega-nium before a Pokémon.  But it
-        # avoids hitting the db for very common prefixed units, and I'm not
-        # aware of any Pokémon that cause problems here
-        for prefix, pokemon_name_chunks in possible_units:
-            pokemon_name = u' '.join(pokemon_name_chunks)
+_parse_cache = precompute.ResultCache(size=PARSE_CACHE_SIZE)
 
-            # TODO should this allow forms?
-            try:
-                pokemon = db.pokemon_query(pokemon_name).one()
+def _cached_parse(size, height_or_weight):
+    """Returns `_parse(size, height_or_weight)`, remembering the result for
+    recently seen strings, bogus or not.
+    """
+    def parse():
+        try:
+            return _parse(size, height_or_weight)
+        except (IndexError, ValueError) as e:
+            return e
 
-                # Success again!
-                result += number * getattr(pokemon, height_or_weight) \
-                        * si_prefixes.get(prefix, 1.0)
-                done = True
-                break
+    parts = _parse_cache.get_or_search((height_or_weight, size), parse)[0]
+    if isinstance(parts, Exception):
+        raise parts
+    return parts
+
+def parse_size(size, height_or_weight):
+    u"""Parses a string that looks remotely like a height or weight.
+
+    Pokémon names may be used in lieu of unit strings.  SI prefixes are allowed
+    on any unit.  Yes.  Any.
 
-            except:
-                # Failure; just try next one
-                pass
+    `size` is the string to parse.  `height_or_weight` should be either
+    'height' or 'weight'.
+
+    Returns a number of Pokémon units.  Height in decimeters; weight in
+    hectograms.
 
-        if done:
+    This function assumes the input is valid.  If it dies for any reason, the
+    input is bogus.
+    """
+    result = 0.0
+    for amount, pokemon in _cached_parse(size, height_or_weight):
+        if amount is not None:
+            result += amount
             continue
 
+        sizes = pokemon_sizes()
+        for number, pokemon_name in pokemon:
+            pokemon_name = pokemon_name.lower()
+            if pokemon_name in sizes:
+                # Success again!
+                result += number * sizes[pokemon_name][height_or_weight]
+                break
+
         # XXX fallback: assume 'inch meter' is two parts
 
     return result
+
+def parse_sizes(sizes, height_or_weight):
+    u"""Parses a list of sizes, as for `parse_size`.
+
+    Returns a list of the results in the same order, with None for anything
+    bogus.
+    """
+    results = []
+    for size in sizes:
+        try:
+            results.append(parse_size(size, height_or_weight))
+        except (IndexError, ValueError):
+            results.append(None)
+    return results
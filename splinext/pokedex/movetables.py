@@ -0,0 +1,543 @@
+# encoding: utf8
+"""Building, storing, and loading the big move tables shown on Pokémon and
+move pages.
+
+A move table looks like:
+
+    [ (method, [ (move, { version_group => data, ... }), ... ]), ... ]
+
+where "data" is a dictionary of whatever per-version information is
+appropriate for the move method, such as a TM number or level.
+
+The Pokémon version of this is slow to build, so it's built ahead of time
+(see `bin/precompute-tables.py`) or at worst once per Pokémon, and stored in
+`precompute.store` as plain ids.  Pages only have to turn the ids back into
+rows, which takes a fixed handful of queries.
+"""
+from __future__ import absolute_import, division
+
+from collections import defaultdict, namedtuple
+from itertools import groupby
+
+from sqlalchemy.orm import aliased, contains_eager, join
+from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.sql import and_, exists
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+# TODO this nonsense is to allow methods that don't actually exist, such as
+# for parent's egg moves.  should go away once move tables get their own
+# rendery class
+FakeMoveMethod = namedtuple('FakeMoveMethod',
+    ['id', 'name', 'identifier', 'description', 'pokemon', 'version_groups'])
+
+def fake_move_method(method, pokemon):
+    return FakeMoveMethod(
+        id=method.id, name=method.name,
+        identifier=method.identifier,
+        description=method.description,
+        pokemon=pokemon,
+        version_groups=tuple(method.version_groups))
+
+def pokemon_move_method_sort_key((method, _)):
+    """Sorts methods by id, except that tutors and machines are bumped to the
+    bottom, as they tend to be much longer than everything else.
+    """
+    # XXX see FakeMoveMethod for explanation of this abomination
+    try:
+        p = -method.pokemon.order
+    except AttributeError:
+        p = None
+    if method.identifier in (u'tutor', u'machine'):
+        return method.id + 1000, p
+    else:
+        return method.id, p
+
+VersionGroupMasks = namedtuple('VersionGroupMasks',
+    ['order', 'bits', 'generations', 'methods'])
+
+@precompute.index
+def version_group_masks():
+    """Returns a `VersionGroupMasks` describing every version group.
+
+    `order` is a list of version group ids, in order.  `bits`,
+    `generations`, and `methods` all map a version group id to, respectively:
+    the bit representing that version group in a mask of version groups; its
+    generation id; and a mask of the move methods that exist in it, with
+    `1 << method.id` set for each.
+    """
+    q = db.pokedex_session.query(t.VersionGroup) \
+        .options(joinedload('pokemon_move_methods')) \
+        .order_by(t.VersionGroup.order)
+
+    masks = VersionGroupMasks(order=[], bits={}, generations={}, methods={})
+    for i, version_group in enumerate(q):
+        masks.order.append(version_group.id)
+        masks.bits[version_group.id] = 1 << i
+        masks.generations[version_group.id] = version_group.generation_id
+        masks.methods[version_group.id] = sum(
+            1 << method.id for method in version_group.pokemon_move_methods)
+
+    return masks
+
+@precompute.index
+def pokemon_version_group_masks():
+    """Returns a dict of Pokémon id to a mask of the version groups it exists
+    in, using the bits from `version_group_masks`.
+
+    If a Pokémon learns no moves in a particular version group, that means it
+    didn't exist in that group.  (n.b. Deoxys is particularly weird in that
+    some forms appear and then briefly disappear again, so figuring out which
+    group this form was introduced in isn't enough.)
+    """
+    bits = version_group_masks().bits
+    q = db.pokedex_session.query(
+            t.PokemonMove.pokemon_id, t.PokemonMove.version_group_id) \
+        .distinct()
+
+    pokemon_masks = defaultdict(int)
+    for pokemon_id, version_group_id in q:
+        pokemon_masks[pokemon_id] |= bits[version_group_id]
+
+    return dict(pokemon_masks)
+
+def _move_column_signatures(table):
+    """Returns, for each method in the table, a dict mapping version group
+    ids to a small integer identifying that version group's column.
+
+    Two version groups get the same signature for a method iff every row
+    has the same data in both of them.
+    """
+    signature_ids = {}
+    signatures = []
+    for method, method_list in table:
+        cells = defaultdict(list)
+        for i, (move, version_group_data) in enumerate(method_list):
+            for version_group, data in version_group_data.items():
+                cells[version_group.id].append(
+                    (i, tuple(sorted(data.items()))))
+
+        method_signatures = defaultdict(int)  # 0 means an empty column
+        for version_group_id, column in cells.items():
+            column.sort()
+            key = tuple(column)
+            method_signatures[version_group_id] = \
+                signature_ids.setdefault(key, len(signature_ids) + 1)
+        signatures.append(method_signatures)
+
+    return signatures
+
+def collapse_pokemon_move_columns(table, thing):
+    """Combines adjacent identical columns in a pokemon_move structure.
+
+    Arguments are the table structure (defined in the module docstring) and
+    the Pokémon or move in question.
+
+    Returns a list of column groups, each represented by a list of its columns,
+    like `[ [ [gs, c] ], [ [rs, e], [fl] ], ... ]`
+    """
+    masks = version_group_masks()
+
+    # Only even consider versions in which this thing actually exists
+    if isinstance(thing, t.Pokemon):
+        pokemon_mask = pokemon_version_group_masks().get(thing.id, 0)
+        version_group_ids = [vg_id for vg_id in masks.order
+                             if pokemon_mask & masks.bits[vg_id]]
+    else:
+        # But a few moves exist but remain unused until midway through a gen,
+        # so empty columns are useful; see e.g. Kinesis, Ice Burn
+        version_group_ids = [vg_id for vg_id in masks.order
+                             if masks.generations[vg_id] >= thing.generation_id]
+
+    version_groups = {}
+    if version_group_ids:
+        version_groups = dict(
+            (vg.id, vg) for vg in db.pokedex_session.query(t.VersionGroup)
+                .filter(t.VersionGroup.id.in_(version_group_ids)))
+
+    # Tutors are special; they will NEVER collapse, so ignore them entirely.
+    # When we actually print the table, we'll concatenate all the tutor cells
+    # instead of just using the first one like with everything else
+    method_signatures = [
+        (1 << method.id, signatures)
+        for (method, _), signatures
+        in zip(table, _move_column_signatures(table))
+        if method.identifier != u'tutor'
+    ]
+
+    def squashable(version_group_id, column):
+        """A version group can join the column to its left iff, for every
+        method it has, its signature matches every version group in that
+        column that also has the method.
+        """
+        vg_methods = masks.methods[version_group_id]
+        for method_bit, signatures in method_signatures:
+            # If a method doesn't appear in a version group at all, it's
+            # always squashable
+            if not vg_methods & method_bit:
+                continue
+
+            signature = signatures[version_group_id]
+            for other_id in column:
+                if masks.methods[other_id] & method_bit and \
+                    signatures[other_id] != signature:
+
+                    return False
+        return True
+
+    # What we really need to know is what versions are ultimately collapsed
+    # into each column.  We also need to know how the columns are grouped into
+    # generations.  So we need a list of lists of lists of version groups;
+    # work with ids, then swap in the real objects at the end
+    move_columns = []
+    for gen, gen_version_group_ids in groupby(version_group_ids,
+                                              masks.generations.get):
+        move_columns.append( [] ) # A new column group for this generation
+        for vg_id in gen_version_group_ids:
+            if move_columns[-1] and squashable(vg_id, move_columns[-1][-1]):
+                # Stick this version group in the previous column
+                move_columns[-1][-1].append(vg_id)
+            else:
+                # Can't collapse; create a new column
+                move_columns[-1].append( [vg_id] )
+
+    return [[[version_groups[vg_id] for vg_id in column]
+             for column in column_group]
+            for column_group in move_columns]
+
+def move_tutor_version_groups(table):
+    """Tutored moves are never the same between version groups, so the column
+    collapsing ignores tutors entirely.  This means that we might end up
+    wanting to show several versions as having a tutor within a single column.
+    So that "E, FRLG" lines up with "FRLG", there has to be a blank space for
+    "E", which requires finding all the version groups that contain tutors.
+    """
+
+    move_tutor_version_groups = set()
+    for method, method_list in table:
+        if method.identifier != u'tutor':
+            continue
+        for move, version_group_data in method_list:
+            move_tutor_version_groups.update(version_group_data.keys())
+
+    return move_tutor_version_groups
+
+
+def _pokemon_move_query(pokemon):
+    """Returns the `PokemonMove` rows that go in `pokemon`'s move table,
+    roughly in the order they belong in the table.
+    """
+    q = db.pokedex_session.query(t.PokemonMove) \
+        .outerjoin((t.Machine, t.PokemonMove.machine)) \
+        .outerjoin((t.PokemonMoveMethod, t.PokemonMove.method))
+    # Evolved Pokémon ought to show their predecessors' egg moves.
+    # So far, no species evolves from a parent with multiple functional
+    # forms, but don't rely on that
+    possible_ancestors = set([pokemon])
+    ancestors = []
+    while possible_ancestors:
+        ancestor = possible_ancestors.pop()
+        ancestors.append(ancestor)
+        parent_species = ancestor.species.parent_species
+        if parent_species:
+            possible_ancestors.update(parent_species.pokemon)
+    if ancestors:
+        # Include any moves learnable by an ancestor...
+        ancestor_ids = [p.id for p in ancestors]
+        ancestor_ids.append(pokemon.id)
+        q = q.filter(t.PokemonMove.pokemon_id.in_(ancestor_ids))
+
+        # ... in a generation where this Pokémon actually exists...
+        q = q.join(t.VersionGroup, t.PokemonMove.version_group)
+        q = q.filter(t.VersionGroup.generation_id >=
+                     pokemon.default_form.version_group.generation_id)
+
+        # That AREN'T learnable by this Pokémon.  This NOT EXISTS strips
+        # out moves that are also learned by a "higher-ordered" Pokémon.
+        pm_outer = t.PokemonMove
+        p_outer = t.Pokemon
+        pm_inner = aliased(t.PokemonMove)
+        p_inner = aliased(t.Pokemon)
+
+        from_inner = join(pm_inner, p_inner, onclause=pm_inner.pokemon)
+        clause = exists(from_inner.select()).where(and_(
+            pm_outer.version_group_id == pm_inner.version_group_id,
+            pm_outer.move_id == pm_inner.move_id,
+            pm_outer.pokemon_move_method_id == pm_inner.pokemon_move_method_id,
+            pm_inner.pokemon_id.in_(ancestor_ids),
+            p_outer.order < p_inner.order,
+        ))
+
+        q = q.outerjoin(t.PokemonMove.pokemon).filter(~ clause)
+    else:
+        q = q.filter(t.PokemonMove.pokemon_id == pokemon.id)
+    # Grab the rows with a manual query so we can sort them in about the
+    # order they go in the table.  This should keep it as compact as
+    # possible.  Levels go in level order, and machines go in TM number
+    # order
+    return q.options(
+             contains_eager(t.PokemonMove.machine),
+             contains_eager(t.PokemonMove.method),
+             # n.b: contains_eager interacts badly with joinedload with
+             # innerjoin=True.  Disable the inner joining explicitly.
+             # See: http://www.sqlalchemy.org/trac/ticket/2120
+             joinedload(
+                 t.PokemonMove.machine, t.Machine.version_group,
+                 innerjoin=False),
+             joinedload_all('move'),
+             joinedload_all('version_group'),
+         ) \
+        .order_by(t.PokemonMove.level.asc(),
+                  t.Machine.machine_number.asc(),
+                  t.PokemonMove.order.asc(),
+                  t.PokemonMove.version_group_id.asc())
+
+def build_pokemon_move_table(pokemon):
+    """Builds the move table for a Pokémon, straight from the database.
+
+    Returns a tuple of the table, the collapsed columns, and the set of
+    version groups with tutors.  This is slow!  Pages should use
+    `pokemon_move_table` instead.
+    """
+    # Moves are grouped by method.
+    # Within a method is a list of move rows.
+    # A move row contains a level or other status per version group, plus
+    # a move id.
+    # First, though, we make a dictionary for quick access to each method's
+    # list.
+    move_methods = defaultdict(list)
+
+    methods_cache = {}
+    def find_method(pm):
+        key = pm.method, pm.pokemon
+        if key not in methods_cache:
+            methods_cache[key] = fake_move_method(pm.method, pm.pokemon)
+        return methods_cache[key]
+
+    for pokemon_move in _pokemon_move_query(pokemon):
+        method = find_method(pokemon_move)
+        method_list = move_methods[method]
+        this_vg = pokemon_move.version_group
+
+        # Create a container for data for this method and version(s)
+        vg_data = dict()
+
+        # TMs need to know their own TM number
+        if method.identifier == u'machine':
+            vg_data['machine'] = pokemon_move.machine.machine_number
+
+        # Find the best place to insert a row.
+        # In general, we just want the move names in order, so we can just
+        # tack rows on and sort them at the end.  However!  Level-up moves
+        # must stay in the same order within a version group, and TMs are
+        # similarly ordered by number.  So we have to do some special
+        # ordering here.
+        # These two vars are the boundaries of where we can find or insert
+        # a new row.  Only level-up moves have these restrictions
+        lower_bound = None
+        upper_bound = None
+        if method.identifier in (u'level-up', u'machine'):
+            vg_data['sort'] = (pokemon_move.level,
+                               vg_data.get('machine', None),
+                               pokemon_move.order)
+            vg_data['level'] = pokemon_move.level
+
+            # Find the next-lowest and next-highest rows.  Our row must fit
+            # between those
+            for i, (move, version_group_data) in enumerate(method_list):
+                if this_vg not in version_group_data:
+                    # Can't be a bound; not related to this version!
+                    continue
+
+                if version_group_data[this_vg]['sort'] > vg_data['sort']:
+                    if not upper_bound or i < upper_bound:
+                        upper_bound = i
+                if version_group_data[this_vg]['sort'] < vg_data['sort']:
+                    if not lower_bound or i > lower_bound:
+                        lower_bound = i
+
+        # We're using Python's slice syntax, which includes the lower bound
+        # and excludes the upper.  But we want to exclude both, so bump the
+        # lower bound
+        if lower_bound != None:
+            lower_bound += 1
+
+        # Check for a free existing row for this move; if one exists, we
+        # can just add our data to that same row.
+        # It's also possible that an existing row for this move can be
+        # shifted forwards into our valid range, if there are no
+        # intervening rows with levels in the same version groups that that
+        # row has.  This is unusual, but happens when a lot of moves have
+        # been shuffled around multiple times, like with Pikachu
+        valid_row = None
+        valid_row_index = None
+        for i, table_row in enumerate(method_list[0:upper_bound]):
+            move, version_group_data = table_row
+
+            # If we've already found a row for version X outside our valid
+            # range but run across another row with a level for X, that row
+            # cannot be moved up, so it's not usable
+            if valid_row and set(valid_row[1].keys()).intersection(
+                                 set(version_group_data.keys())):
+                valid_row = None
+
+            if move == pokemon_move.move \
+                and this_vg not in version_group_data:
+
+                valid_row = table_row
+                valid_row_index = i
+                # If we're inside the valid range, just take the first row
+                # we find.  If we're outside it, we want the last possible
+                # row to avoid shuffling the table too much.  So only break
+                # if this row is inside lb/ub
+                if i >= lower_bound:
+                    break
+
+        if valid_row:
+            if valid_row_index < lower_bound:
+                # Move the row up if necessary
+                del method_list[valid_row_index]
+                method_list.insert(lower_bound, valid_row)
+            valid_row[1][this_vg] = vg_data
+            continue
+
+        # Otherwise, just make a new row and stuff it in.
+        # Rows are sorted by level before version group.  If we see move X
+        # for a level, then move Y for another game, then move X for that
+        # other game, the two X's should be able to collapse.  Thus we put
+        # the Y before the first X to leave space for the second X -- that
+        # is, add new rows as early in the list as possible
+        new_row = pokemon_move.move, { this_vg: vg_data }
+        method_list.insert(lower_bound or 0, new_row)
+
+    # Convert dictionary to our desired list of tuples
+    table = move_methods.items()
+    table.sort(key=pokemon_move_method_sort_key)
+
+    # Collapse identical columns within the same generation
+    columns = collapse_pokemon_move_columns(table=table, thing=pokemon)
+
+    return table, columns, move_tutor_version_groups(table)
+
+
+def serialize_pokemon_move_table(table, columns, tutor_version_groups):
+    """Flattens a built move table into ids, for `precompute.store`.
+
+    Each method becomes `[method_id, pokemon_id, rows]`, each row becomes
+    `[move_id, cells]`, and each cell is `[version_group_id, level,
+    machine_number]`.
+    """
+    methods = []
+    for method, method_list in table:
+        rows = []
+        for move, version_group_data in method_list:
+            cells = [[version_group.id, data.get('level'), data.get('machine')]
+                     for version_group, data in version_group_data.items()]
+            cells.sort()
+            rows.append([move.id, cells])
+        methods.append([method.id, method.pokemon.id, rows])
+
+    return {
+        'methods': methods,
+        'columns': [[[vg.id for vg in column] for column in column_group]
+                    for column_group in columns],
+        'tutor_version_groups': sorted(
+            vg.id for vg in tutor_version_groups),
+    }
+
+def load_pokemon_move_table(data):
+    """Turns the output of `serialize_pokemon_move_table` back into a move
+    table, columns, and tutor version groups, with real ORM objects.
+
+    Everything is fetched in a fixed handful of queries, no matter how large
+    the table is.
+    """
+    session = db.pokedex_session
+
+    version_groups = dict(
+        (vg.id, vg) for vg in session.query(t.VersionGroup)
+            .options(
+                joinedload('generation.version_groups'),
+                joinedload('versions'),
+            ))
+    methods = dict(
+        (method.id, method) for method in session.query(t.PokemonMoveMethod)
+            .options(joinedload('version_groups')))
+
+    move_ids = set()
+    pokemon_ids = set()
+    for method_id, pokemon_id, rows in data['methods']:
+        pokemon_ids.add(pokemon_id)
+        move_ids.update(move_id for move_id, cells in rows)
+
+    moves = {}
+    if move_ids:
+        moves = dict(
+            (move.id, move) for move in session.query(t.Move)
+                .filter(t.Move.id.in_(move_ids))
+                .options(
+                    joinedload('damage_class'),
+                    joinedload('type'),
+                    joinedload_all(t.Move.move_effect,
+                                   t.MoveEffect.prose_local),
+                ))
+    pokemon = {}
+    if pokemon_ids:
+        pokemon = dict(
+            (p.id, p) for p in session.query(t.Pokemon)
+                .filter(t.Pokemon.id.in_(pokemon_ids))
+                .options(joinedload('species')))
+
+    table = []
+    for method_id, pokemon_id, rows in data['methods']:
+        method = fake_move_method(methods[method_id], pokemon[pokemon_id])
+        method_list = []
+        for move_id, cells in rows:
+            version_group_data = {}
+            for version_group_id, level, machine in cells:
+                vg_data = {}
+                if level is not None:
+                    vg_data['level'] = level
+                if machine is not None:
+                    vg_data['machine'] = machine
+                version_group_data[version_groups[version_group_id]] = vg_data
+            method_list.append((moves[move_id], version_group_data))
+
+        # Names depend on the language, so can't be sorted ahead of time
+        if method.identifier not in (u'level-up', u'machine'):
+            method_list.sort(key=lambda (move, version_group_data): move.name)
+
+        table.append((method, method_list))
+
+    columns = [[[version_groups[vg_id] for vg_id in column]
+                for column in column_group]
+               for column_group in data['columns']]
+    tutor_version_groups = set(
+        version_groups[vg_id] for vg_id in data['tutor_version_groups'])
+
+    return table, columns, tutor_version_groups
+
+def pokemon_move_table_data(pokemon):
+    """Returns a Pokémon's move table in the form described in
+    `serialize_pokemon_move_table`, from the precomputed store if possible.
+    """
+    return precompute.store.get_or_build('pokemon-moves', pokemon.id,
+        lambda: serialize_pokemon_move_table(*build_pokemon_move_table(pokemon)))
+
+def pokemon_move_table(pokemon):
+    """Returns the move table, collapsed columns, and tutor version groups
+    for a Pokémon, from the precomputed store if possible.
+    """
+    return load_pokemon_move_table(pokemon_move_table_data(pokemon))
+
+@precompute.producer
+def precompute_pokemon_move_tables():
+    """Yields store entries for every Pokémon's move table, for
+    `bin/precompute-tables.py`.
+    """
+    for pokemon in db.pokedex_session.query(t.Pokemon).order_by(t.Pokemon.id):
+        table = build_pokemon_move_table(pokemon)
+        yield 'pokemon-moves', pokemon.id, serialize_pokemon_move_table(*table)
@@ -0,0 +1,312 @@
+# encoding: utf8
+"""Storage for data that is expensive to work out but only ever changes when
+the database does.
+
+There are two flavors of thing in here.
+
+`store` holds small serialized blobs keyed by namespace and id, such as the
+move table for a single Pokémon.  It can be backed by a dbm file, filled
+ahead of time by `bin/precompute-tables.py`; anything missing from the file
+is built on demand and kept in memory instead.
+
+`index` is a decorator for structures that cover the whole database (type
+charts, breeding groups, and so on).  They're built once, on first use or at
+warm-up, and then shared by every request.
+
+Everything is tied to the data version, so loading different data into the
+database invalidates all of it.
+"""
+from __future__ import absolute_import
+
+import anydbm
+import functools
+import hashlib
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+
+import pokedex.db.tables as t
+from sqlalchemy import Boolean, Integer, Numeric, String, case, cast, func
+
+from . import db
+
+log = logging.getLogger(__name__)
+
+# Tables whose contents make up the data version fingerprint.  These are
+# the ones everything in here is derived from, so a reload that changes
+# their rows, even without changing how many there are, is noticed.
+FINGERPRINT_TABLES = [
+    t.Pokemon, t.PokemonSpecies, t.PokemonForm, t.PokemonStat,
+    t.PokemonMove, t.Move, t.Machine, t.VersionGroup, t.Encounter,
+    t.PokemonEvolution, t.PokemonItem, t.PokemonEggGroup, t.TypeEfficacy,
+]
+
+_VERSION_KEY = '__data_version__'
+
+# Most values the store keeps in memory at once
+STORE_CACHE_SIZE = 2000
+
+_data_version = None
+_data_version_override = None
+_lock = threading.RLock()
+
+
+def _column_checksum(column):
+    """Returns an aggregate that sums up the values in `column`: the numbers
+    themselves, or the lengths of anything else.
+    """
+    if isinstance(column.type, Boolean):
+        return func.sum(case([(column, 1)], else_=0))
+    elif isinstance(column.type, (Integer, Numeric)):
+        return func.sum(column)
+    else:
+        return func.sum(func.length(cast(column, String)))
+
+def compute_data_version(session):
+    """Returns a short fingerprint of the data currently in the database.
+
+    Each fingerprinted table is boiled down by the database itself, in one
+    aggregate query: its row count and a sum over every column.  That's
+    cheap enough to do on the first request, and still notices rows that
+    were edited rather than added or removed.
+    """
+    digest = hashlib.sha1()
+    for table in FINGERPRINT_TABLES:
+        columns = table.__table__.columns
+        row = session.query(func.count(),
+                            *[_column_checksum(column) for column in columns]) \
+            .select_from(table).one()
+        digest.update('{0}:{1};'.format(table.__tablename__,
+                                        ','.join(map(str, row))))
+    return digest.hexdigest()[:12]
+
+def data_version():
+    """Returns the version string of the data the app is serving.
+
+    Set `spline-pokedex.data_version` to pin this explicitly; otherwise it's
+    worked out from the database the first time it's needed.
+    """
+    global _data_version
+    if _data_version is None:
+        with _lock:
+            if _data_version is None:
+                _data_version = str(_data_version_override or
+                    compute_data_version(db.pokedex_session))
+    return _data_version
+
+
+class ResultCache(object):
+    """The results of recent lookups, keyed by a string that identifies the
+    lookup.  Least recently used results are dropped once there are more
+    than `size`.
+
+    `hits` and `misses` count how often a lookup was answered from here.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get_or_search(self, key, search):
+        """Returns `(results, hit)`, where `results` are the cached results
+        for `key`, or else whatever `search()` returns.
+        """
+        with self._lock:
+            try:
+                results = self._results.pop(key)
+            except KeyError:
+                pass
+            else:
+                self._results[key] = results
+                self.hits += 1
+                return results, True
+
+        # Search outside the lock; at worst, two requests for the same new
+        # thing both do the work
+        results = search()
+
+        with self._lock:
+            self.misses += 1
+            self._results.pop(key, None)
+            self._results[key] = results
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+        return results, False
+
+
+class PrecomputedStore(object):
+    """A persistent key-value store of JSON-able values.
+
+    Values are stored as zlib-compressed JSON, keyed by namespace and key.
+    The backing dbm file (if any) is only ever read; it's written wholesale
+    by `bin/precompute-tables.py`.  If it was built from a different data
+    version than the one being served, it's ignored entirely.
+
+    The most recently used values, whether read from the file or built on
+    the spot, are also kept in memory, up to `cache_size` of them.
+    """
+
+    def __init__(self, filename=None, cache_size=STORE_CACHE_SIZE):
+        self.filename = filename
+        self.cache_size = cache_size
+        self._dbm = None
+        self._memory = ResultCache(size=cache_size)
+        self._checked_version = False
+
+    @staticmethod
+    def _make_key(namespace, key):
+        return '{0}:{1}'.format(namespace, key)
+
+    @staticmethod
+    def dumps(value):
+        return zlib.compress(json.dumps(value, separators=(',', ':')), 6)
+
+    @staticmethod
+    def loads(data):
+        return json.loads(zlib.decompress(data))
+
+    def _backing(self):
+        """Returns the dbm file, opening it and checking its version the
+        first time through.
+        """
+        if self._checked_version or not self.filename:
+            return self._dbm
+
+        with _lock:
+            if self._checked_version:
+                return self._dbm
+            self._checked_version = True
+
+            try:
+                dbm = anydbm.open(self.filename, 'r')
+            except anydbm.error:
+                log.warning("Can't open precomputed data at %s",
+                            self.filename)
+                return None
+
+            if _VERSION_KEY not in dbm or dbm[_VERSION_KEY] != data_version():
+                log.warning("Precomputed data at %s is stale; ignoring it",
+                            self.filename)
+                dbm.close()
+                return None
+
+            self._dbm = dbm
+            return dbm
+
+    def get_or_build(self, namespace, key, build):
+        """Returns the stored value, or calls `build()` to create it."""
+        full_key = self._make_key(namespace, key)
+
+        def load():
+            dbm = self._backing()
+            if dbm is not None and full_key in dbm:
+                return self.loads(dbm[full_key])
+
+            # Round-trip through JSON, so the caller always gets back the
+            # same shape of thing whether it came from here or from the file
+            return self.loads(self.dumps(build()))
+
+        return self._memory.get_or_search(full_key, load)[0]
+
+    def clear(self):
+        with _lock:
+            self._memory = ResultCache(size=self.cache_size)
+            if self._dbm is not None:
+                self._dbm.close()
+            self._dbm = None
+            self._checked_version = False
+
+    @classmethod
+    def write_file(cls, filename, version, items):
+        """Writes a fresh dbm file from an iterable of
+        `(namespace, key, value)`.
+        """
+        dbm = anydbm.open(filename, 'n')
+        try:
+            for namespace, key, value in items:
+                dbm[cls._make_key(namespace, key)] = cls.dumps(value)
+            dbm[_VERSION_KEY] = str(version)
+        finally:
+            dbm.close()
+
+store = PrecomputedStore()
+
+
+_indices = []
+
+def index(build):
+    """Decorator for a function that builds some structure from the entire
+    database.
+
+    The function is called at most once per data version; every caller
+    shares the result, so treat it as read-only.  Indices are also built
+    eagerly by `warm_up`.
+    """
+    cache = {}
+
+    @functools.wraps(build)
+    def wrapper():
+        version = data_version()
+        try:
+            return cache[version]
+        except KeyError:
+            pass
+
+        with _lock:
+            if version not in cache:
+                cache.clear()
+                cache[version] = build()
+        return cache[version]
+
+    wrapper.invalidate = cache.clear
+    _indices.append(wrapper)
+    return wrapper
+
+_producers = []
+
+def producer(produce):
+    """Decorator for a function that yields `(namespace, key, value)` for
+    everything it can put in the store.  `bin/precompute-tables.py` runs all
+    of these to build the store's file.
+    """
+    _producers.append(produce)
+    return produce
+
+def produce_all():
+    for produce in _producers:
+        log.info("Running %s.%s", produce.__module__, produce.__name__)
+        for item in produce():
+            yield item
+
+def warm_up():
+    """Builds every registered index, so the first requests don't have to."""
+    for built_index in _indices:
+        log.info("Building %s.%s", built_index.__module__,
+                 built_index.__name__)
+        built_index()
+
+def reset():
+    """Forgets all precomputed data, e.g. after reloading the database."""
+    global _data_version
+    with _lock:
+        _data_version = None
+        store.clear()
+        for built_index in _indices:
+            built_index.invalidate()
+
+
+def connect(settings):
+    """Configures the store and data version from the app's settings."""
+    global _data_version_override
+    _data_version_override = settings.get('spline-pokedex.data_version') or None
+    store.filename = settings.get('spline-pokedex.precomputed_file') or None
+    reset()
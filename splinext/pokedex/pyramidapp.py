@@ -18,6 +18,7 @@ import pokedex.db.markdown
 from . import frontpage
 from . import db
 from . import lib
+from . import precompute
 from . import splinehelpers
 from . import helpers
 
@@ -244,6 +245,14 @@ def main(global_config, **settings):
     config.add_route('dex_gadgets/stat_calculator', '/dex/gadgets/stat_calculator')
     config.add_route('dex_gadgets/whos_that_pokemon', '/dex/gadgets/whos_that_pokemon')
 
+    # JSON API
+    config.add_route('dex_api/abilities', '/dex/api/v1/abilities/{name}')
+    config.add_route('dex_api/capture', '/dex/api/v1/capture/{name}')
+    config.add_route('dex_api/moves', '/dex/api/v1/moves/{name}')
+    config.add_route('dex_api/pokemon', '/dex/api/v1/pokemon/{name}')
+    config.add_route('dex_api/stat_calculator', '/dex/api/v1/stat_calculator')
+    config.add_route('dex_api/types', '/dex/api/v1/types/{name}')
+
     # Conquest pages; specific first, again
     config.add_route('dex_conquest/abilities', '/dex/conquest/abilities/{name}')
     config.add_route('dex_conquest/kingdoms', '/dex/conquest/kingdoms/{name}')
@@ -316,6 +325,14 @@ def main(global_config, **settings):
     config.add_view(route_name='dex_gadgets/compare_pokemon', view='splinext.pokedex.views.gadgets:compare_pokemon', renderer='pokedex/gadgets/compare_pokemon.mako')
     config.add_view(route_name='dex_gadgets/stat_calculator', view='splinext.pokedex.views.gadgets:stat_calculator', renderer='pokedex/gadgets/stat_calculator.mako')
 
+    # json api
+    config.add_view(route_name='dex_api/abilities', view='splinext.pokedex.views.api:ability_view')
+    config.add_view(route_name='dex_api/capture', view='splinext.pokedex.views.api:capture_view')
+    config.add_view(route_name='dex_api/moves', view='splinext.pokedex.views.api:move_view')
+    config.add_view(route_name='dex_api/pokemon', view='splinext.pokedex.views.api:pokemon_view')
+    config.add_view(route_name='dex_api/stat_calculator', view='splinext.pokedex.views.api:stat_calculator_view', request_method='POST')
+    config.add_view(route_name='dex_api/types', view='splinext.pokedex.views.api:type_view')
+
     # conquest
 
     config.add_view(route_name='dex_conquest/abilities', view='splinext.pokedex.views.conquest:ability_view', renderer='pokedex/conquest/ability.mako')
@@ -411,6 +428,13 @@ def main(global_config, **settings):
     # Connect to ye olde database (and lookup index)
     db.connect(settings)
 
+    # Precomputed tables and indices; optionally build the latter right now,
+    # rather than making the first few requests wait for them
+    precompute.connect(settings)
+    if pyramid.settings.asbool(settings.get('spline-pokedex.warm_up', False)):
+        precompute.warm_up()
+        db.pokedex_session.remove()
+
     # Extend the pokedex code's default markdown rendering
     db.pokedex_session.configure(markdown_extension_class=SplineExtension)
 
@@ -0,0 +1,705 @@
+# encoding: utf8
+"""Column-oriented snapshots of the Pokédex, for searching without SQL.
+
+Each index has one row per thing, in id order.  Plain properties are NumPy
+arrays, where missing values are NaN so that they never match a range;
+has-manies like types and egg groups are boolean matrices with one column
+per related row.  A search then boils down to and-ing together boolean masks
+over the rows, and sorting is a matter of filtering a precomputed order.
+"""
+from __future__ import absolute_import, division
+
+import re
+import threading
+from collections import defaultdict
+
+import numpy
+from sqlalchemy.orm import joinedload
+
+import pokedex.db.tables as t
+
+from . import db
+from . import evolution
+from . import precompute
+
+# Number of results shown at a time
+PAGE_SIZE = 500
+
+# Number of distinct searches whose results are kept around
+RESULT_CACHE_SIZE = 200
+
+def _numbers(values):
+    """Returns a float array of `values`, with None as NaN."""
+    return numpy.array([numpy.nan if value is None else value
+                        for value in values], dtype=numpy.float64)
+
+def _membership(row_index, pairs, column_ids):
+    """Returns a boolean matrix with a row for each of `row_index` and a
+    column for each of `column_ids`, with True wherever `pairs` has a
+    `(row_id, column_id)`.
+    """
+    column_index = dict((id, i) for i, id in enumerate(column_ids))
+    matrix = numpy.zeros((len(row_index), len(column_ids)), dtype=bool)
+    for row_id, column_id in pairs:
+        if row_id in row_index and column_id in column_index:
+            matrix[row_index[row_id], column_index[column_id]] = True
+    return matrix, column_index
+
+def _lower(string):
+    if string is None:
+        return None
+    return string.lower()
+
+def _nulls_last(value):
+    # SQL sorts NULLs last when ascending...
+    return value is None, value
+
+def _nulls_first_descending(value):
+    # ...and first when descending
+    if value is None:
+        return False, 0
+    return True, -value
+
+def _order(n, key):
+    """Returns an array of the numbers up to `n`, sorted by `key`."""
+    return numpy.array(sorted(xrange(n), key=key), dtype=numpy.intp)
+
+def any_of(matrix, column_index, ids):
+    """Returns a mask of the rows in a membership matrix that have any of the
+    given ids.
+    """
+    columns = [column_index[id] for id in ids if id in column_index]
+    return matrix[:, columns].any(axis=1)
+
+def all_of(matrix, column_index, ids):
+    """Returns a mask of the rows in a membership matrix that have all of the
+    given ids.
+    """
+    if any(id not in column_index for id in ids):
+        return numpy.zeros(len(matrix), dtype=bool)
+    columns = [column_index[id] for id in ids]
+    return matrix[:, columns].all(axis=1)
+
+def only(matrix, column_index, ids):
+    """Returns a mask of the rows in a membership matrix that have none but
+    the given ids.
+    """
+    others = numpy.ones(len(column_index), dtype=bool)
+    others[[column_index[id] for id in ids if id in column_index]] = False
+    return ~matrix[:, others].any(axis=1)
+
+
+def page(rows, row_ids, after=None, size=PAGE_SIZE, groups=None):
+    """Returns one page of `rows`, which are already sorted, and the id to
+    pass as `after` to get the next page, or None if this is the last one.
+
+    `after` is the id of the last row on the previous page; paging by id
+    rather than by position means a page always picks up where the last one
+    left off.  An id that isn't in `rows` starts from the beginning.
+
+    If `groups` is given, it's an array of a group for every row, and a page
+    never ends partway through a run of rows in the same group; it runs long
+    instead.  Sorting by evolution chain uses this to keep families whole.
+    """
+    if after is not None:
+        found = numpy.flatnonzero(row_ids[rows] == after)
+        if len(found):
+            rows = rows[found[0] + 1:]
+
+    end = size
+    if groups is not None and len(rows) > size:
+        row_groups = groups[rows]
+        others = numpy.flatnonzero(row_groups[size:] != row_groups[size - 1])
+        end = size + others[0] if len(others) else len(rows)
+
+    if len(rows) <= end:
+        return rows, None
+    rows = rows[:end]
+    return rows, int(row_ids[rows[-1]])
+
+
+def _ngrams(string, n):
+    return set(string[i:i + n] for i in xrange(len(string) - n + 1))
+
+class NgramIndex(object):
+    """Maps every run of `n` characters to the positions of the strings in a
+    list that contain it, so wildcard searches only have to check the strings
+    that have every run of literal characters in the pattern.
+    """
+
+    def __init__(self, strings, n=3):
+        self.n = n
+        postings = defaultdict(list)
+        for row, string in enumerate(strings):
+            if string is None:
+                continue
+            for gram in _ngrams(string, n):
+                postings[gram].append(row)
+
+        self.postings = dict(
+            (gram, numpy.array(rows, dtype=numpy.intp))
+            for gram, rows in postings.iteritems())
+
+    def candidates(self, pattern):
+        """Returns a sorted array of the positions of strings that could match
+        `pattern`, which uses `*` and `?` as wildcards.  Returns None if the
+        pattern has no literal run long enough to narrow anything down.
+        """
+        grams = set()
+        for literal in re.split(u'[*?]', pattern):
+            grams.update(_ngrams(literal, self.n))
+        if not grams:
+            return None
+
+        # Intersect the rarest first, to keep it quick
+        empty = numpy.array([], dtype=numpy.intp)
+        postings = sorted((self.postings.get(gram, empty) for gram in grams),
+                          key=len)
+        rows = postings[0]
+        for posting in postings[1:]:
+            if not len(rows):
+                break
+            rows = numpy.intersect1d(rows, posting, assume_unique=True)
+        return rows
+
+
+class PokemonIndex(object):
+    """Everything `pokemon_search` can filter or sort on, for every Pokémon.
+
+    Rows are Pokémon; species properties are repeated for each form.
+    """
+
+    def __init__(self, session):
+        q = session.query(
+                t.Pokemon.id,
+                t.Pokemon.height,
+                t.Pokemon.weight,
+                t.Pokemon.base_experience,
+                t.PokemonSpecies.id,
+                t.PokemonSpecies.identifier,
+                t.PokemonSpecies.evolution_chain_id,
+                t.PokemonSpecies.generation_id,
+                t.PokemonSpecies.growth_rate_id,
+                t.PokemonSpecies.gender_rate,
+                t.PokemonSpecies.hatch_counter,
+                t.PokemonSpecies.capture_rate,
+                t.PokemonSpecies.base_happiness,
+                t.PokemonSpecies.color_id,
+                t.PokemonSpecies.habitat_id,
+                t.PokemonSpecies.shape_id,
+                t.PokemonForm.order,
+                t.PokemonForm.form_identifier,
+            ) \
+            .join(t.Pokemon.species) \
+            .outerjoin(t.Pokemon.default_form) \
+            .order_by(t.Pokemon.id)
+        rows = q.all()
+        n = len(rows)
+        columns = zip(*rows) if rows else [()] * 18
+        (pokemon_ids, heights, weights, base_experiences, species_ids,
+         species_identifiers, chain_ids, generation_ids, growth_rate_ids,
+         gender_rates, hatch_counters, capture_rates, base_happinesses,
+         color_ids, habitat_ids, shape_ids, form_orders,
+         form_identifiers) = columns
+
+        self.pokemon_ids = numpy.array(pokemon_ids, dtype=numpy.int64)
+        self.species_ids = numpy.array(species_ids, dtype=numpy.int64)
+        self.evolution_chain_ids = numpy.array(chain_ids, dtype=numpy.int64)
+        self.row_index = dict((id, i) for i, id in enumerate(pokemon_ids))
+
+        self.height = _numbers(heights)
+        self.weight = _numbers(weights)
+        self.base_experience = _numbers(base_experiences)
+        self.generation_id = _numbers(generation_ids)
+        self.growth_rate_id = _numbers(growth_rate_ids)
+        self.gender_rate = _numbers(gender_rates)
+        self.hatch_counter = _numbers(hatch_counters)
+        self.capture_rate = _numbers(capture_rates)
+        self.base_happiness = _numbers(base_happinesses)
+        self.color_id = _numbers(color_ids)
+        self.habitat_id = _numbers(habitat_ids)
+        self.shape_id = _numbers(shape_ids)
+
+        # Names are in the session's language, lowercased for matching
+        species_names = {}
+        for species_id, name, genus in session.query(
+                t.PokemonSpecies.id,
+                t.PokemonSpecies.names_table.name,
+                t.PokemonSpecies.names_table.genus) \
+                .join(t.PokemonSpecies.names_local):
+            species_names[species_id] = name, genus
+        form_names = dict(
+            session.query(t.PokemonForm.pokemon_id,
+                          t.PokemonForm.names_table.pokemon_name)
+            .join(t.PokemonForm.names_local)
+            .filter(t.PokemonForm.is_default == True))
+        species_names = [species_names.get(species_id, (None, None))
+                         for species_id in species_ids]
+        genera = [genus for name, genus in species_names]
+        self.names = [_lower(name) for name, genus in species_names]
+        self.genera = [_lower(genus) for genus in genera]
+        self.form_names = [_lower(form_names.get(pokemon_id))
+                           for pokemon_id in pokemon_ids]
+        self.name_ngrams = NgramIndex(self.names)
+        self.genus_ngrams = NgramIndex(self.genera)
+        self.form_name_ngrams = NgramIndex(self.form_names)
+
+        ### Has-manies
+        self.types, self.type_columns = _membership(self.row_index,
+            session.query(t.PokemonType.pokemon_id, t.PokemonType.type_id),
+            [id for id, in session.query(t.Type.id).order_by(t.Type.id)])
+        self.abilities, self.ability_columns = _membership(self.row_index,
+            session.query(t.PokemonAbility.pokemon_id,
+                          t.PokemonAbility.ability_id),
+            [id for id, in session.query(t.Ability.id).order_by(t.Ability.id)])
+
+        # Species-based ones have to be spread out over each species' forms
+        species_rows = defaultdict(list)
+        for row, species_id in enumerate(species_ids):
+            species_rows[species_id].append(row)
+        def by_pokemon(species_pairs):
+            for species_id, other_id in species_pairs:
+                for row in species_rows[species_id]:
+                    yield pokemon_ids[row], other_id
+
+        self.egg_groups, self.egg_group_columns = _membership(self.row_index,
+            by_pokemon(session.query(t.PokemonEggGroup.species_id,
+                                     t.PokemonEggGroup.egg_group_id)),
+            [id for id, in session.query(t.EggGroup.id)
+                                  .order_by(t.EggGroup.id)])
+        self.pokedexes, self.pokedex_columns = _membership(self.row_index,
+            by_pokemon(session.query(t.PokemonDexNumber.species_id,
+                                     t.PokemonDexNumber.pokedex_id)),
+            [id for id, in session.query(t.Pokedex.id).order_by(t.Pokedex.id)])
+
+        # Held items are sparse, so just keep the rows for each item
+        item_rows = defaultdict(set)
+        for pokemon_id, item_id in session.query(t.PokemonItem.pokemon_id,
+                                                 t.PokemonItem.item_id):
+            if pokemon_id in self.row_index:
+                item_rows[item_id].add(self.row_index[pokemon_id])
+        self.held_item_rows = dict(
+            (item_id, numpy.array(sorted(rows), dtype=numpy.intp))
+            for item_id, rows in item_rows.items())
+
+        ### Stats
+        stats = session.query(t.Stat.id, t.Stat.identifier) \
+            .order_by(t.Stat.id).all()
+        self.stat_columns = dict((id, i) for i, (id, _) in enumerate(stats))
+        self.stat_identifiers = dict((identifier, id)
+                                     for id, identifier in stats)
+        self.base_stats = numpy.full((n, len(stats)), numpy.nan)
+        self.efforts = numpy.full((n, len(stats)), numpy.nan)
+        for pokemon_id, stat_id, base_stat, effort in session.query(
+                t.PokemonStat.pokemon_id, t.PokemonStat.stat_id,
+                t.PokemonStat.base_stat, t.PokemonStat.effort):
+            if pokemon_id in self.row_index:
+                row = self.row_index[pokemon_id]
+                self.base_stats[row, self.stat_columns[stat_id]] = base_stat
+                self.efforts[row, self.stat_columns[stat_id]] = effort
+
+        # Pokémon without any stats have no total either, so NaN is right
+        has_stats = ~numpy.isnan(self.base_stats).all(axis=1)
+        self.stat_total = numpy.where(has_stats,
+            numpy.nansum(self.base_stats, axis=1), numpy.nan)
+        self.effort_total = numpy.where(has_stats,
+            numpy.nansum(self.efforts, axis=1), numpy.nan)
+
+        ### Evolution
+        topology = evolution.species_topology()
+        topologies = [topology[species_id] for species_id in species_ids]
+        self.evolution_stage = numpy.array(
+            [species.stage for species in topologies])
+        self.evolution_position = numpy.array(
+            [species.position for species in topologies])
+        self.branching = numpy.array(
+            [species.branching for species in topologies], dtype=bool)
+        self.branched = numpy.array(
+            [species.branched for species in topologies], dtype=bool)
+        self.evolution_root_ids = numpy.array(
+            [species.root_id for species in topologies], dtype=numpy.int64)
+
+        ### Sort orders
+        # Each of these is a permutation of every row, ordered the same way
+        # as the SQL version of the search would order them: ascending for
+        # words and descending for numbers, then by name and form.  Reversing
+        # one is the same as sorting backwards.
+        def fallback(row):
+            return (species_identifiers[row],
+                    _nulls_last(form_orders[row]),
+                    _nulls_last(form_identifiers[row]))
+
+        def descending(values):
+            return lambda row: \
+                (_nulls_first_descending(values[row]),) + fallback(row)
+
+        def ascending(values):
+            return lambda row: (_nulls_last(values[row]),) + fallback(row)
+
+        def identifiers(table, ids):
+            by_id = dict(session.query(table.id, table.identifier))
+            return [by_id.get(id) for id in ids]
+
+        type_slots = defaultdict(dict)
+        type_identifiers = dict(session.query(t.Type.id, t.Type.identifier))
+        for pokemon_id, type_id, slot in session.query(
+                t.PokemonType.pokemon_id, t.PokemonType.type_id,
+                t.PokemonType.slot):
+            type_slots[pokemon_id][slot] = type_identifiers[type_id]
+        def type_key(row):
+            slots = type_slots[pokemon_ids[row]]
+            # Single-type Pokémon come first
+            return ((_nulls_last(slots.get(1)), 2 in slots,
+                     _nulls_last(slots.get(2))) + fallback(row))
+
+        experience = dict(
+            (growth_rate.id, growth_rate.max_experience)
+            for growth_rate in session.query(t.GrowthRate)
+                .options(joinedload('max_experience_obj')))
+
+        self.sort_orders = {
+            'id': _order(n, lambda row:
+                (species_ids[row],) + fallback(row)[1:]),
+            'name': _order(n, fallback),
+            'type': _order(n, type_key),
+            'growth-rate': _order(n, descending(
+                [experience.get(id) for id in growth_rate_ids])),
+            'hatch-counter': _order(n, descending(hatch_counters)),
+            'base-experience': _order(n, descending(base_experiences)),
+            'capture-rate': _order(n, descending(capture_rates)),
+            'base-happiness': _order(n, descending(base_happinesses)),
+            'height': _order(n, descending(heights)),
+            'weight': _order(n, descending(weights)),
+            'gender': _order(n, ascending(gender_rates)),
+            'genus': _order(n, ascending(genera)),
+            'color': _order(n, ascending(
+                identifiers(t.PokemonColor, color_ids))),
+            'habitat': _order(n, ascending(
+                identifiers(t.PokemonHabitat, habitat_ids))),
+            'shape': _order(n, ascending(
+                identifiers(t.PokemonShape, shape_ids))),
+            'stat-total': _order(n, descending(
+                [None if numpy.isnan(total) else total
+                 for total in self.stat_total])),
+        }
+        for stat_id, identifier in stats:
+            column = self.base_stats[:, self.stat_columns[stat_id]]
+            self.sort_orders['stat-' + identifier] = _order(n, descending(
+                [None if numpy.isnan(value) else value for value in column]))
+
+        # Families are sorted by where they first appear in the results,
+        # which depends on the search, so this is only the order within each
+        # family: each species right before its evolutions
+        self.family_order = _order(n, lambda row:
+            (topologies[row].chain_position,) + fallback(row)[1:])
+
+    def __len__(self):
+        return len(self.pokemon_ids)
+
+    def everything(self):
+        """Returns a mask that matches every row."""
+        return numpy.ones(len(self), dtype=bool)
+
+    def rows_mask(self, rows):
+        """Returns a mask of the given rows."""
+        mask = numpy.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def rows_for_ids(self, pokemon_ids):
+        """Returns a mask of the rows for the given Pokémon ids."""
+        return numpy.in1d(self.pokemon_ids, list(pokemon_ids))
+
+    def sorted_rows(self, mask, sort, backwards=False):
+        """Returns the rows in `mask`, ordered by `sort`, which is one of the
+        keys of `sort_orders`.
+        """
+        order = self.sort_orders[sort]
+        if backwards:
+            order = order[::-1]
+        return order[mask[order]]
+
+    def family_rows(self, mask, whole_families=False):
+        """Returns the rows in `mask` ordered by evolution family.
+
+        Families appear in order of the lowest species id in `mask`.  If
+        `whole_families` is true, the rest of each family is included too.
+        """
+        chain_ids = self.evolution_chain_ids
+        chain_positions = {}
+        for chain_id, species_id in zip(chain_ids[mask],
+                                        self.species_ids[mask]):
+            if species_id < chain_positions.get(chain_id, species_id + 1):
+                chain_positions[chain_id] = species_id
+
+        if whole_families:
+            mask = numpy.in1d(chain_ids, list(chain_positions))
+
+        rows = self.family_order[mask[self.family_order]]
+        positions = numpy.array([chain_positions[chain_id]
+                                 for chain_id in chain_ids[rows]],
+                                dtype=numpy.int64)
+        return rows[numpy.argsort(positions, kind='mergesort')]
+
+_language_lock = threading.RLock()
+
+def _for_language(indices, build):
+    """Returns the index in `indices` for the current language, calling
+    `build(session)` to create it if there isn't one yet.  Names are only
+    searchable and sortable in the language they were loaded in.
+
+    Only one index is built at a time, so concurrent first requests in a
+    language wait for a single build rather than each doing their own.
+    """
+    language_id = db.pokedex_session.default_language_id
+    try:
+        return indices[language_id]
+    except KeyError:
+        pass
+
+    with _language_lock:
+        if language_id not in indices:
+            indices[language_id] = build(db.pokedex_session)
+    return indices[language_id]
+
+@precompute.index
+def _pokemon_indices():
+    """Returns a dict of `PokemonIndex`es, by language."""
+    return {}
+
+def pokemon_index():
+    """Returns the `PokemonIndex` for the current language."""
+    return _for_language(_pokemon_indices(), PokemonIndex)
+
+
+class MoveIndex(object):
+    """Everything `move_search` can filter or sort on, for every move."""
+
+    def __init__(self, session):
+        q = session.query(
+                t.Move.id,
+                t.Move.names_table.name,
+                t.Move.type_id,
+                t.Move.damage_class_id,
+                t.Move.generation_id,
+                t.Move.target_id,
+                t.Move.effect_id,
+                t.Move.power,
+                t.Move.pp,
+                t.Move.accuracy,
+                t.Move.priority,
+                t.Move.effect_chance,
+                t.MoveMeta.meta_category_id,
+                t.MoveMeta.meta_ailment_id,
+                t.MoveMeta.crit_rate,
+                t.MoveMeta.min_hits,
+                t.MoveMeta.min_turns,
+                t.MoveMeta.recoil,
+                t.MoveMeta.healing,
+                t.MoveMeta.ailment_chance,
+                t.MoveMeta.flinch_chance,
+                t.MoveMeta.stat_chance,
+            ) \
+            .join(t.Move.names_local) \
+            .join(t.MoveEffect) \
+            .outerjoin(t.MoveMeta) \
+            .order_by(t.Move.id)
+        rows = q.all()
+        n = len(rows)
+        columns = zip(*rows) if rows else [()] * 22
+        (move_ids, names, type_ids, damage_class_ids, generation_ids,
+         target_ids, effect_ids, powers, pps, accuracies, priorities,
+         effect_chances, category_ids, ailment_ids, crit_rates, min_hits,
+         min_turns, recoils, healings, ailment_chances, flinch_chances,
+         stat_chances) = columns
+
+        self.move_ids = numpy.array(move_ids, dtype=numpy.int64)
+        self.row_index = dict((id, i) for i, id in enumerate(move_ids))
+        self.names = [_lower(name) for name in names]
+        self.name_ngrams = NgramIndex(self.names)
+
+        self.type_id = _numbers(type_ids)
+        self.damage_class_id = _numbers(damage_class_ids)
+        self.generation_id = _numbers(generation_ids)
+        self.target_id = _numbers(target_ids)
+        self.effect_id = _numbers(effect_ids)
+        self.power = _numbers(powers)
+        self.pp = _numbers(pps)
+        self.accuracy = _numbers(accuracies)
+        self.priority = _numbers(priorities)
+        self.effect_chance = _numbers(effect_chances)
+
+        # Meta; all NaN for moves that don't have any
+        self.meta_category_id = _numbers(category_ids)
+        self.meta_ailment_id = _numbers(ailment_ids)
+        self.recoil = _numbers(recoils)
+        self.healing = _numbers(healings)
+        self.ailment_chance = _numbers(ailment_chances)
+        self.flinch_chance = _numbers(flinch_chances)
+        self.stat_chance = _numbers(stat_chances)
+        self.increased_crit_rate = numpy.array(
+            [crit_rate is not None and crit_rate > 0 for crit_rate in crit_rates],
+            dtype=bool)
+        self.multi_hit = numpy.array(
+            [hits is not None for hits in min_hits], dtype=bool)
+        self.multi_turn = numpy.array(
+            [turns is not None for turns in min_turns], dtype=bool)
+
+        self.flags, self.flag_columns = _membership(self.row_index,
+            session.query(t.MoveFlagMap.move_id, t.MoveFlagMap.move_flag_id),
+            [id for id, in session.query(t.MoveFlag.id)
+                                  .order_by(t.MoveFlag.id)])
+
+        # A move changes each stat at most once, so this can be a matrix of
+        # the changes, with NaN for none
+        stat_ids = [id for id, in session.query(t.Stat.id).order_by(t.Stat.id)]
+        self.stat_change_columns = dict(
+            (id, i) for i, id in enumerate(stat_ids))
+        self.stat_changes = numpy.full((n, len(stat_ids)), numpy.nan)
+        for move_id, stat_id, change in session.query(
+                t.MoveMetaStatChange.move_id,
+                t.MoveMetaStatChange.stat_id,
+                t.MoveMetaStatChange.change):
+            if move_id in self.row_index:
+                self.stat_changes[self.row_index[move_id],
+                                  self.stat_change_columns[stat_id]] = change
+
+        ### Sort orders
+        # Same idea as for Pokémon; the fallback is by name, then id
+        def fallback(row):
+            return _nulls_last(names[row]), move_ids[row]
+
+        def descending(values):
+            return lambda row: \
+                (_nulls_first_descending(values[row]),) + fallback(row)
+
+        def ascending(values):
+            return lambda row: (_nulls_last(values[row]),) + fallback(row)
+
+        type_identifiers = dict(session.query(t.Type.id, t.Type.identifier))
+        effects = dict(
+            session.query(t.Move.id, t.MoveEffect.prose_table.effect)
+            .join(t.Move.move_effect)
+            .join(t.MoveEffect.prose_local))
+        # Strings can't be negated, so sort effects by rank instead
+        effect_texts = [effects.get(move_id) for move_id in move_ids]
+        effect_ranks = dict((text, rank) for rank, text in enumerate(
+            sorted(set(text for text in effect_texts if text is not None))))
+
+        self.sort_orders = {
+            'id': _order(n, lambda row: move_ids[row]),
+            'name': _order(n, fallback),
+            'type': _order(n, ascending(
+                [type_identifiers.get(id) for id in type_ids])),
+            'class': _order(n, ascending(damage_class_ids)),
+            'pp': _order(n, descending(pps)),
+            'power': _order(n, descending(powers)),
+            'accuracy': _order(n, descending(accuracies)),
+            'priority': _order(n, descending(priorities)),
+            'effect_chance': _order(n, descending(effect_chances)),
+            'effect': _order(n, descending(
+                [effect_ranks.get(text) for text in effect_texts])),
+        }
+
+    def __len__(self):
+        return len(self.move_ids)
+
+    def everything(self):
+        """Returns a mask that matches every row."""
+        return numpy.ones(len(self), dtype=bool)
+
+    def rows_for_ids(self, move_ids):
+        """Returns a mask of the rows for the given move ids."""
+        return numpy.in1d(self.move_ids, list(move_ids))
+
+    def sorted_rows(self, mask, sort, backwards=False):
+        """Returns the rows in `mask`, ordered by `sort`, which is one of the
+        keys of `sort_orders`.
+        """
+        order = self.sort_orders[sort]
+        if backwards:
+            order = order[::-1]
+        return order[mask[order]]
+
+@precompute.index
+def _move_indices():
+    """Returns a dict of `MoveIndex`es, by language."""
+    return {}
+
+def move_index():
+    """Returns the `MoveIndex` for the current language."""
+    return _for_language(_move_indices(), MoveIndex)
+
+
+class LearnsetIndex(object):
+    """Every row of `pokemon_moves`, as arrays, sorted by move and by Pokémon
+    so that either can be looked up without scanning the whole thing.
+    """
+
+    def __init__(self, session):
+        rows = session.query(
+            t.PokemonMove.move_id,
+            t.PokemonMove.pokemon_id,
+            t.PokemonMove.version_group_id,
+            t.PokemonMove.pokemon_move_method_id,
+        ).order_by(t.PokemonMove.move_id, t.PokemonMove.pokemon_id).all()
+
+        columns = zip(*rows) if rows else [(), (), (), ()]
+        self.move_ids, self.pokemon_ids, self.version_group_ids, \
+            self.method_ids = [numpy.array(column, dtype=numpy.int64)
+                               for column in columns]
+
+        self.by_pokemon = numpy.argsort(self.pokemon_ids, kind='mergesort')
+        self._sorted_pokemon_ids = self.pokemon_ids[self.by_pokemon]
+
+    def _matching(self, rows, version_group_ids, method_ids):
+        if version_group_ids:
+            rows = rows[numpy.in1d(self.version_group_ids[rows],
+                                   list(version_group_ids))]
+        if method_ids:
+            rows = rows[numpy.in1d(self.method_ids[rows], list(method_ids))]
+        return rows
+
+    def _rows(self, sorted_ids, ids, order=None):
+        ids = numpy.array(sorted(ids), dtype=numpy.int64)
+        starts = numpy.searchsorted(sorted_ids, ids, side='left')
+        ends = numpy.searchsorted(sorted_ids, ids, side='right')
+        rows = [numpy.arange(start, end) for start, end in zip(starts, ends)]
+        if not rows:
+            return numpy.array([], dtype=numpy.intp)
+        rows = numpy.concatenate(rows)
+        if order is not None:
+            rows = order[rows]
+        return rows
+
+    def pokemon_learning(self, move_ids, version_group_ids=None,
+                         method_ids=None):
+        """Returns the ids of Pokémon that learn any of the given moves, in
+        any of the given version groups and by any of the given methods.
+        """
+        rows = self._rows(self.move_ids, move_ids)
+        rows = self._matching(rows, version_group_ids, method_ids)
+        return numpy.unique(self.pokemon_ids[rows])
+
+    def moves_learned_by(self, pokemon_ids, version_group_ids=None,
+                         method_ids=None):
+        """Returns the ids of moves that any of the given Pokémon learn, in
+        any of the given version groups and by any of the given methods.
+        """
+        rows = self._rows(self._sorted_pokemon_ids, pokemon_ids,
+                          self.by_pokemon)
+        rows = self._matching(rows, version_group_ids, method_ids)
+        return numpy.unique(self.move_ids[rows])
+
+@precompute.index
+def learnset_index():
+    """Returns the `LearnsetIndex`."""
+    return LearnsetIndex(db.pokedex_session)
+
+
+@precompute.index
+def result_cache():
+    """Returns the `precompute.ResultCache` for searches against the current
+    data.
+    """
+    return precompute.ResultCache(size=RESULT_CACHE_SIZE)
@@ -0,0 +1,65 @@
+# encoding: utf8
+"""Base stat distributions, for placing a Pokémon's stats among everyone
+else's.
+"""
+from __future__ import absolute_import, division
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+StatDistributions = namedtuple('StatDistributions', ['by_stat', 'totals'])
+
+@precompute.index
+def stat_distributions():
+    """Returns a `StatDistributions`.
+
+    `by_stat` maps stat ids to a sorted list of every Pokémon's base stat,
+    and `totals` is a sorted list of every Pokémon's base stat total.
+    """
+    by_stat = defaultdict(list)
+    totals = defaultdict(int)
+    for pokemon_id, stat_id, base_stat in db.pokedex_session.query(
+            t.PokemonStat.pokemon_id,
+            t.PokemonStat.stat_id,
+            t.PokemonStat.base_stat):
+        by_stat[stat_id].append(base_stat)
+        totals[pokemon_id] += base_stat
+
+    for values in by_stat.values():
+        values.sort()
+
+    return StatDistributions(
+        by_stat=dict(by_stat),
+        totals=sorted(totals.values()),
+    )
+
+def percentile(values, value):
+    """Returns where `value` falls in the sorted list `values`, from 0 to 1.
+    Ties count for half.
+    """
+    if not values:
+        return 0.5
+
+    less = bisect_left(values, value)
+    equal = bisect_right(values, value) - less
+    return (less + equal * 0.5) / len(values)
+
+def stat_percentiles(pokemon):
+    """Returns a dict of stat id to the percentile of `pokemon`'s base stat,
+    plus the key 'total' for the percentile of its base stat total.
+    """
+    distributions = stat_distributions()
+    percentiles = {}
+    for pokemon_stat in pokemon.stats:
+        percentiles[pokemon_stat.stat_id] = percentile(
+            distributions.by_stat.get(pokemon_stat.stat_id, []),
+            pokemon_stat.base_stat)
+
+    percentiles['total'] = percentile(distributions.totals,
+        sum(pokemon_stat.base_stat for pokemon_stat in pokemon.stats))
+    return percentiles
@@ -20,6 +20,7 @@ ${h.form(url.current(), method=u'GET')}
 <dl class="standard-form">
     ${lib.field(u'pokemon')}
     ${lib.field(u'moves')}
+    ${lib.field(u'version_group')}
 
     <dd><button type="submit">Figure it out</button></dd>
 </dl>
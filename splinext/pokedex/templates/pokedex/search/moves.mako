@@ -16,6 +16,19 @@
 <p><a href="${url.current()}"><img src="${h.static_uri('spline', 'icons/eraser.png')}" alt=""> ${_("Start over")}</a></p>
 </%def>
 
+<%def name="pagination()">
+% if c.page_after is not None or c.next_page_after is not None:
+<p>
+    % if c.page_after is not None:
+    <a href="${request.current_route_path(_query=c.page_query)}">${_("First page")}</a>
+    % endif
+    % if c.next_page_after is not None:
+    <a href="${request.current_route_path(_query=c.page_query + [('after', c.next_page_after)])}">${_("Next page")}</a>
+    % endif
+</p>
+% endif
+</%def>
+
 ### RESULTS ###
 ## Based pretty heavily on the Pokémon search results.  Surprise!
 ## Four possibilities here: the form wasn't submitted, the form was submitted
@@ -46,7 +59,7 @@ ${start_over()}
 % elif c.form.is_valid:
 ## Got something
 
-<h1>${len(c.results)} results</h1>
+<h1>${c.total_count} results</h1>
 ${start_over()}
 
 ## Display.  Could be one of several options...
@@ -90,6 +103,7 @@ ${getattr(self, 'col_' + column)()}
 </div>
 
 % endif  ## display_mode
+${pagination()}
 
 % endif  ## search performed
 % endif  ## form submitted
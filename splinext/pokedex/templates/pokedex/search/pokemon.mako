@@ -16,6 +16,19 @@
 <p><a href="${url.current()}"><img src="${h.static_uri('spline', 'icons/eraser.png')}" alt=""> ${_(u"Start over")}</a></p>
 </%def>
 
+<%def name="pagination()">
+% if c.page_after is not None or c.next_page_after is not None:
+<p>
+    % if c.page_after is not None:
+    <a href="${request.current_route_path(_query=c.page_query)}">${_(u"First page")}</a>
+    % endif
+    % if c.next_page_after is not None:
+    <a href="${request.current_route_path(_query=c.page_query + [('after', c.next_page_after)])}">${_(u"Next page")}</a>
+    % endif
+</p>
+% endif
+</%def>
+
 <%
 # Callback for apply_pokemon_template
 def get_icon(pokemon):
@@ -167,6 +180,7 @@ ${dexlib.pokemon_link(result, h.pokedex.apply_pokemon_template(c.display_templat
 </ul>
 
 % endif  ## display_mode
+${pagination()}
 
 % endif  ## search performed
 % endif  ## form submitted
@@ -54,18 +54,18 @@ ${h.h1(_('Essentials'))}
 % else:
     <h2>${_('Damage Dealt')}</h2>
     <ul class="dex-type-list">
-        % for type_efficacy in sorted(c.type.damage_efficacies, key=lambda efficacy: efficacy.target_type.name):
-        <li class="dex-damage-dealt-${type_efficacy.damage_factor}">
-             ${dexlib.type_link(type_efficacy.target_type)} ${h.pokedex.type_efficacy_label[type_efficacy.damage_factor]}
+        % for target_type, damage_factor in c.damage_dealt:
+        <li class="dex-damage-dealt-${damage_factor}">
+             ${dexlib.type_link(target_type)} ${h.pokedex.type_efficacy_label[damage_factor]}
         </li>
         % endfor
     </ul>
 
     <h2>${_(u"Damage Taken")}</h2>
     <ul class="dex-type-list">
-        % for type_efficacy in sorted(c.type.target_efficacies, key=lambda efficacy: efficacy.damage_type.name):
-        <li class="dex-damage-taken-${type_efficacy.damage_factor}">
-             ${dexlib.type_link(type_efficacy.damage_type)} ${h.pokedex.type_efficacy_label[type_efficacy.damage_factor]}
+        % for damage_type, damage_factor in c.damage_taken:
+        <li class="dex-damage-taken-${damage_factor}">
+             ${dexlib.type_link(damage_type)} ${h.pokedex.type_efficacy_label[damage_factor]}
         </li>
         % endfor
     </ul>
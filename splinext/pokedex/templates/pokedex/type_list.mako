@@ -67,8 +67,7 @@ ${h.h1('Type chart')}
     % for type in c.types:
     <tr class="subheader-row">
         <th>${dexlib.type_link(type)}</th>
-        % for efficacy in sorted(type.damage_efficacies, key=lambda _: _.target_type.name):
-        <% damage_factor = efficacy.damage_factor * c.secondary_efficacy[type] / 100 %>\
+        % for damage_factor in c.damage_factors[type]:
         <td class="dex-damage-dealt-${damage_factor}">
             ${h.pokedex.type_efficacy_label[damage_factor]}
         </td>
@@ -103,6 +103,14 @@ def set_up_routes(config):
     config.add_route('dex_gadgets/stat_calculator', '/dex/gadgets/stat_calculator')
     config.add_route('dex_gadgets/whos_that_pokemon', '/dex/gadgets/whos_that_pokemon')
 
+    # JSON API
+    config.add_route('dex_api/abilities', '/dex/api/v1/abilities/{name}')
+    config.add_route('dex_api/capture', '/dex/api/v1/capture/{name}')
+    config.add_route('dex_api/moves', '/dex/api/v1/moves/{name}')
+    config.add_route('dex_api/pokemon', '/dex/api/v1/pokemon/{name}')
+    config.add_route('dex_api/stat_calculator', '/dex/api/v1/stat_calculator')
+    config.add_route('dex_api/types', '/dex/api/v1/types/{name}')
+
     # Conquest pages; specific first, again
     config.add_route('dex_conquest/abilities', '/dex/conquest/abilities/{name}')
     config.add_route('dex_conquest/kingdoms', '/dex/conquest/kingdoms/{name}')
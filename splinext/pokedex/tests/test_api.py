@@ -0,0 +1,131 @@
+# encoding: utf8
+
+import json
+import unittest
+
+import pyramid.httpexceptions as exc
+
+from splinext.pokedex.views import api
+
+from . import base
+from .. import db
+
+class TestSelectFields(unittest.TestCase):
+
+    data = {
+        'name': u'Eevee',
+        'types': [u'normal'],
+        'stats': {u'hp': {'base_stat': 55}, u'speed': {'base_stat': 55}},
+    }
+
+    def test_select_fields(self):
+        u"""Only the requested fields come back, nested ones included."""
+        self.assertEquals(api.select_fields(self.data, ['types']),
+                          {'types': [u'normal']})
+        self.assertEquals(
+            api.select_fields(self.data, ['name', 'stats.hp']),
+            {'name': u'Eevee', 'stats': {u'hp': {'base_stat': 55}}})
+
+    def test_missing_field(self):
+        self.assertRaises(KeyError, api.select_fields, self.data, ['color'])
+        self.assertRaises(KeyError, api.select_fields, self.data,
+                          ['types.normal'])
+
+class TestAPI(base.TestCase):
+
+    def fetch(self, view, name, **params):
+        request = base.request_factory(matchdict={'name': name},
+                                       params=params)
+        en = db.get_by_identifier_query(db.t.Language, u'en').first()
+        request.tmpl_context.game_language = en
+        return view(request)
+
+    def test_pokemon(self):
+        response = self.fetch(api.pokemon_view, u'eevee')
+        data = json.loads(response.body)
+        self.assertEquals(data['identifier'], u'eevee')
+        self.assertEquals(data['types'], [u'normal'])
+        self.assertEquals(data['type_efficacies'][u'ghost'], 0)
+        self.assert_(0 < data['stats'][u'hp']['percentile'] < 1)
+        self.assert_(response.etag)
+
+    def test_fields(self):
+        response = self.fetch(api.pokemon_view, u'eevee',
+                              fields=u'types,stat_total.value')
+        self.assertEquals(json.loads(response.body),
+                          {'types': [u'normal'], 'stat_total': {'value': 325}})
+
+        self.assertRaises(exc.HTTPBadRequest, self.fetch, api.pokemon_view,
+                          u'eevee', fields=u'favorite_color')
+
+    def test_not_found(self):
+        self.assertRaises(exc.HTTPNotFound, self.fetch, api.move_view,
+                          u'not a move')
+
+    def test_stat_calculator(self):
+        # A level 100 Eevee with all 31s and no effort
+        request = base.request_factory()
+        request.json_body = {'pokemon': [
+            {
+                'pokemon': u'eevee',
+                'hidden_power': u'dark',
+                'data': [{'level': 100, 'stats': {
+                    u'hp': 251, u'attack': 146, u'defense': 136,
+                    u'special-attack': 126, u'special-defense': 166,
+                    u'speed': 146,
+                }}],
+            },
+            {'pokemon': u'eevee', 'nature': u'grumpy', 'data': []},
+        ]}
+        data = json.loads(api.stat_calculator_view(request).body)
+        eevee, bogus = data['results']
+
+        self.assertEquals(eevee['genes'][u'hp'], [31])
+        self.assertEquals(eevee['stat_ranges'][u'hp'], [[220, 251]])
+        self.assertEquals(eevee['hidden_power'],
+                          {'type': u'dark', 'power': 70})
+        self.assertTrue('error' in bogus)
+
+        request.json_body = {'pokemon': u'eevee'}
+        self.assertRaises(exc.HTTPBadRequest, api.stat_calculator_view,
+                          request)
+
+    def test_stat_calculator_hidden_power_types(self):
+        # Hidden Power is only ever Fighting through Dark
+        request = base.request_factory()
+        request.json_body = {'pokemon': [
+            {
+                'pokemon': u'eevee',
+                'hidden_power': hidden_power,
+                'data': [{'level': 100, 'stats': {
+                    u'hp': 251, u'attack': 146, u'defense': 136,
+                    u'special-attack': 126, u'special-defense': 166,
+                    u'speed': 146,
+                }}],
+            }
+            for hidden_power in [u'fairy', u'normal', u'fighting']
+        ]}
+        data = json.loads(api.stat_calculator_view(request).body)
+        fairy, normal, fighting = data['results']
+
+        self.assertTrue('error' in fairy)
+        self.assertTrue('error' in normal)
+        self.assertFalse('error' in fighting)
+
+    def test_capture(self):
+        response = self.fetch(api.capture_view, u'eevee', hp_step=u'50')
+        data = json.loads(response.body)
+        self.assertEquals(data['hp_percents'], [50, 100])
+
+        # Statuses × HP, and better when the Pokémon is asleep and hurt
+        great_ball = data['balls'][u'great-ball']['chance']
+        self.assertEquals(len(great_ball), 3)
+        self.assert_(great_ball[2][0] > great_ball[0][1])
+
+        timer_ball = data['balls'][u'timer-ball']
+        self.assertEquals(len(timer_ball['chance']), 30)
+        self.assert_(timer_ball['chance'][-1][0][0] >
+                     timer_ball['chance'][0][0][0])
+
+        self.assertRaises(exc.HTTPBadRequest, self.fetch, api.capture_view,
+                          u'eevee', hp_step=u'7')
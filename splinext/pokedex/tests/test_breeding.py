@@ -0,0 +1,65 @@
+# encoding: utf8
+
+from splinext.pokedex import breeding
+from splinext.pokedex import db
+
+from . import base
+
+class TestBreeding(base.TestCase):
+
+    def compatible(self, identifier):
+        species = db.get_by_identifier_query(
+            db.t.PokemonSpecies, identifier).one()
+        return [s.identifier for s in breeding.compatible_families(species)]
+
+    def test_special_cases(self):
+        u"""Genderless Pokémon can only breed with Ditto, and No Eggs Pokémon
+        can't breed at all.
+        """
+        self.assertEquals(self.compatible(u'magnemite'), [u'ditto'])
+        self.assertEquals(self.compatible(u'mewtwo'), [])
+
+    def test_base_forms(self):
+        u"""Only the base form of each family is listed, which is the form
+        after a baby if there is one.
+        """
+        families = self.compatible(u'pikachu')
+        self.assert_(u'ditto' in families, 'Ditto breeds with anything')
+        self.assert_(u'pikachu' in families, 'baby-less base form is listed')
+        self.assert_(u'pichu' not in families, 'babies are not')
+        self.assert_(u'raichu' not in families, 'evolved forms are not')
+        self.assertEquals(families, sorted(families, key=lambda identifier:
+            db.get_by_identifier_query(db.t.PokemonSpecies, identifier)
+                .one().id), 'families are in id order')
+
+    def test_single_gender(self):
+        u"""Male-only Pokémon can't breed with other male-only Pokémon."""
+        families = self.compatible(u'tauros')
+        self.assert_(u'nidoran-m' not in families)
+        self.assert_(u'nidoran-f' in families)
+
+    def test_chain_breeding_tree(self):
+        u"""Egg groups are placed as close to the target as they can be, and
+        each lists its own Pokémon that learn the move.
+        """
+        pikachu = db.get_by_identifier_query(db.t.Pokemon, u'pikachu').one()
+        move = db.get_by_identifier_query(db.t.Move, u'tackle').one()
+        version_group = db.get_by_identifier_query(
+            db.t.VersionGroup, u'black-white').one()
+        tree, pokemon_by_egg_group = breeding.chain_breeding_tree(
+            pikachu, move.id, version_group.id)
+
+        self.assertEquals(tree['node'], 'me')
+        self.assert_(tree['adjacent'], 'Field Pokémon learn Tackle')
+        seen = set()
+        level = tree['adjacent']
+        while level:
+            groups = set(node['node'] for node in level)
+            self.assertFalse(groups & seen, 'groups appear on one level')
+            seen.update(groups)
+            level = [child for node in level for child in node['adjacent']]
+
+        self.assertEquals(seen, set(pokemon_by_egg_group))
+        for egg_group, pokemon in pokemon_by_egg_group.items():
+            for one_pokemon in pokemon:
+                self.assert_(egg_group in one_pokemon.species.egg_groups)
@@ -0,0 +1,105 @@
+# encoding: utf8
+from __future__ import division
+
+import unittest
+
+import numpy
+import pokedex.formulae
+
+from splinext.pokedex import capture
+
+def expected_attempts_oh_no(partitions):
+    u"""The old turn-by-turn version of `capture.expected_attempts`, from the
+    capture rate gadget.  `partitions` is a list of `(catch_chance,
+    number_of_turns)`, with None for the final number of turns.
+    """
+    turn = 0        # current turn
+    p_got_here = 1  # probability that we HAVE NOT caught the Pokémon yet
+    expected_attempts = 0
+
+    for catch_chance, number_of_turns in partitions:
+        if number_of_turns is None:
+            expected_attempts += p_got_here * (1 / catch_chance + turn)
+            break
+
+        for _ in range(number_of_turns):
+            turn += 1
+            expected_attempts += p_got_here * catch_chance * turn
+            p_got_here *= 1 - catch_chance
+
+    return expected_attempts
+
+class TestCapture(unittest.TestCase):
+
+    def test_capture_chances(self):
+        u"""The vectorized formula agrees with pokedex's own."""
+        percent_hp = numpy.arange(1, 101) / 100
+        for capture_rate in (3, 45, 190, 255):
+            for status_bonus in (10, 15, 20):
+                chances = capture.capture_chances(capture_rate,
+                    percent_hp[:, None],
+                    ball_bonus=numpy.array(capture.BALL_BONUSES),
+                    status_bonus=status_bonus)
+                for i in (0, 49, 99):
+                    for j, ball_bonus in enumerate(capture.BALL_BONUSES):
+                        expected = pokedex.formulae.capture_chance(
+                            percent_hp=(i + 1) / 100,
+                            capture_rate=capture_rate,
+                            ball_bonus=ball_bonus,
+                            status_bonus=status_bonus)
+                        self.assertTrue(
+                            numpy.allclose(chances[i, j], expected))
+
+    def test_chance_table(self):
+        table = capture.ChanceTable(45, 0.5, status_bonus=15)
+        self.assertTrue(numpy.allclose(table(capture_bonus=40),
+            pokedex.formulae.capture_chance(percent_hp=0.5, capture_rate=45,
+                status_bonus=15, capture_bonus=40)))
+        self.assertEquals(table(2550)[0], 1.0)
+
+    def test_expected_attempts(self):
+        self.assertAlmostEquals(capture.expected_attempts([0.25]), 4)
+
+        # Quick Ball: catch on the first turn, or carry on at the usual rate
+        self.assertAlmostEquals(capture.expected_attempts([0.5, 0.25], [1]),
+                                0.5 * 1 + 0.5 * (4 + 1))
+
+        # Several Pokémon at once
+        self.assertTrue(numpy.allclose(
+            capture.expected_attempts([[0.5, 0.25], [1.0, 0.25]], [2]),
+            [0.5 + 0.5 * 0.5 * 2 + 0.25 * (4 + 2), 1.0]))
+
+    def test_expected_attempts_by_turn(self):
+        u"""The closed form agrees with counting turn by turn, for Timer and
+        Quick Balls.
+        """
+        for capture_rate in (3, 45, 190, 255):
+            timer = capture.capture_chances(capture_rate, 0.5,
+                ball_bonus=numpy.array([min(40, turn + 10)
+                                        for turn in range(1, 31)]))[:, 0]
+            self.assertAlmostEquals(
+                capture.expected_attempts(timer, [1] * 29),
+                expected_attempts_oh_no(
+                    [(chance, 1) for chance in timer[:-1]]
+                    + [(timer[-1], None)]))
+
+            quick = capture.capture_chances(capture_rate, 0.5,
+                ball_bonus=numpy.array([40, 10]))[:, 0]
+            self.assertAlmostEquals(
+                capture.expected_attempts(quick, [1]),
+                expected_attempts_oh_no([(quick[0], 1), (quick[1], None)]))
+
+    def test_heatmap(self):
+        heatmap = capture.heatmap(45, [(u'great-ball', dict(ball_bonus=15))],
+                                  [0.5, 1.0])
+        chances = numpy.array(heatmap[u'great-ball']['chance'])
+        self.assertEquals(chances.shape, (3, 2))
+        self.assertTrue(numpy.allclose(chances[0],
+            [capture.capture_chances(45, 0.5, ball_bonus=15)[0],
+             capture.capture_chances(45, 1.0, ball_bonus=15)[0]],
+            atol=1e-4))
+
+        quick = numpy.array(heatmap[u'quick-ball']['chance'])
+        self.assertEquals(quick.shape, (2, 3, 2))
+        self.assertEquals(
+            numpy.array(heatmap[u'nest-ball']['chance']).shape, (30, 3, 2))
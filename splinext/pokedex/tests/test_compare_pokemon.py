@@ -30,3 +30,31 @@ class TestComparePokemon(base.TestCase):
         res = self.do_request(u'trtle')
         self.assert_(res.tmpl_context.found_pokemon[0].suggestions is not None, 'bad misspelling matches several times...')
         self.assert_(res.tmpl_context.found_pokemon[0].pokemon is not None, '...but something is still used')
+
+    def test_comparison_data(self):
+        u"""Relative numbers run from 0 to 1 between the lowest and highest
+        value, and a repeated comparison comes from the cache.
+        """
+        res = self.do_request(u'eevee', u'snorlax')
+        c = res.tmpl_context
+        eevee, snorlax = [fp.pokemon for fp in c.found_pokemon[:2]]
+        self.assertEquals(c.relatives[u'Base stat total'][eevee][1], 0.0)
+        self.assertEquals(c.relatives[u'Base stat total'][snorlax][1], 1.0)
+        self.assertEquals(c.relatives[u'Base stat total'][snorlax][0],
+                          sum(stat.base_stat for stat in snorlax.stats))
+        self.assert_(any(eevee in pokemon and snorlax in pokemon
+                         for moves in c.moves.values()
+                         for pokemon in moves.values()),
+                     'both learn something in common')
+
+        cache = gadgets._comparison_cache()
+        hits = cache.hits
+        res = self.do_request(u'snorlax', u'eevee')
+        self.assertEquals(cache.hits, hits + 1, 'order does not matter')
+        self.assertEquals(
+            dict((label, dict((p.identifier, numbers)
+                              for p, numbers in values.items()))
+                 for label, values in res.tmpl_context.relatives.items()),
+            dict((label, dict((p.identifier, numbers)
+                              for p, numbers in values.items()))
+                 for label, values in c.relatives.items()))
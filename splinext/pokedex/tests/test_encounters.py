@@ -0,0 +1,77 @@
+# encoding: utf8
+from collections import defaultdict
+
+import pokedex.db.tables as t
+
+from splinext.pokedex import db
+from splinext.pokedex import encounters
+
+from . import base
+
+class TestEncounters(base.TestCase):
+
+    @staticmethod
+    def old_grouping(q):
+        u"""Groups raw encounters the way the pages used to: by area, method,
+        Pokémon, version, and condition values, adding together the rarities
+        of identical level ranges.
+        """
+        grouped = defaultdict(list)
+        for encounter in q:
+            encounter_bits = grouped[
+                encounter.location_area.id,
+                encounter.slot.method.id,
+                encounter.pokemon.id,
+                encounter.version.id,
+                tuple(sorted(cv.id for cv in encounter.condition_values)),
+            ]
+
+            existing_encounter = filter(
+                lambda enc: enc['min_level'] == encounter.min_level
+                        and enc['max_level'] == encounter.max_level,
+                encounter_bits)
+            if existing_encounter:
+                existing_encounter[0]['rarity'] += encounter.slot.rarity
+            else:
+                encounter_bits.append({
+                    'min_level': encounter.min_level,
+                    'max_level': encounter.max_level,
+                    'rarity': encounter.slot.rarity,
+                })
+
+        return dict(
+            (key, sorted((bits['min_level'], bits['max_level'], bits['rarity'])
+                         for bits in encounter_bits))
+            for key, encounter_bits in grouped.items())
+
+    @staticmethod
+    def new_grouping(summaries):
+        return dict(
+            ((summary.location_area.id, summary.method.id, summary.pokemon.id,
+              summary.version.id,
+              tuple(sorted(cv.id for cv in summary.condition_values))),
+             sorted((level['min_level'], level['max_level'], level['rarity'])
+                    for level in summary.levels))
+            for summary in summaries)
+
+    def test_pokemon_encounters(self):
+        u"""A Pokémon's summaries match its grouped encounters."""
+        pokemon = db.pokemon_query(u'Pikachu').one()
+        q = db.pokedex_session.query(t.Encounter) \
+            .filter(t.Encounter.pokemon_id == pokemon.id)
+
+        summaries = encounters.pokemon_encounters(pokemon)
+        self.assertTrue(summaries)
+        self.assertEquals(self.new_grouping(summaries), self.old_grouping(q))
+
+    def test_area_encounters(self):
+        u"""An area's summaries match its grouped encounters."""
+        location = db.get_by_identifier_query(t.Location,
+                                              u'viridian-forest').one()
+        q = db.pokedex_session.query(t.Encounter) \
+            .filter(t.Encounter.location_area_id.in_(
+                area.id for area in location.areas))
+
+        summaries = encounters.area_encounters(location.areas)
+        self.assertTrue(summaries)
+        self.assertEquals(self.new_grouping(summaries), self.old_grouping(q))
@@ -0,0 +1,74 @@
+# encoding: utf8
+import pokedex.db.tables as t
+
+from splinext.pokedex import db
+from splinext.pokedex import evolution
+
+from . import base
+
+class TestSpeciesTopology(base.TestCase):
+
+    def topology(self, identifier):
+        species = db.get_by_identifier_query(t.PokemonSpecies,
+                                             identifier).one()
+        return evolution.species_topology()[species.id]
+
+    def species_id(self, identifier):
+        return db.get_by_identifier_query(t.PokemonSpecies,
+                                          identifier).one().id
+
+    def test_branching(self):
+        u"""Tyrogue is a baby with several evolutions."""
+        tyrogue = self.topology(u'tyrogue')
+        self.assertEquals(tyrogue.stage, u'baby')
+        self.assertEquals(tyrogue.position, u'first')
+        self.assertTrue(tyrogue.branching)
+        self.assertFalse(tyrogue.branched)
+
+        hitmonlee = self.topology(u'hitmonlee')
+        self.assertEquals(hitmonlee.stage, u'basic')
+        self.assertEquals(hitmonlee.position, u'last')
+        self.assertFalse(hitmonlee.branching)
+        self.assertTrue(hitmonlee.branched)
+        self.assertEquals(hitmonlee.root_id, self.species_id(u'tyrogue'))
+
+    def test_branched(self):
+        u"""Shedinja is one of Nincada's two evolutions."""
+        nincada = self.topology(u'nincada')
+        self.assertTrue(nincada.branching)
+
+        shedinja = self.topology(u'shedinja')
+        self.assertEquals(shedinja.stage, u'stage1')
+        self.assertEquals(shedinja.position, u'last')
+        self.assertFalse(shedinja.branching)
+        self.assertTrue(shedinja.branched)
+        self.assertEquals(shedinja.root_id, self.species_id(u'nincada'))
+
+    def test_baby_chain(self):
+        u"""Babies don't count towards a species' stage."""
+        pichu = self.topology(u'pichu')
+        pikachu = self.topology(u'pikachu')
+        raichu = self.topology(u'raichu')
+
+        self.assertEquals(
+            [(pichu.stage, pichu.position),
+             (pikachu.stage, pikachu.position),
+             (raichu.stage, raichu.position)],
+            [(u'baby', u'first'), (u'basic', u'middle'),
+             (u'stage1', u'last')])
+
+        pichu_id = self.species_id(u'pichu')
+        self.assertEquals(
+            [pichu.root_id, pikachu.root_id, raichu.root_id], [pichu_id] * 3)
+        self.assertTrue(pichu.chain_position < pikachu.chain_position
+                        < raichu.chain_position)
+
+    def test_single_stage(self):
+        u"""A species that doesn't evolve is alone in its chain."""
+        tauros = self.topology(u'tauros')
+        self.assertEquals(tauros.stage, u'basic')
+        self.assertEquals(tauros.position, u'only')
+        self.assertFalse(tauros.branching)
+        self.assertFalse(tauros.branched)
+        self.assertEquals(tauros.root_id, self.species_id(u'tauros'))
+        self.assertEquals(tauros.chain_position, 0)
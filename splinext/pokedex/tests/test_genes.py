@@ -0,0 +1,76 @@
+# encoding: utf8
+import unittest
+
+import numpy
+import pokedex.formulae
+
+from splinext.pokedex import genes
+
+class TestGenes(unittest.TestCase):
+
+    def test_calculated_stats(self):
+        u"""The vectorized formulae agree with pokedex's own."""
+        levels = numpy.arange(1, 101)[:, None]
+        for base_stat in (1, 45, 255):
+            for effort in (0, 85, 255):
+                for nature in (0.9, 1.0, 1.1):
+                    stats = genes.calculated_stats(
+                        base_stat, levels, genes.GENES, effort, nature, False)
+                    hp = genes.calculated_stats(
+                        base_stat, levels, genes.GENES, effort, nature, True)
+                    for level in (1, 50, 100):
+                        for gene in (0, 17, 31):
+                            self.assertEquals(stats[level - 1, gene],
+                                pokedex.formulae.calculated_stat(
+                                    base_stat, level=level, iv=gene,
+                                    effort=effort, nature=nature))
+                            self.assertEquals(hp[level - 1, gene],
+                                pokedex.formulae.calculated_hp(
+                                    base_stat, level=level, iv=gene,
+                                    effort=effort))
+
+    def test_solve(self):
+        # A level 50 Eevee with 0 effort and genes 0, 10, 20, 31, 31, 31
+        base_stats = [55, 55, 50, 45, 65, 55]
+        natures = [1.0] * 6
+        is_hp = [True] + [False] * 5
+        real = [0, 10, 20, 31, 31, 31]
+        stats = genes.calculated_stats(numpy.array(base_stats), 50,
+            numpy.array(real), 0, numpy.array(natures), numpy.array(is_hp))
+
+        solution = genes.solve(base_stats, natures, is_hp,
+                               [50], [stats], [[0] * 6])
+        for bits, gene in zip(solution.genes, real):
+            self.assertTrue(gene in genes.to_genes(bits))
+            self.assertTrue(len(genes.to_genes(bits)) <= 2)
+        self.assertEquals(solution.ranges[0, 0].tolist(), [115, 130])
+        self.assert_(50 < solution.next_useful_level <= 100)
+
+        # Unknown base stats allow anything
+        solution = genes.solve([0] * 6, natures, is_hp,
+                               [50], [stats], [[0] * 6])
+        self.assertEquals(solution.genes, [genes.ALL_GENES] * 6)
+        self.assertEquals(solution.next_useful_level, 100)
+
+    def test_hidden_power(self):
+        self.assertEquals(genes.hidden_power([31] * 6), (15, 70))
+        self.assertEquals(genes.hidden_power([30] * 6), (0, 70))
+
+        # Fighting needs the last three stats to be even
+        bits = genes.hidden_power_bits(0)
+        self.assertEquals(bits[:3], [genes.ALL_GENES] * 3)
+        for stat_bits in bits[3:]:
+            self.assertEquals(genes.to_genes(stat_bits), range(0, 32, 2))
+
+    def test_characteristic(self):
+        # Highest gene is the first stat's, and it's 1 mod 5
+        narrowed = genes.apply_characteristic(
+            [genes.ALL_GENES, genes.to_bits(numpy.arange(32) >= 20)],
+            0, 1)
+        self.assertEquals(genes.to_genes(narrowed[0]), [21, 26, 31])
+        self.assertEquals(genes.to_genes(narrowed[1]), range(20, 32))
+
+        # Nothing left for the hinted stat means nothing left for the others
+        narrowed = genes.apply_characteristic(
+            [genes.to_bits(genes.GENES == 0), genes.ALL_GENES], 0, 1)
+        self.assertEquals(narrowed, [0, 0])
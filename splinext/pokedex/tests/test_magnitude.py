@@ -3,7 +3,7 @@ from math import floor, log10
 
 from unittest import TestCase
 
-from splinext.pokedex.magnitude import parse_size
+from splinext.pokedex.magnitude import parse_size, parse_sizes
 
 class TestSizeParsing(TestCase):
     u"""Provides `assert_same` to the height and weight test classes.  Each
@@ -111,6 +111,15 @@ class TestHeightParsing(TestSizeParsing):
 
         self.assert_same('3ft.2in0.5m..3km', '501.4652 meters')
 
+    def test_batch(self):
+        u"""Several heights at once, with None for anything bogus"""
+
+        results = parse_sizes(['1 meter', '5', '1 kilo', '3 ft'],
+                              self.height_or_weight)
+        self.assertEquals(results[1:3], [None, None])
+        self.assertAlmostEquals(results[0], 10)
+        self.assertAlmostEquals(results[3], 9.144)
+
 class TestWeightParsing(TestSizeParsing):
     height_or_weight = 'weight'
 
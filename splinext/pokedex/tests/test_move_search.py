@@ -1,5 +1,8 @@
 # encoding: utf8
 
+import pokedex.db.tables as t
+
+from splinext.pokedex import db
 import splinext.pokedex.views.search
 from splinext.pokedex.views.search import MoveSearchForm
 
@@ -378,6 +381,45 @@ class TestMoveSearchController(base.TestCase):
             'multi-turn',
         )
 
+    def test_sort_effect_chance(self):
+        u"""Sorting by effect chance puts moves without one first, then the
+        rest from most to least likely, and works alongside a stat change
+        range.
+        """
+        results = self.do_search(
+            stat_change_special_defense=u'-2..-1',
+            display='custom-list',
+            sort='effect_chance',
+        ).tmpl_context.results
+
+        special_defense = db.get_by_identifier_query(
+            t.Stat, u'special-defense').one()
+        changes = dict(db.pokedex_session.query(
+                t.MoveMetaStatChange.move_id,
+                t.MoveMetaStatChange.change)
+            .filter_by(stat_id=special_defense.id))
+        for move in results:
+            self.assertTrue(-2 <= changes.get(move.id) <= -1,
+                "{0} lowers Sp. Def by 1 or 2".format(move.identifier))
+
+        identifiers = [move.identifier for move in results]
+        for identifier in [u'fake-tears', u'acid-spray', u'luster-purge',
+                           u'shadow-ball', u'psychic']:
+            self.assertIn(identifier, identifiers)
+        self.assertTrue(identifiers.index(u'fake-tears')
+                        < identifiers.index(u'acid-spray')
+                        < identifiers.index(u'luster-purge')
+                        < identifiers.index(u'shadow-ball')
+                        < identifiers.index(u'psychic'))
+
+        chances = [move.effect_chance for move in results]
+        with_chance = [chance for chance in chances if chance is not None]
+        self.assertEquals(chances,
+            [None] * (len(chances) - len(with_chance)) + with_chance,
+            'moves without an effect chance come first')
+        self.assertEquals(with_chance, sorted(with_chance, reverse=True),
+            'effect chances are descending')
+
     def test_sort(self):
         """Make sure all the sort methods actually work."""
         sort_field = MoveSearchForm.sort
@@ -402,3 +444,50 @@ class TestMoveSearchController(base.TestCase):
             response.tmpl_context.results,
             """Custom table columns don't crash""".format(value)
         )
+
+    def test_export(self):
+        u"""Exports stream the custom table columns as CSV or JSON lines."""
+        request = base.request_factory(params=dict(
+            name=u'flamethrower', display='custom-table',
+            column=[u'name', u'type', u'power'], export='csv'))
+        response = splinext.pokedex.views.search.move_search(request)
+        self.assertEquals(response.content_type, 'text/csv')
+        self.assertEquals(''.join(response.app_iter).splitlines(),
+                          ['name,type,power', 'Flamethrower,Fire,90'])
+
+        request = base.request_factory(params=dict(
+            name=u'flamethrower', display='custom-table',
+            column=[u'name', u'power'], export='jsonl'))
+        response = splinext.pokedex.views.search.move_search(request)
+        self.assertEquals(''.join(response.app_iter),
+                          '{"name": "Flamethrower", "power": 90}\n')
+
+    def test_export_session(self):
+        u"""Exports load with their own session, which is closed when the
+        stream ends, early or not.
+        """
+        sessions = []
+        standalone_session = db.standalone_session
+        def record_session():
+            sessions.append(standalone_session())
+            return sessions[-1]
+
+        db.standalone_session = record_session
+        try:
+            for drain in (True, False):
+                request = base.request_factory(params=dict(
+                    name=u'*thrower', display='custom-table',
+                    column=[u'name'], export='csv'))
+                response = splinext.pokedex.views.search.move_search(request)
+                if drain:
+                    list(response.app_iter)
+                else:
+                    next(iter(response.app_iter))
+                    next(iter(response.app_iter))
+                    response.app_iter.close()
+
+                self.assertEquals(len(sessions[-1].identity_map), 0)
+        finally:
+            db.standalone_session = standalone_session
+
+        self.assertEquals(len(sessions), 2)
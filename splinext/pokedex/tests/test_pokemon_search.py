@@ -1,6 +1,10 @@
 # encoding: utf8
 
+import sqlalchemy
+
 import splinext.pokedex.views.search
+from splinext.pokedex import db
+from splinext.pokedex import helpers as pokedex_helpers
 from splinext.pokedex.views.search import PokemonSearchForm
 
 from . import base
@@ -699,6 +703,25 @@ class TestPokemonSearchController(base.TestCase):
                 """Sort by {0} doesn't crash""".format(value)
             )
 
+    def test_evolution_chain_pages(self):
+        u"""Sorting by evolution chain never splits a family across pages, so
+        the template can indent each page from scratch.
+        """
+        first = self.do_search(sort=u'evolution-chain',
+                               display=u'custom-table').tmpl_context
+        self.assertTrue(first.next_page_after)
+
+        second = self.do_search(sort=u'evolution-chain',
+                                display=u'custom-table',
+                                after=unicode(first.next_page_after)) \
+            .tmpl_context
+        last, = [result for result in first.results
+                 if result.id == first.next_page_after]
+        head = second.results[0]
+        self.assertNotEquals(head.species.evolution_chain_id,
+                             last.species.evolution_chain_id)
+        self.assertEquals(head.species.parent_species, None)
+
     def test_display_custom_table(self):
         """Try spitting out a custom table with every column, and make sure it
         doesn't explode.
@@ -715,6 +738,86 @@ class TestPokemonSearchController(base.TestCase):
         )
 
 
+    def test_display_custom_table_relations(self):
+        u"""Relations for the visible columns are loaded onto the results."""
+        response = self.do_search(name=u'eevee', display='custom-table',
+            column=[u'type', u'ability', u'egg_group', u'stat_hp'])
+        results = response.tmpl_context.results
+        self.assertEquals(len(results), 1)
+
+        eevee, = results
+        loaded = eevee.__dict__
+        self.assertEquals([type_.identifier for type_ in loaded['types']],
+                          [u'normal'])
+        self.assertEquals(len(loaded['abilities']), 2)
+        self.assertEquals(
+            [group.identifier for group in eevee.species.egg_groups],
+            [u'ground'])
+        self.assertEquals(loaded['stats'][0].stat.identifier, u'hp')
+
+    def test_display_custom_list_relations(self):
+        u"""Only the relations a custom list's fields use are loaded."""
+        response = self.do_search(name=u'eevee', display='custom-list',
+                                  format=u'$name: $type1 ($hp)')
+        c = response.tmpl_context
+        self.assertEquals(c.display_template.relations,
+                          ['default_form', 'types', 'stats.stat'])
+
+        eevee, = c.results
+        loaded = eevee.__dict__
+        self.assertTrue('types' in loaded)
+        self.assertFalse('abilities' in loaded)
+        self.assertEquals(
+            pokedex_helpers.apply_pokemon_template(c.display_template, eevee),
+            u'Eevee: Normal (55)')
+
+    def test_export_queries(self):
+        u"""Exports load what the columns need a chunk at a time, so the
+        number of queries doesn't grow with the number of Pokémon.
+        """
+        engine = db.pokedex_session.get_bind()
+        def count_queries(name):
+            statements = []
+            def record(*args):
+                statements.append(args)
+            sqlalchemy.event.listen(engine, 'before_cursor_execute', record)
+            try:
+                request = base.request_factory(params=dict(
+                    name=name, display='custom-table',
+                    column=[u'name', u'genus', u'growth_rate'],
+                    export='csv'))
+                response = splinext.pokedex.views.search.pokemon_search(
+                    request)
+                lines = ''.join(response.app_iter).splitlines()
+            finally:
+                sqlalchemy.event.remove(engine, 'before_cursor_execute',
+                                        record)
+            return len(lines) - 1, len(statements)
+
+        # Build the search index first, so that doesn't get counted
+        count_queries(u'eevee')
+
+        one, one_queries = count_queries(u'vaporeon')
+        several, several_queries = count_queries(u'*eon')
+        self.assertEquals(one, 1)
+        self.assertTrue(several > 1)
+        self.assertTrue(several_queries <= one_queries + 1,
+            "{0} queries for {1} Pokémon, but {2} for one".format(
+                several_queries, several, one_queries))
+
+    def test_cached_form(self):
+        u"""Form classes and choices are shared between requests, but still
+        validate.
+        """
+        first = self.do_search(type=u'normal').tmpl_context.form
+        second = self.do_search(type=u'fire').tmpl_context.form
+        self.assertIs(type(first), type(second))
+        self.assertEquals([type_.identifier for type_ in second.type.data],
+                          [u'fire'])
+
+        form = self.do_search(type=u'sound').tmpl_context.form
+        self.assertFalse(form.is_valid)
+
     def test_crash_vague_join(self):
         """Tests for crashes that occur when searching by evolution position
         and sorting by some other criterion, because the join between 'pokemon'
@@ -0,0 +1,134 @@
+# encoding: utf8
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from splinext.pokedex import db
+from splinext.pokedex import movetables
+from splinext.pokedex import precompute
+from splinext.pokedex.precompute import PrecomputedStore, ResultCache
+
+from . import base
+
+class TestResultCache(unittest.TestCase):
+
+    def test_result_cache(self):
+        cache = ResultCache(size=2)
+        self.assertEquals(cache.get_or_search('a', lambda: 1), (1, False))
+        self.assertEquals(cache.get_or_search('a', lambda: 2), (1, True))
+        cache.get_or_search('b', lambda: 3)
+        cache.get_or_search('a', lambda: 4)
+        cache.get_or_search('c', lambda: 5)
+
+        # 'b' was the least recently used, so it got dropped
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.get_or_search('b', lambda: 6), (6, False))
+        self.assertEquals(cache.get_or_search('c', lambda: 7), (5, True))
+        self.assertEquals((cache.hits, cache.misses), (2, 4))
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'precomputed')
+        precompute.connect({'spline-pokedex.data_version': 'new'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        precompute.connect(base.settings)
+
+    def test_round_trip(self):
+        value = {u'a': [1, 2.5, None, u'é'], u'b': {u'c': True}}
+        self.assertEquals(PrecomputedStore.loads(PrecomputedStore.dumps(value)),
+                          value)
+
+    def test_file(self):
+        PrecomputedStore.write_file(self.filename, 'new',
+                                    [('thing', 1, [1, (2, 3)])])
+        store = PrecomputedStore(self.filename)
+        self.assertEquals(store.get_or_build('thing', 1, lambda: u'built'),
+                          [1, [2, 3]])
+        self.assertEquals(store.get_or_build('thing', 2, lambda: (4, 5)),
+                          [4, 5], 'missing values are built, as JSON')
+
+    def test_stale_file(self):
+        u"""A file built from some other data version is ignored."""
+        PrecomputedStore.write_file(self.filename, 'old',
+                                    [('thing', 1, [1, 2])])
+        store = PrecomputedStore(self.filename)
+        self.assertEquals(store.get_or_build('thing', 1, lambda: [3]), [3])
+
+    def test_cache_size(self):
+        store = PrecomputedStore(cache_size=1)
+        built = []
+        def build():
+            built.append(None)
+            return len(built)
+
+        self.assertEquals(store.get_or_build('thing', 1, build), 1)
+        self.assertEquals(store.get_or_build('thing', 1, build), 1)
+        self.assertEquals(store.get_or_build('thing', 2, build), 2)
+        self.assertEquals(store.get_or_build('thing', 1, build), 3,
+                          'least recently used values are dropped')
+
+class TestMoveTables(base.TestCase):
+
+    def assert_same_table(self, identifier):
+        pokemon = db.get_by_identifier_query(db.t.Pokemon, identifier).one()
+        built = movetables.build_pokemon_move_table(pokemon)
+        data = movetables.serialize_pokemon_move_table(*built)
+        loaded = movetables.load_pokemon_move_table(
+            json.loads(json.dumps(data)))
+
+        built_table, built_columns, built_tutors = built
+        table, columns, tutors = loaded
+        self.assertEquals(columns, built_columns)
+        self.assertEquals(tutors, built_tutors)
+        self.assertEquals([method.id for method, _ in table],
+                          [method.id for method, _ in built_table])
+
+        for (method, rows), (_, built_rows) in zip(table, built_table):
+            rows = map(self.cells, rows)
+            built_rows = map(self.cells, built_rows)
+            if method.identifier not in (u'level-up', u'machine'):
+                # Sorted by name on the way out, rather than in the table
+                rows.sort(key=lambda (move, cells): move.id)
+                built_rows.sort(key=lambda (move, cells): move.id)
+            self.assertEquals(rows, built_rows)
+
+    @staticmethod
+    def cells((move, version_group_data)):
+        u"""Reduces a row to what's kept: levels and machine numbers."""
+        return move, dict(
+            (version_group, sorted(
+                (key, value) for key, value in data.items()
+                if key in ('level', 'machine') and value is not None))
+            for version_group, data in version_group_data.items())
+
+    def test_pokemon_move_tables(self):
+        u"""Loading a serialized move table gives back the table it was built
+        from.
+        """
+        self.assert_same_table(u'eevee')
+        self.assert_same_table(u'pikachu')
+
+class TestDataVersion(base.TestCase):
+
+    def test_edited_row(self):
+        u"""Editing a row changes the data version, even though the number of
+        rows stays the same.
+        """
+        session = db.pokedex_session
+        before = precompute.compute_data_version(session)
+        self.assertEquals(precompute.compute_data_version(session), before)
+
+        pokemon = db.pokemon_query(u'Eevee').one()
+        try:
+            pokemon.base_experience += 1
+            session.flush()
+            self.assertNotEquals(precompute.compute_data_version(session),
+                                 before)
+        finally:
+            session.rollback()
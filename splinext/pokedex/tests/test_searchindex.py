@@ -0,0 +1,155 @@
+# encoding: utf8
+import threading
+import time
+import unittest
+
+import numpy
+
+from splinext.pokedex import db
+from splinext.pokedex import searchindex
+from splinext.pokedex.forms import RangeQueryEvaluator
+from splinext.pokedex.views.search import wildcard_mask
+
+from . import base
+
+class TestMasks(unittest.TestCase):
+
+    # Rows have types [1], [1, 2], [2, 3], and nothing
+    types = numpy.array([
+        [True, False, False],
+        [True, True, False],
+        [False, True, True],
+        [False, False, False],
+    ])
+    columns = {1: 0, 2: 1, 3: 2}
+
+    def assertMask(self, mask, expected):
+        self.assertEquals(mask.tolist(), expected)
+
+    def test_membership(self):
+        self.assertMask(searchindex.any_of(self.types, self.columns, [1, 3]),
+                        [True, True, True, False])
+        self.assertMask(searchindex.all_of(self.types, self.columns, [1, 2]),
+                        [False, True, False, False])
+        self.assertMask(searchindex.only(self.types, self.columns, [1, 2]),
+                        [True, True, False, True])
+        self.assertMask(searchindex.any_of(self.types, self.columns, [99]),
+                        [False, False, False, False])
+        self.assertMask(searchindex.all_of(self.types, self.columns, [1, 99]),
+                        [False, False, False, False])
+
+    def test_ranges(self):
+        values = numpy.array([1, 5, 10, numpy.nan])
+        self.assertMask(RangeQueryEvaluator([(None, 5)]).mask(values),
+                        [True, True, False, False])
+        self.assertMask(RangeQueryEvaluator([(5, None), 1]).mask(values),
+                        [True, True, True, False])
+        self.assertMask(RangeQueryEvaluator([(2, 9)]).mask(values),
+                        [False, True, False, False])
+
+    def test_wildcards(self):
+        names = [u'eevee', u'flareon', u'pikachu', None]
+        self.assertMask(wildcard_mask(names, u'EEV'),
+                        [True, False, False, False])
+        self.assertMask(wildcard_mask(names, u'*eon'),
+                        [False, True, False, False])
+        self.assertMask(wildcard_mask(names, u'pikac?'),
+                        [False, False, False, False])
+        self.assertMask(wildcard_mask(names, u'?ikachu'),
+                        [False, False, True, False])
+
+    def test_ngrams(self):
+        names = [u'eevee', u'flareon', u'pikachu', None, u'vaporeon']
+        ngrams = searchindex.NgramIndex(names)
+        self.assertMask(ngrams.candidates(u'*reon*'), [1, 4])
+        self.assertMask(ngrams.candidates(u'*zzz*'), [])
+        self.assertEquals(ngrams.candidates(u'*on'), None)
+
+        for pattern in [u'eon', u'*pora*', u'?ikachu', u'f*on', u'v', u'zz']:
+            self.assertMask(wildcard_mask(names, pattern, ngrams),
+                            wildcard_mask(names, pattern).tolist())
+
+    def test_page(self):
+        ids = numpy.array([10, 20, 30, 40, 50])
+        rows = numpy.array([4, 2, 0, 1, 3])
+
+        page, after = searchindex.page(rows, ids, size=2)
+        self.assertMask(page, [4, 2])
+        self.assertEquals(after, 30)
+
+        page, after = searchindex.page(rows, ids, after=after, size=2)
+        self.assertMask(page, [0, 1])
+        self.assertEquals(after, 20)
+
+        page, after = searchindex.page(rows, ids, after=after, size=2)
+        self.assertMask(page, [3])
+        self.assertEquals(after, None)
+
+        # Unknown cursors start over
+        page, after = searchindex.page(rows, ids, after=99, size=2)
+        self.assertMask(page, [4, 2])
+
+    def test_page_groups(self):
+        u"""Pages run long rather than split a group."""
+        ids = numpy.array([10, 20, 30, 40, 50])
+        rows = numpy.array([4, 2, 0, 1, 3])
+        groups = numpy.array([2, 3, 2, 3, 1])
+
+        page, after = searchindex.page(rows, ids, size=2, groups=groups)
+        self.assertMask(page, [4, 2, 0])
+        self.assertEquals(after, 10)
+
+        page, after = searchindex.page(rows, ids, after=after, size=2,
+                                       groups=groups)
+        self.assertMask(page, [1, 3])
+        self.assertEquals(after, None)
+
+        # A group that runs to the end makes for one long last page
+        page, after = searchindex.page(rows, ids, size=1,
+                                       groups=numpy.array([1, 1, 1, 1, 1]))
+        self.assertMask(page, [4, 2, 0, 1, 3])
+        self.assertEquals(after, None)
+
+class TestLanguages(base.TestCase):
+
+    def test_indices_by_language(self):
+        u"""Names are indexed in the language being searched in."""
+        english_id = db.pokedex_session.default_language_id
+        japanese = db.get_by_identifier_query(db.t.Language, u'ja').one()
+
+        english_pokemon = searchindex.pokemon_index()
+        english_moves = searchindex.move_index()
+        db.pokedex_session.default_language_id = japanese.id
+        try:
+            japanese_pokemon = searchindex.pokemon_index()
+            japanese_moves = searchindex.move_index()
+        finally:
+            db.pokedex_session.default_language_id = english_id
+
+        row = english_pokemon.row_index[
+            db.get_by_identifier_query(db.t.Pokemon, u'eevee').one().id]
+        self.assertEquals(english_pokemon.names[row], u'eevee')
+        self.assertNotEquals(japanese_pokemon.names[row], u'eevee')
+        self.assertNotEquals(japanese_moves.names, english_moves.names)
+        self.assert_(searchindex.pokemon_index() is english_pokemon)
+
+    def test_concurrent_builds(self):
+        u"""Simultaneous first requests in a language share a single build."""
+        indices = {}
+        builds = []
+        def build(session):
+            builds.append(session)
+            time.sleep(0.1)
+            return object()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                       searchindex._for_language(indices, build)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(len(builds), 1)
+        self.assertEquals(len(set(map(id, results))), 1)
@@ -0,0 +1,49 @@
+# encoding: utf8
+
+from unittest import TestCase
+
+import numpy
+
+from splinext.pokedex.typechart import TypeChart
+
+# A tiny made-up chart: fire, water, grass, ghost
+FIRE, WATER, GRASS, GHOST = 1, 2, 3, 4
+FACTORS = numpy.array([
+    # fire water grass ghost  <- defending
+    [ 50,  50, 200, 100],  # fire
+    [200,  50,  50, 100],  # water
+    [ 50, 200,  50, 100],  # grass
+    [100, 100, 100, 200],  # ghost
+])
+
+class TestTypeChart(TestCase):
+
+    def setUp(self):
+        self.chart = TypeChart([FIRE, WATER, GRASS, GHOST], FACTORS)
+
+    def test_defense(self):
+        u"""Dual types multiply, without ever leaving integers."""
+        self.assertEquals(list(self.chart.defense(GRASS)), [200, 50, 50, 100])
+        self.assertEquals(list(self.chart.defense(WATER, GRASS)),
+                          [100, 25, 100, 100])
+
+    def test_scores(self):
+        u"""Scores add up +1 per super effective hit and -1 per resisted hit,
+        and are the other way around for defense.
+        """
+        attacking, defending = self.chart.scores()
+        self.assertEquals(list(attacking), [-1, -1, -1, 1])
+        self.assertEquals(list(defending), [1, 1, 1, -1])
+
+        # With grass as the secondary type, water vs water/grass is x1/4
+        attacking, defending = self.chart.scores(GRASS)
+        self.assertEquals(attacking[1], -5)
+
+    def test_coverage(self):
+        u"""Coverage is the best factor any of the attacking types gets."""
+        self.assertEquals(list(self.chart.coverage([FIRE, WATER])),
+                          [200, 50, 200, 100])
+        self.assertEquals(self.chart.coverage([FIRE], [WATER, GRASS]), 100)
+        pairs = self.chart.dual_type_coverage([FIRE])
+        self.assertEquals(pairs[2, 2], 200)
+        self.assertEquals(pairs[1, 2], 100)
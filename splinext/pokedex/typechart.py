@@ -0,0 +1,176 @@
+# encoding: utf8
+"""The type chart, as an array.
+
+Damage factors are percentages, as in the database: 0, 50, 100, or 200 for a
+single type, and 25 or 400 for a dual type.  Types that appear in the chart
+at all (i.e., not ??? or Shadow) are indexed in id order.
+"""
+from __future__ import absolute_import, division
+
+import numpy
+
+import pokedex.db.tables as t
+
+from . import db
+from . import precompute
+
+# Relative score for each damage factor: normal damage counts for 0; super
+# effective counts for +1; not very effective counts for -1.  Ineffective
+# counts for -2.  With dual types, x4 is +2 and x1/4 is -2; ineffective is -4.
+SCORE_CONVERSION = {
+    400: +2,
+    200: +1,
+    100:  0,
+     50: -1,
+     25: -2,
+      0: -2,
+}
+DUAL_TYPE_INEFFECTIVE_SCORE = -4
+
+def _score_lookup(dual):
+    """Returns an array that maps a damage factor to its score."""
+    lookup = numpy.zeros(max(SCORE_CONVERSION) + 1, dtype=numpy.int64)
+    for factor, score in SCORE_CONVERSION.items():
+        lookup[factor] = score
+    if dual:
+        lookup[0] = DUAL_TYPE_INEFFECTIVE_SCORE
+    return lookup
+
+class TypeChart(object):
+    """The damage factor for every pair of types.
+
+    `type_ids` lists the types in the chart, and `factors[a, d]` is the
+    factor for an attacking type `type_ids[a]` against a defending type
+    `type_ids[d]`.
+    """
+
+    def __init__(self, type_ids, factors):
+        self.type_ids = type_ids
+        self.factors = factors
+        self.index = dict((type_id, i) for i, type_id in enumerate(type_ids))
+
+        # Attacking and defending scores for every type, both alone and with
+        # every possible secondary type.  Row 0 is the single-type case; row
+        # i + 1 has type_ids[i] as the secondary type
+        n = len(type_ids)
+        self.attacking_scores = numpy.zeros((n + 1, n), dtype=numpy.int64)
+        self.defending_scores = numpy.zeros((n + 1, n), dtype=numpy.int64)
+        for row, secondary_id in enumerate([None] + list(type_ids)):
+            scores = self._scores(secondary_id)
+            self.attacking_scores[row], self.defending_scores[row] = scores
+
+    def __contains__(self, type_id):
+        return type_id in self.index
+
+    def defense(self, *type_ids):
+        """Returns the factor each attacking type has against a Pokémon with
+        the given types, as an array ordered like `type_ids`.
+        """
+        result = numpy.full(len(self.type_ids), 100, dtype=numpy.int64)
+        for type_id in type_ids:
+            # Dividing by 100 every time turns the damage factor into a
+            # decimal percentage taken of the starting 100, without using
+            # floats and regardless of number of types
+            result = result * self.factors[:, self.index[type_id]] // 100
+        return result
+
+    def attack(self, type_id):
+        """Returns the factor the given attacking type has against every
+        type, as an array ordered like `type_ids`.
+        """
+        return self.factors[self.index[type_id]]
+
+    def with_secondary(self, secondary_id=None):
+        """Returns the chart as it would be if every defending type also had
+        the given secondary type.
+        """
+        if secondary_id is None:
+            return self.factors
+
+        secondary = self.factors[:, self.index[secondary_id]]
+        return self.factors * secondary[:, numpy.newaxis] // 100
+
+    def _scores(self, secondary_id=None):
+        """Computes the attacking and defending score of every type when every
+        defender also has the given secondary type.
+        """
+        factors = self.with_secondary(secondary_id)
+        scores = _score_lookup(secondary_id is not None)[factors]
+        return scores.sum(axis=1), -scores.sum(axis=0)
+
+    def scores(self, secondary_id=None):
+        """Returns a tuple of arrays of attacking and defending scores for
+        every type, where every defender also has the given secondary type.
+        """
+        if secondary_id is None:
+            row = 0
+        else:
+            row = self.index[secondary_id] + 1
+        return self.attacking_scores[row], self.defending_scores[row]
+
+    def coverage(self, attacking_type_ids, defending_type_ids=None):
+        """Returns the best factor any of the given attacking types has
+        against each defending type, as an array ordered like `type_ids`.
+
+        If `defending_type_ids` is given, returns a single factor against a
+        Pokémon with those types instead.
+        """
+        rows = [self.index[type_id] for type_id in attacking_type_ids]
+        if not rows:
+            return None
+
+        if defending_type_ids is None:
+            return self.factors[rows].max(axis=0)
+
+        return self.defense(*defending_type_ids)[rows].max()
+
+    def dual_type_coverage(self, attacking_type_ids):
+        """Returns an N×N array of the best factor any of the given attacking
+        types has against every pair of defending types.  The diagonal is
+        the single-type case.
+        """
+        rows = [self.index[type_id] for type_id in attacking_type_ids]
+        if not rows:
+            return None
+
+        attacking = self.factors[rows]
+        pairs = (attacking[:, :, numpy.newaxis] *
+                 attacking[:, numpy.newaxis, :] // 100)
+        n = len(self.type_ids)
+        diagonal = numpy.arange(n)
+        pairs[:, diagonal, diagonal] = attacking
+        return pairs.max(axis=0)
+
+@precompute.index
+def type_chart():
+    """Returns the `TypeChart` for the whole database."""
+    efficacies = list(db.pokedex_session.query(
+        t.TypeEfficacy.damage_type_id,
+        t.TypeEfficacy.target_type_id,
+        t.TypeEfficacy.damage_factor,
+    ))
+
+    type_ids = sorted(set(damage_type_id for damage_type_id, _, _
+                          in efficacies))
+    index = dict((type_id, i) for i, type_id in enumerate(type_ids))
+    factors = numpy.full((len(type_ids), len(type_ids)), 100,
+                         dtype=numpy.int64)
+    for damage_type_id, target_type_id, damage_factor in efficacies:
+        factors[index[damage_type_id], index[target_type_id]] = damage_factor
+
+    return TypeChart(type_ids, factors)
+
+def types_by_id(type_ids):
+    """Returns a dict of id to `Type` for the given ids, in one query."""
+    return dict(
+        (type.id, type) for type in db.pokedex_session.query(t.Type)
+            .filter(t.Type.id.in_(list(type_ids))))
+
+def type_factor_dict(factors):
+    """Turns an array ordered like the chart's `type_ids` into a dict of
+    `Type` to plain int.
+    """
+    chart = type_chart()
+    types = types_by_id(chart.type_ids)
+    return dict((types[type_id], int(factor))
+                for type_id, factor in zip(chart.type_ids, factors))
@@ -0,0 +1,650 @@
+# encoding: utf8
+"""A read-only JSON API, for bots and other machines that would otherwise
+have to scrape the HTML pages.
+
+Everything lives under /dex/api/v1/ and is looked up by name, the same as the
+regular pages.  Documents refer to other things by identifier.  `?fields=`
+picks out only some of a document's fields, comma-separated, with dots for
+nested fields: e.g. `?fields=types,stats.hp`.
+
+Responses carry an ETag, so clients can ask for a document again with
+If-None-Match and get a 304 if nothing has changed.
+
+The stat calculator is also here, at /dex/api/v1/stat_calculator, taking a
+POSTed batch of Pokémon to work out all at once, as are capture chance
+heatmaps for each Pokémon, at /dex/api/v1/capture/{name}.
+"""
+from __future__ import absolute_import, division
+
+import json
+
+from sqlalchemy.orm import joinedload, subqueryload
+from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
+import pyramid.httpexceptions as exc
+
+import pokedex.db.tables as t
+
+from .. import capture
+from .. import db
+from .. import encounters
+from .. import evolution
+from .. import genes
+from .. import movetables
+from .. import precompute
+from .. import stats
+from .. import typechart
+from . import caching
+
+def select_fields(data, fields):
+    """Returns a copy of the dict `data` with only the given fields.
+
+    Dotted field names pick fields out of nested dicts.  Raises KeyError for
+    a field that doesn't exist.
+    """
+    selected = {}
+    for field in fields:
+        parts = field.split('.')
+        source = data
+        target = selected
+        for i, part in enumerate(parts):
+            if not isinstance(source, dict) or part not in source:
+                raise KeyError(field)
+            source = source[part]
+
+            if i == len(parts) - 1:
+                target[part] = source
+            else:
+                target = target.setdefault(part, {})
+
+    return selected
+
+def _respond(request, document):
+    """Sends the JSON `document`, trimmed down to `?fields=` if necessary."""
+    fields = [field.strip() for field
+              in request.params.get('fields', u'').split(u',')]
+    fields = [field for field in fields if field]
+    if fields:
+        try:
+            data = select_fields(json.loads(document), fields)
+        except KeyError as e:
+            raise exc.HTTPBadRequest(u"No such field: {0}".format(e.args[0]))
+        document = json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+    response = request.response
+    response.content_type = 'application/json'
+    response.charset = 'utf-8'
+    response.body = document
+    response.md5_etag()
+    response.conditional_response = True
+    return response
+
+def _cache_key(thing):
+    # The same name can mean different data after a reload
+    return u'{0};{1}'.format(precompute.data_version(), thing.identifier)
+
+def _identifiers(table, ids):
+    """Returns a dict of id to identifier for the given rows of `table`."""
+    ids = set(ids)
+    if not ids:
+        return {}
+    return dict(db.pokedex_session.query(table.id, table.identifier)
+                .filter(table.id.in_(ids)))
+
+def _factors(factors):
+    """Turns an array ordered like the type chart into a dict of type
+    identifier to factor.
+    """
+    chart = typechart.type_chart()
+    identifiers = _identifiers(t.Type, chart.type_ids)
+    return dict((identifiers[type_id], int(factor))
+                for type_id, factor in zip(chart.type_ids, factors))
+
+def _markdown_text(markdown):
+    if markdown is None:
+        return None
+    return markdown.as_text()
+
+
+### Pokémon
+
+def pokemon_view(request):
+    name = request.matchdict.get('name')
+    form = request.params.get('form', None)
+    c = request.tmpl_context
+
+    try:
+        c.pokemon = db.pokemon_query(name, form) \
+            .options(
+                joinedload('species'),
+                joinedload('abilities'),
+                joinedload('hidden_ability'),
+                subqueryload('stats.stat'),
+                subqueryload('types'),
+            ) \
+            .one()
+    except NoResultFound:
+        raise exc.HTTPNotFound()
+
+    document = caching.cache_json(
+        request=request,
+        key=_cache_key(c.pokemon),
+        do_work=_do_pokemon,
+    )
+    return _respond(request, document)
+
+def _pokemon_evolution(species):
+    """Returns the evolution table from the `evolution` module, with species
+    identifiers in place of ids.
+    """
+    layout = evolution.chain_layouts()[species.evolution_chain_id]
+    identifiers = dict(db.pokedex_session.query(
+            t.PokemonSpecies.id, t.PokemonSpecies.identifier)
+        .filter_by(evolution_chain_id=species.evolution_chain_id))
+
+    table = []
+    for row in layout.rows:
+        table_row = []
+        for cell in row:
+            if cell == '' or cell is None:
+                table_row.append(cell)
+            else:
+                species_id, span = cell
+                table_row.append({'species': identifiers[species_id],
+                                  'span': span})
+        table.append(table_row)
+
+    return table
+
+def _pokemon_encounters(pokemon):
+    """Returns a list of the Pokémon's encounter summaries from the
+    `encounters` module, as dicts of identifiers.
+    """
+    rows = encounters.pokemon_encounter_rows(pokemon.id)
+
+    location_areas = {}
+    area_ids = set(row[0] for row in rows)
+    if area_ids:
+        for area_id, area_identifier, location_identifier in (
+                db.pokedex_session.query(
+                    t.LocationArea.id,
+                    t.LocationArea.identifier,
+                    t.Location.identifier,
+                )
+                .join(t.LocationArea.location)
+                .filter(t.LocationArea.id.in_(area_ids))):
+            location_areas[area_id] = location_identifier, area_identifier
+    versions = _identifiers(t.Version, (row[1] for row in rows))
+    methods = _identifiers(t.EncounterMethod, (row[2] for row in rows))
+    condition_values = _identifiers(t.EncounterConditionValue,
+        (cv_id for row in rows for cv_id in row[3]))
+
+    result = []
+    for area_id, version_id, method_id, condition_value_ids, levels in rows:
+        location, area = location_areas[area_id]
+        result.append({
+            'location': location,
+            'area': area,
+            'version': versions[version_id],
+            'method': methods[method_id],
+            'conditions': [condition_values[cv_id]
+                           for cv_id in condition_value_ids],
+            'levels': [dict(min_level=min_level, max_level=max_level,
+                            rarity=rarity)
+                       for min_level, max_level, rarity in levels],
+        })
+
+    return result
+
+def _pokemon_moves(pokemon):
+    """Returns the Pokémon's learnset from the `movetables` module, as a list
+    of methods with identifiers.
+    """
+    data = movetables.pokemon_move_table_data(pokemon)
+
+    methods = _identifiers(t.PokemonMoveMethod,
+        (method_id for method_id, pokemon_id, rows in data['methods']))
+    pokemon_identifiers = _identifiers(t.Pokemon,
+        (pokemon_id for method_id, pokemon_id, rows in data['methods']))
+    moves = _identifiers(t.Move,
+        (move_id for method_id, pokemon_id, rows in data['methods']
+                 for move_id, cells in rows))
+    version_groups = _identifiers(t.VersionGroup,
+        (cell[0] for method_id, pokemon_id, rows in data['methods']
+                 for move_id, cells in rows
+                 for cell in cells))
+
+    result = []
+    for method_id, pokemon_id, rows in data['methods']:
+        method_moves = []
+        for move_id, cells in rows:
+            move_version_groups = {}
+            for version_group_id, level, machine in cells:
+                vg_data = move_version_groups[
+                    version_groups[version_group_id]] = {}
+                if level is not None:
+                    vg_data['level'] = level
+                if machine is not None:
+                    vg_data['machine'] = machine
+            method_moves.append({'move': moves[move_id],
+                                 'version_groups': move_version_groups})
+
+        result.append({
+            'method': methods[method_id],
+            # Egg moves and the like can come from a different Pokémon
+            'pokemon': pokemon_identifiers[pokemon_id],
+            'moves': method_moves,
+        })
+
+    return result
+
+def _do_pokemon(request, cache_key):
+    c = request.tmpl_context
+    pokemon = c.pokemon
+    species = pokemon.species
+
+    chart = typechart.type_chart()
+    percentiles = stats.stat_percentiles(pokemon)
+
+    return {
+        'id': pokemon.id,
+        'identifier': pokemon.identifier,
+        'name': pokemon.name,
+        'species': species.identifier,
+        'generation': species.generation_id,
+        'types': [type.identifier for type in pokemon.types],
+        'abilities': [ability.identifier for ability in pokemon.abilities],
+        'hidden_ability': pokemon.hidden_ability.identifier
+            if pokemon.hidden_ability else None,
+        'height': pokemon.height,
+        'weight': pokemon.weight,
+        'base_experience': pokemon.base_experience,
+        'capture_rate': species.capture_rate,
+        'gender_rate': species.gender_rate,
+
+        'stats': dict(
+            (pokemon_stat.stat.identifier, {
+                'base_stat': pokemon_stat.base_stat,
+                'effort': pokemon_stat.effort,
+                'percentile': percentiles[pokemon_stat.stat_id],
+            })
+            for pokemon_stat in pokemon.stats),
+        'stat_total': {
+            'value': sum(pokemon_stat.base_stat
+                         for pokemon_stat in pokemon.stats),
+            'percentile': percentiles['total'],
+        },
+
+        'type_efficacies': _factors(
+            chart.defense(*[type.id for type in pokemon.types])),
+        'evolution': _pokemon_evolution(species),
+        'encounters': _pokemon_encounters(pokemon),
+        'moves': _pokemon_moves(pokemon),
+    }
+
+
+### Moves
+
+def move_view(request):
+    name = request.matchdict.get('name')
+    c = request.tmpl_context
+
+    try:
+        c.move = db.get_by_name_query(t.Move, name) \
+            .options(
+                joinedload('type'),
+                joinedload('damage_class'),
+            ) \
+            .one()
+    except NoResultFound:
+        raise exc.HTTPNotFound()
+    except MultipleResultsFound:
+        # Same hack as the move page; duplicate names prefer the first
+        c.move = db.get_by_name_query(t.Move, name).first()
+
+    document = caching.cache_json(
+        request=request,
+        key=_cache_key(c.move),
+        do_work=_do_move,
+    )
+    return _respond(request, document)
+
+def _do_move(request, cache_key):
+    c = request.tmpl_context
+    move = c.move
+
+    chart = typechart.type_chart()
+    if move.type_id in chart:
+        damage_dealt = _factors(chart.attack(move.type_id))
+    else:
+        damage_dealt = {}
+
+    return {
+        'id': move.id,
+        'identifier': move.identifier,
+        'name': move.name,
+        'generation': move.generation_id,
+        'type': move.type.identifier,
+        'damage_class': move.damage_class.identifier,
+        'power': move.power,
+        'accuracy': move.accuracy,
+        'pp': move.pp,
+        'priority': move.priority,
+        'effect_chance': move.effect_chance,
+        'short_effect': _markdown_text(move.short_effect),
+        'damage_dealt': damage_dealt,
+    }
+
+
+### Types
+
+def type_view(request):
+    name = request.matchdict.get('name')
+    c = request.tmpl_context
+
+    try:
+        c.type = db.get_by_name_query(t.Type, name).one()
+    except NoResultFound:
+        raise exc.HTTPNotFound()
+
+    document = caching.cache_json(
+        request=request,
+        key=_cache_key(c.type),
+        do_work=_do_type,
+    )
+    return _respond(request, document)
+
+def _do_type(request, cache_key):
+    c = request.tmpl_context
+    type = c.type
+
+    chart = typechart.type_chart()
+    if type.id in chart:
+        damage_dealt = _factors(chart.attack(type.id))
+        damage_taken = _factors(chart.defense(type.id))
+    else:
+        damage_dealt = damage_taken = {}
+
+    session = db.pokedex_session
+    pokemon = session.query(t.Pokemon.identifier) \
+        .join(t.Pokemon.types) \
+        .filter(t.Type.id == type.id) \
+        .order_by(t.Pokemon.id)
+    moves = session.query(t.Move.identifier) \
+        .filter(t.Move.type_id == type.id) \
+        .order_by(t.Move.id)
+
+    return {
+        'id': type.id,
+        'identifier': type.identifier,
+        'name': type.name,
+        'generation': type.generation_id,
+        'damage_dealt': damage_dealt,
+        'damage_taken': damage_taken,
+        'pokemon': [identifier for identifier, in pokemon],
+        'moves': [identifier for identifier, in moves],
+    }
+
+
+### Abilities
+
+def ability_view(request):
+    name = request.matchdict.get('name')
+    c = request.tmpl_context
+
+    try:
+        c.ability = db.get_by_name_query(t.Ability, name) \
+            .filter(t.Ability.is_main_series) \
+            .one()
+    except NoResultFound:
+        raise exc.HTTPNotFound()
+
+    document = caching.cache_json(
+        request=request,
+        key=_cache_key(c.ability),
+        do_work=_do_ability,
+    )
+    return _respond(request, document)
+
+def _do_ability(request, cache_key):
+    c = request.tmpl_context
+    ability = c.ability
+
+    pokemon = db.pokedex_session.query(
+            t.Pokemon.identifier,
+            t.PokemonAbility.slot,
+            t.PokemonAbility.is_hidden,
+        ) \
+        .join(t.PokemonAbility,
+              t.PokemonAbility.pokemon_id == t.Pokemon.id) \
+        .filter(t.PokemonAbility.ability_id == ability.id) \
+        .order_by(t.Pokemon.id)
+
+    return {
+        'id': ability.id,
+        'identifier': ability.identifier,
+        'name': ability.name,
+        'generation': ability.generation_id,
+        'short_effect': _markdown_text(ability.short_effect),
+        'effect': _markdown_text(ability.effect),
+        'pokemon': [dict(pokemon=identifier, slot=slot, is_hidden=is_hidden)
+                    for identifier, slot, is_hidden in pokemon],
+    }
+
+
+### Capture chances
+
+# Steps of HP percentage allowed for heatmaps
+HP_STEPS = (1, 2, 5, 10, 20, 25)
+
+def capture_view(request):
+    u"""Capture chance heatmaps for a Pokémon: every ball, by status and HP
+    percentage, and by level or turn where those matter.
+
+    `?hp_step=` spaces out the HP percentages; it's 5 by default.
+    """
+    name = request.matchdict.get('name')
+    form = request.params.get('form', None)
+    c = request.tmpl_context
+
+    try:
+        c.hp_step = int(request.params.get('hp_step', 5))
+    except ValueError:
+        c.hp_step = None
+    if c.hp_step not in HP_STEPS:
+        raise exc.HTTPBadRequest(u"hp_step must be one of {0}".format(
+            u', '.join(str(step) for step in HP_STEPS)))
+
+    try:
+        c.pokemon = db.pokemon_query(name, form) \
+            .options(
+                joinedload('species'),
+                subqueryload('stats.stat'),
+                subqueryload('types'),
+            ) \
+            .one()
+    except NoResultFound:
+        raise exc.HTTPNotFound()
+
+    document = caching.cache_json(
+        request=request,
+        key=u'{0};{1}'.format(_cache_key(c.pokemon), c.hp_step),
+        do_work=_do_capture,
+    )
+    return _respond(request, document)
+
+def _do_capture(request, cache_key):
+    c = request.tmpl_context
+    pokemon = c.pokemon
+
+    hp_percents = range(c.hp_step, 101, c.hp_step)
+    return {
+        'pokemon': pokemon.identifier,
+        'capture_rate': pokemon.species.capture_rate,
+        'hp_percents': hp_percents,
+        'statuses': [status for status, _ in capture.STATUS_BONUSES],
+        'balls': capture.heatmap(
+            pokemon.species.capture_rate,
+            capture.species_balls(pokemon),
+            [percent / 100 for percent in hp_percents],
+        ),
+    }
+
+
+### Stat calculator
+
+# Most Pokémon that can be checked in one request
+MAX_BATCH_SIZE = 1000
+
+class BatchError(ValueError):
+    """Something's wrong with one Pokémon in a batch."""
+
+def _lookup(table, identifier, what):
+    if identifier is None:
+        return None
+    try:
+        return table[identifier]
+    except (KeyError, TypeError):
+        raise BatchError(u"No such {0}: {1}".format(what, identifier))
+
+def _solve_pokemon(record, table, natures, characteristics, hp_types,
+                   type_identifiers):
+    """Works out one Pokémon's genes, as for the stat calculator gadget."""
+    if not isinstance(record, dict):
+        raise BatchError(u"Expected an object")
+
+    row = _lookup(table.pokemon_index, record.get('pokemon'), u"Pokémon")
+    if row is None:
+        raise BatchError(u"Missing Pokémon")
+    base_stats = table.base_stats[row]
+
+    increased, decreased = _lookup(natures, record.get('nature'),
+                                   u"nature") or (None, None)
+    if increased == decreased:
+        # Neutral nature is equivalent to none at all
+        modifiers = [1.0] * len(table.stats)
+    else:
+        modifiers = [1.1 if stat == increased else 0.9 if stat == decreased
+                     else 1.0 for stat in table.stats]
+
+    characteristic = _lookup(characteristics, record.get('characteristic'),
+                             u"characteristic")
+    hidden_power_type = _lookup(hp_types, record.get('hidden_power'),
+                                u"Hidden Power type")
+
+    data_points = record.get('data')
+    if not data_points or not isinstance(data_points, list):
+        raise BatchError(u"Need at least one data point")
+
+    levels, stats, efforts = [], [], []
+    try:
+        for point in data_points:
+            effort = point.get('effort', {})
+            levels.append(int(point['level']))
+            stats.append([int(point['stats'][stat]) for stat in table.stats])
+            efforts.append([int(effort.get(stat, 0))
+                            for stat in table.stats])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        raise BatchError(u"Bad data point")
+
+    if not all(1 <= level <= 100 for level in levels):
+        raise BatchError(u"Levels must be between 1 and 100")
+
+    solution = genes.solve(
+        base_stats=base_stats,
+        natures=modifiers,
+        is_hp=[stat == u'hp' for stat in table.stats],
+        levels=levels,
+        stats=stats,
+        efforts=efforts,
+    )
+    gene_bits = genes.constrain(solution.genes, table.hidden_power_order,
+                                hidden_power_type, characteristic)
+    possible = [genes.to_genes(bits) for bits in gene_bits]
+
+    hidden_power = None
+    if all(len(stat_genes) == 1 for stat_genes in possible):
+        type_index, power = genes.hidden_power(
+            [possible[i][0] for i in table.hidden_power_order])
+        hidden_power = {
+            'type': type_identifiers.get(type_index + 2),
+            'power': power,
+        }
+
+    return {
+        'pokemon': record['pokemon'],
+        'genes': dict(zip(table.stats, possible)),
+        'stat_ranges': dict(
+            (stat, solution.ranges[:, i].tolist())
+            for i, stat in enumerate(table.stats) if base_stats[i]),
+        'next_useful_level': solution.next_useful_level,
+        'exact': hidden_power is not None,
+        'hidden_power': hidden_power,
+    }
+
+def stat_calculator_view(request):
+    u"""Works out the genes of a whole batch of Pokémon at once.
+
+    Takes a POSTed JSON object whose `pokemon` is a list of objects like:
+
+        {"pokemon": "eevee", "nature": "bold", "characteristic": 6,
+         "hidden_power": "dark",
+         "data": [{"level": 50, "stats": {"hp": 120, ...},
+                   "effort": {"hp": 4, ...}}]}
+
+    Everything but `pokemon` and `data` is optional, as is any effort.  Each
+    one gets back its possible genes, the range of each stat at each data
+    point, the next useful level and, if the genes are exact, Hidden Power.
+    One Pokémon with bad data gets an `error` instead, rather than failing
+    the whole batch.
+    """
+    try:
+        records = request.json_body['pokemon']
+    except (ValueError, KeyError, TypeError):
+        raise exc.HTTPBadRequest(u"Expected a JSON object with a list of "
+                                 u"Pokémon")
+    if not isinstance(records, list):
+        raise exc.HTTPBadRequest(u"Expected a list of Pokémon")
+    if len(records) > MAX_BATCH_SIZE:
+        raise exc.HTTPBadRequest(u"Too many Pokémon; the most is {0}"
+                                 .format(MAX_BATCH_SIZE))
+
+    # Everything here is shared by the whole batch
+    table = genes.base_stat_table()
+    stat_identifiers = dict(db.pokedex_session.query(t.Stat.id,
+                                                     t.Stat.identifier))
+    natures = dict(
+        (identifier, (stat_identifiers[increased_id],
+                      stat_identifiers[decreased_id]))
+        for identifier, increased_id, decreased_id
+        in db.pokedex_session.query(t.Nature.identifier,
+                                    t.Nature.increased_stat_id,
+                                    t.Nature.decreased_stat_id))
+    characteristics = dict(
+        (characteristic_id, (table.stats.index(stat_identifiers[stat_id]),
+                             gene_mod_5))
+        for characteristic_id, stat_id, gene_mod_5
+        in db.pokedex_session.query(t.Characteristic.id,
+                                    t.Characteristic.stat_id,
+                                    t.Characteristic.gene_mod_5))
+    type_identifiers = dict(db.pokedex_session.query(t.Type.id,
+                                                     t.Type.identifier)
+                            .filter(t.Type.id < 10000))
+    # Shift the type id to make Fighting (id=2) #0; Hidden Power can only be
+    # Fighting through Dark (id=17)
+    hp_types = dict((identifier, type_id - 2) for type_id, identifier
+                    in type_identifiers.items() if 2 <= type_id <= 17)
+
+    results = []
+    for record in records:
+        try:
+            results.append(_solve_pokemon(record, table, natures,
+                characteristics, hp_types, type_identifiers))
+        except BatchError as e:
+            results.append({'error': e.args[0]})
+
+    response = request.response
+    response.content_type = 'application/json'
+    response.charset = 'utf-8'
+    response.body = json.dumps({'results': results}, sort_keys=True,
+                               separators=(',', ':'))
+    return response
@@ -1,10 +1,23 @@
 """Some utilities for caching pages."""
 
+import json
 import zlib
 
 from beaker.util import func_namespace
 from mako.runtime import capture
 
+def _content_key(request, key):
+    c = request.tmpl_context
+
+    # Content needs to be cached per-language
+    # TODO(pyramid)
+    #key = u"{0}/{1}".format(key, c.lang)
+
+    key += u';' + c.game_language.identifier
+    if request.session.get('cheat_obdurate', False):
+        key += u';obdurate'
+    return key
+
 def cache_content(request, key, do_work):
     """Argh!
 
@@ -35,14 +48,7 @@ def cache_content(request, key, do_work):
     """
     cache = request.environ.get('beaker.cache', None)
     c = request.tmpl_context
-
-    # Content needs to be cached per-language
-    # TODO(pyramid)
-    #key = u"{0}/{1}".format(key, c.lang)
-
-    key += u';' + c.game_language.identifier
-    if request.session.get('cheat_obdurate', False):
-        key += u';obdurate'
+    key = _content_key(request, key)
 
     # If the cache isn't configured for whatever reason (such as when we're
     # running in a test environment), just skip it.
@@ -91,3 +97,36 @@ def cache_content(request, key, do_work):
     return
 
 
+
+def cache_json(request, key, do_work):
+    """Like `cache_content`, but for pages that are nothing but data, such as
+    the JSON API.
+
+    ``do_work`` is called the same way, but should return something that can
+    be turned into JSON rather than stuffing it in c.  The return value is
+    the JSON document, as a string, straight from the cache if possible.
+    """
+    cache = request.environ.get('beaker.cache', None)
+    key = _content_key(request, key)
+
+    def generate_document():
+        return json.dumps(do_work(request, key), sort_keys=True,
+                          separators=(',', ':'))
+
+    # No cache configured, e.g. in tests
+    if cache is None:
+        return generate_document()
+
+    namespace = func_namespace(do_work)
+    content_cache = cache.get_cache('content_cache:' + namespace,
+                                    expiretime=36000)
+
+    # Same deal as above with the 'enabled' setting
+    if not content_cache.nsargs.get('enabled', True):
+        return generate_document()
+
+    def generate_data():
+        return zlib.compress(generate_document(), 1)
+
+    data = content_cache.get_value(key=key, createfunc=generate_data)
+    return zlib.decompress(data)
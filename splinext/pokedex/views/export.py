@@ -0,0 +1,220 @@
+# encoding: utf8
+"""Machine-readable exports of search results, as CSV or JSON lines.
+
+Exports have the same columns as the custom table would, minus the purely
+decorative ones, and are streamed: results are loaded a chunk at a time and
+written out as they go, so even an export of the entire dex never holds more
+than one chunk in memory.
+
+The streaming happens after the view has returned and the request's
+transaction is over, so each export loads everything with its own session,
+which is closed once the stream ends.
+"""
+from __future__ import absolute_import
+
+import csv
+import json
+from cStringIO import StringIO
+
+from pyramid.response import Response
+from sqlalchemy.orm import joinedload
+
+import pokedex.db.tables as t
+
+from .. import db
+from .. import helpers as pokedex_helpers
+from .. import hydration
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+def _names(things):
+    return [thing.name for thing in things]
+
+def _name(thing):
+    if thing is None:
+        return None
+    return thing.name
+
+def _markdown_text(markdown):
+    if markdown is None:
+        return None
+    return markdown.as_text()
+
+def _habitat(pokemon):
+    # Habitats only exist up to FireRed and LeafGreen
+    if pokemon.species.generation_id > 3:
+        return None
+    return _name(pokemon.species.habitat)
+
+def _stat(identifier):
+    return lambda pokemon: pokemon.base_stat(identifier, None)
+
+# Column name => function of a Pokémon, returning a value or list of values
+pokemon_columns = {
+    'id': lambda pokemon: pokemon.species.id,
+    'name': lambda pokemon: pokemon.name,
+    'type': lambda pokemon: _names(pokemon.types),
+    'growth_rate':
+        lambda pokemon: pokemon.species.growth_rate.max_experience,
+    'ability': lambda pokemon: _names(pokemon.abilities),
+    'hidden_ability': lambda pokemon: _name(pokemon.hidden_ability),
+    'gender': lambda pokemon:
+        pokedex_helpers.gender_rate_label[pokemon.species.gender_rate],
+    'egg_group': lambda pokemon: _names(pokemon.species.egg_groups),
+    'stat_hp': _stat(u'hp'),
+    'stat_attack': _stat(u'attack'),
+    'stat_defense': _stat(u'defense'),
+    'stat_special_attack': _stat(u'special-attack'),
+    'stat_special_defense': _stat(u'special-defense'),
+    'stat_speed': _stat(u'speed'),
+    'stat_total': lambda pokemon:
+        sum(pokemon_stat.base_stat for pokemon_stat in pokemon.stats),
+    'effort': lambda pokemon: [
+        u'{0} {1}'.format(pokemon_stat.effort, pokemon_stat.stat.name)
+        for pokemon_stat in pokemon.stats if pokemon_stat.effort],
+    'height': lambda pokemon:
+        pokedex_helpers.format_height_imperial(pokemon.height),
+    'weight': lambda pokemon:
+        pokedex_helpers.format_weight_imperial(pokemon.weight),
+    'height_metric': lambda pokemon:
+        pokedex_helpers.format_height_metric(pokemon.height),
+    'weight_metric': lambda pokemon:
+        pokedex_helpers.format_weight_metric(pokemon.weight),
+    'genus': lambda pokemon: pokemon.species.genus,
+    'color': lambda pokemon: _name(pokemon.species.color),
+    'habitat': _habitat,
+    'shape': lambda pokemon: _name(pokemon.species.shape),
+    'hatch_counter': lambda pokemon: pokemon.species.hatch_counter,
+    'steps_to_hatch':
+        lambda pokemon: (pokemon.species.hatch_counter + 1) * 255,
+    'base_experience': lambda pokemon: pokemon.base_experience,
+    'capture_rate': lambda pokemon: pokemon.species.capture_rate,
+    'base_happiness': lambda pokemon: pokemon.species.base_happiness,
+}
+
+# Likewise, for a move
+move_columns = {
+    'id': lambda move: move.id,
+    'name': lambda move: move.name,
+    'type': lambda move: _name(move.type),
+    'class': lambda move: _name(move.damage_class),
+    'pp': lambda move: move.pp,
+    'power': lambda move: move.power,
+    'accuracy': lambda move: move.accuracy,
+    'priority': lambda move: move.priority,
+    'effect_chance': lambda move: move.effect_chance,
+    'effect': lambda move: _markdown_text(move.short_effect),
+}
+
+
+def _csv_value(value):
+    # The csv module can't do unicode, but passes utf8 through fine
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        value = u', '.join(value)
+    return unicode(value).encode('utf8')
+
+def _csv_lines(columns, getters, things):
+    buf = StringIO()
+    writer = csv.writer(buf)
+
+    def line(values):
+        writer.writerow(values)
+        data = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return data
+
+    yield line(columns)
+    for thing in things:
+        yield line([_csv_value(getters[column](thing)) for column in columns])
+
+def _jsonl_lines(columns, getters, things):
+    for thing in things:
+        yield json.dumps(
+            dict((column, getters[column](thing)) for column in columns),
+            sort_keys=True) + '\n'
+
+def _response(format, columns, getters, things):
+    columns = [column for column in columns if column in getters]
+    if format == 'csv':
+        lines = _csv_lines(columns, getters, things)
+    else:
+        lines = _jsonl_lines(columns, getters, things)
+
+    def stream():
+        try:
+            for line in lines:
+                yield line
+        finally:
+            # Close the things' session even if the client goes away early
+            things.close()
+
+    # No content length, so the server sends it chunked
+    return Response(
+        app_iter=stream(),
+        content_type=FORMATS[format],
+        charset='utf8',
+    )
+
+
+def _pokemon_options(columns):
+    """Returns the loader options for the single-row relations that the
+    given columns read, so they come along with each chunk of Pokémon rather
+    than one row at a time.
+    """
+    options = [joinedload('species')]
+    if 'name' in columns:
+        options.extend([
+            joinedload('default_form'),
+            joinedload('default_form.names_local'),
+        ])
+    if 'name' in columns or 'genus' in columns:
+        options.append(joinedload('species.names_local'))
+    if 'growth_rate' in columns:
+        options.append(joinedload('species.growth_rate'))
+    return options
+
+def _pokemon(session, ids, options, relations):
+    try:
+        for chunk in hydration.chunks(ids):
+            pokemon = hydration.load_in_order(t.Pokemon, chunk, *options,
+                                              session=session)
+            hydration.load_pokemon(pokemon, relations)
+            for one_pokemon in pokemon:
+                yield one_pokemon
+    finally:
+        session.close()
+
+def _moves(session, ids):
+    try:
+        for chunk in hydration.chunks(ids):
+            for move in hydration.load_in_order(t.Move, chunk,
+                    joinedload('type'),
+                    joinedload('damage_class'),
+                    joinedload('move_effect'),
+                    joinedload('move_effect.prose_local'),
+                    session=session):
+                yield move
+    finally:
+        session.close()
+
+def pokemon_response(format, ids, columns, relations):
+    """Returns a response streaming the Pokémon with the given ids, in order,
+    with the given custom table columns.  `relations` are loaded onto each
+    chunk of Pokémon as by `hydration.load_pokemon`.
+    """
+    return _response(format, columns, pokemon_columns,
+                     _pokemon(db.standalone_session(), ids,
+                              _pokemon_options(columns), relations))
+
+def move_response(format, ids, columns):
+    """Returns a response streaming the moves with the given ids, in order,
+    with the given custom table columns.
+    """
+    return _response(format, columns, move_columns,
+                     _moves(db.standalone_session(), ids))
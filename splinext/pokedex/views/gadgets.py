@@ -3,9 +3,7 @@ from __future__ import absolute_import, division
 
 from collections import defaultdict, namedtuple
 import colorsys
-import functools
-import itertools
-import math
+import json
 
 import pyramid.httpexceptions as exc
 
@@ -13,15 +11,19 @@ import wtforms.validators
 from wtforms import Form, fields
 from wtforms.ext.sqlalchemy.fields import QuerySelectField
 
-import pokedex.db
+import numpy
 import pokedex.db.tables as t
-import pokedex.formulae
 
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
+from .. import breeding
+from .. import capture
 from .. import db
+from .. import genes
 from .. import helpers as pokedex_helpers
+from .. import hydration
+from .. import precompute
 from .. import splinehelpers as h
 from ..forms import DuplicateField, PokedexLookupField, StatField
 
@@ -94,7 +96,7 @@ def expected_attempts(catch_chance):
     return 1 / catch_chance
 
 def expected_attempts_oh_no(partitions):
-    """Horrible version of the above, used for Quick and Timer Balls.
+    """Fancier version of the above, used for Quick and Timer Balls.
 
     Now there are a few finite partitions at the beginning.  `partitions` looks
     like:
@@ -108,44 +110,35 @@ def expected_attempts_oh_no(partitions):
     For example, a Timer Ball might look like [(0.25, 10), (0.5, 10), ...].
 
     The final `number_of_turns` must be None to indicate that the final
-    `catch_chance` lasts indefinitely.
+    `catch_chance` lasts indefinitely.  See `capture.expected_attempts` for
+    the math.
     """
-
-    turn = 0        # current turn
-    p_got_here = 1  # probability that we HAVE NOT caught the Pokémon yet
-    expected_attempts = 0
-
-    # To keep this "simple", basically just count forwards each turn until the
-    # partitions are exhausted
-    for catch_chance, number_of_turns in partitions:
-        if number_of_turns is None:
-            # The rest of infinity is covered by the usual expected-value formula with
-            # the final catch chance, but factoring in the probability that the Pokémon
-            # is still uncaught, and that turns have already passed
-            expected_attempts += p_got_here * (1 / catch_chance + turn)
-
-            # Done!
-            break
-
-        for _ in range(number_of_turns):
-            # Add the contribution of possibly catching it this turn.  That's
-            # the chance that we'll catch it this turn, times the turn number
-            # -- times the chance that we made it this long without catching
-            turn += 1
-            expected_attempts += p_got_here * catch_chance * turn
-
-            # Probability that we get to the next turn is decreased by the
-            # probability that we didn't catch it this turn
-            p_got_here *= 1 - catch_chance
-
-    return expected_attempts
+    chances = [catch_chance for catch_chance, _ in partitions]
+    turns = [number_of_turns for _, number_of_turns in partitions[:-1]]
+    return float(capture.expected_attempts(chances, turns))
 
 CaptureChance = namedtuple('CaptureChance', ['condition', 'is_active', 'chances'])
 
 
+def _move_version_groups():
+    # We join with VGPMM to filter out version groups which we lack move
+    # data for. *coughxycough*
+    return db.pokedex_session.query(t.VersionGroup) \
+        .join(t.VersionGroupPokemonMoveMethod) \
+        .order_by(t.VersionGroup.order.asc()) \
+        .options(joinedload('versions'))
+
 class ChainBreedingForm(Form):
     pokemon = PokedexLookupField(u'Target Pokémon', valid_type='pokemon')
     moves = PokedexLookupField(u'Desired move', valid_type='moves')
+    version_group = QuerySelectField(u'Version',
+        query_factory=_move_version_groups,
+        get_pk=lambda _: _.id,
+        get_label=lambda _: u' / '.join(version.name
+                                        for version in _.versions),
+        allow_blank=True,
+        blank_text=u'Latest',
+    )
 
 
 class StatCalculatorForm(Form):
@@ -255,15 +248,13 @@ def capture_rate(request):
         elif c.form.status_ailment.data in ('SLP', 'FRZ'):
             status_bonus = 20
 
-        # Little wrapper around capture_chance...
-        def capture_chance(ball_bonus=10, **kwargs):
-            return pokedex.formulae.capture_chance(
-                percent_hp=percent_hp,
-                capture_rate=c.pokemon.species.capture_rate,
-                status_bonus=status_bonus,
-                ball_bonus=ball_bonus,
-                **kwargs
-            )
+        # Works like capture_chance, but every bonus any ball can give is
+        # worked out up front, in one go
+        capture_chance = capture.ChanceTable(
+            capture_rate=c.pokemon.species.capture_rate,
+            percent_hp=percent_hp,
+            status_bonus=status_bonus,
+        )
 
         ### Do some math!
         # c.results is a dict of ball_name => chance_tuples.
@@ -296,18 +287,8 @@ def capture_rate(request):
             relative_level = (c.form.your_level.data - 1) \
                            // c.form.level.data
 
-        # Heavy Ball partitions by 102.4 kg.  Weights are stored as...
-        # hectograms.  So.
-        weight_class = int((c.pokemon.weight - 1) / 1024)
-
-        # Ugh.
-        is_moony = c.pokemon.species.identifier in (
-            u'nidoran-m', u'nidorina', u'nidoqueen',
-            u'nidoran-f', u'nidorino', u'nidoking',
-            u'cleffa', u'clefairy', u'clefable',
-            u'igglybuff', u'jigglypuff', u'wigglytuff',
-            u'skitty', u'delcatty',
-        )
+        weight_class = capture.weight_class(c.pokemon.weight)
+        is_moony = c.pokemon.species.identifier in capture.MOON_STONE_SPECIES
 
         is_skittish = c.pokemon.base_stat('speed', 0) >= 100
 
@@ -350,22 +331,24 @@ def capture_rate(request):
                 not c.form.twitterpating.data,
                 normal_chance),
         ]
+        heavy_ball_chances = [capture_chance(capture_modifier=modifier)
+                              for modifier in capture.HEAVY_BALL_MODIFIERS]
         c.results[u'Heavy Ball']   = [
             CaptureChance(u'Target weight ≤ 102.4 kg',
                 weight_class == 0,
-                capture_chance(capture_modifier=-20)),
+                heavy_ball_chances[0]),
             CaptureChance(u'102.4 kg < target weight ≤ 204.8 kg',
                 weight_class == 1,
-                capture_chance(capture_modifier=-20)),  # sic; game bug
+                heavy_ball_chances[1]),  # sic; game bug
             CaptureChance(u'204.8 kg < target weight ≤ 307.2 kg',
                 weight_class == 2,
-                capture_chance(capture_modifier=20)),
+                heavy_ball_chances[2]),
             CaptureChance(u'307.2 kg < target weight ≤ 409.6 kg',
                 weight_class == 3,
-                capture_chance(capture_modifier=30)),
+                heavy_ball_chances[3]),
             CaptureChance(u'409.6 kg < target weight',
-                weight_class >= 4,
-                capture_chance(capture_modifier=40)),
+                weight_class == 4,
+                heavy_ball_chances[4]),
         ]
         c.results[u'Fast Ball']   = [
             CaptureChance(u'Target has base Speed of 100 or more',
@@ -488,83 +471,16 @@ def chain_breeding(request):
     #  '--- something else compatible
     # ... with Pokémon as high in the tree as possible.
 
-    # TODO make this a control yo
-    version_group = db.pokedex_session.query(t.VersionGroup).get(11)  # b/w
+    # Default to the most recent version group
+    version_group = c.form.version_group.data
+    if version_group is None:
+        version_group = _move_version_groups().all()[-1]
 
-    target = c.form.pokemon.data
-
-    # First, find every potential Pokémon in the tree: that is, every
-    # Pokémon that can learn this move at all.
-    # It's useful to know which methods go with which Pokémon, so let's
-    # store the pokemon_moves rows per Pokémon.
+    # The egg group graph for the move is precomputed per version group, so
+    # this is just a breadth-first search out from the target
     # XXX this should exclude Ditto and unbreedables
-    candidates = {}
-    pokemon_moves = db.pokedex_session.query(t.PokemonMove) \
-        .filter_by(
-            move_id=c.form.moves.data.id,
-            version_group_id=version_group.id,
-        )
-    pokemon_by_egg_group = defaultdict(set)
-    for pokemon_move in pokemon_moves:
-        candidates \
-            .setdefault(pokemon_move.pokemon, []) \
-            .append(pokemon_move)
-        for egg_group in pokemon_move.pokemon.species.egg_groups:
-            pokemon_by_egg_group[egg_group].add(pokemon_move.pokemon)
-
-    # Breeding only really cares about egg group combinations, not the
-    # individual Pokémon; for all intents and purposes, any (5, 9) Pokémon
-    # can be replaced by any other.  So build the tree out of those, first.
-    egg_group_candidates = set(
-        tuple(pokemon.species.egg_groups) for pokemon in candidates.keys()
-    )
-
-    # The above are actually edges in a graph; (5, 9) indicates that
-    # there's a viable connection between all Pokémon in egg groups 5 and
-    # 9.  The target Pokémon is sort of an anonymous node that has edges to
-    # its two breeding groups.  So build a graph!
-    egg_graph = dict()
-    # Create an isolated node for every group
-    all_egg_groups = set(egg_group for pair in egg_group_candidates
-                                   for egg_group in pair)
-    all_egg_groups.add('me')  # special sentinel value for the target
-    for egg_group in all_egg_groups:
-        egg_graph[egg_group] = dict(
-            node=egg_group,
-            adjacent=[],
-        )
-    # Fill in the adjacent edges
-    for egg_group in target.species.egg_groups:
-        egg_graph['me']['adjacent'].append(egg_graph[egg_group])
-        egg_graph[egg_group]['adjacent'].append(egg_graph['me'])
-    for egg_groups in egg_group_candidates:
-        if len(egg_groups) == 1:
-            # Pokémon in only one egg group aren't useful here
-            continue
-        a, b = egg_groups
-        egg_graph[a]['adjacent'].append(egg_graph[b])
-        egg_graph[b]['adjacent'].append(egg_graph[a])
-
-    # And now trim that down to just a tree, where nodes are placed as
-    # close to the root as possible.
-    # Start from the root ('me'), expand outwards, and remove edges that
-    # lead to nodes on a higher level.  Duplicates within a level are OK.
-    egg_tree = egg_graph['me']
-    seen = set(['me'])
-    current_level = [egg_tree]
-    current_seen = True
-    while current_seen:
-        next_level = []
-        current_seen = set()
-
-        for node in current_level:
-            node['adjacent'] = [_ for _ in node['adjacent'] if _['node'] not in seen]
-            node['adjacent'].sort(key=lambda _: _['node'].id)
-            current_seen.update(_['node'] for _ in node['adjacent'])
-            next_level.extend(node['adjacent'])
-
-        current_level = next_level
-        seen.update(current_seen)
+    egg_tree, pokemon_by_egg_group = breeding.chain_breeding_tree(
+        c.form.pokemon.data, c.form.moves.data.id, version_group.id)
 
     c.pokemon = c.form.pokemon.data
     c.pokemon_by_egg_group = pokemon_by_egg_group
@@ -573,6 +489,87 @@ def chain_breeding(request):
     return {}
 
 NUM_COMPARED_POKEMON = 9
+COMPARISON_CACHE_SIZE = 100
+
+# Everything the comparison table shows about each Pokémon
+_compared_relations = [
+    'types', 'abilities', 'hidden_ability', 'stats.stat',
+    'species.egg_groups', 'species.color', 'species.habitat', 'species.shape',
+]
+
+@precompute.index
+def _comparison_cache():
+    """Returns the cache of `_comparison_data`, by Pokémon, version group
+    and language.
+    """
+    return precompute.ResultCache(size=COMPARISON_CACHE_SIZE)
+
+def _comparison_data(pokemon, stats, version_group_id):
+    u"""Returns the parts of a comparison that are worth caching, by id.
+
+    `relatives` is a nested dict of label => Pokémon id => (value, pct),
+    where `pct` is the fraction of the way from the minimum to the maximum
+    value.  `learned` lists `(method id, move id, Pokémon id, level)` for
+    every move the Pokémon learn in the version group, in move order, and
+    `machines` maps those moves' ids to their TM/HM numbers.
+    """
+    pokemon_ids = [one_pokemon.id for one_pokemon in pokemon]
+
+    # Relative numbers -- breeding and stats.  Base stats come from the
+    # precomputed table, so every column is worked out at once
+    table = genes.base_stat_table()
+    base_stats = table.base_stats[
+        [table.pokemon_index[one_pokemon.identifier] for one_pokemon in pokemon]
+    ][:, [table.stats.index(stat.identifier) for stat in stats]]
+
+    # Use the label from the page as the key, because why not
+    labels = [u'Base EXP', u'Base happiness', u'Capture rate'] \
+        + [stat.name for stat in stats] + [u'Base stat total']
+    numbers = numpy.column_stack([
+        [one_pokemon.base_experience for one_pokemon in pokemon],
+        [one_pokemon.species.base_happiness for one_pokemon in pokemon],
+        [one_pokemon.species.capture_rate for one_pokemon in pokemon],
+        base_stats,
+        base_stats.sum(axis=1),
+    ]).astype(int)
+
+    # Avoid division by zero when everything's the same
+    lows = numbers.min(axis=0)
+    spans = numbers.max(axis=0) - lows
+    pcts = numpy.where(spans, (numbers - lows) / numpy.where(spans, spans, 1),
+                       1.0)
+
+    relatives = dict(
+        (label, dict(zip(pokemon_ids,
+                         zip(numbers[:, i].tolist(), pcts[:, i].tolist()))))
+        for i, label in enumerate(labels))
+
+    # Only the columns are needed; moves and methods are loaded by id later
+    learned = db.pokedex_session.query(
+            t.PokemonMove.pokemon_move_method_id,
+            t.PokemonMove.move_id,
+            t.PokemonMove.pokemon_id,
+            t.PokemonMove.level,
+        ) \
+        .filter(t.PokemonMove.version_group_id == version_group_id) \
+        .filter(t.PokemonMove.pokemon_id.in_(pokemon_ids)) \
+        .order_by(t.PokemonMove.order) \
+        .all()
+
+    machines = {}
+    move_ids = set(move_id for _, move_id, _, _ in learned)
+    if move_ids:
+        machines = dict(db.pokedex_session.query(
+                t.Machine.move_id, t.Machine.machine_number)
+            .filter(t.Machine.version_group_id == version_group_id)
+            .filter(t.Machine.move_id.in_(move_ids)))
+
+    return dict(
+        relatives=relatives,
+        learned=[tuple(row) for row in learned],
+        machines=machines,
+    )
+
 def _shorten_compare_pokemon(c, pokemon):
     u"""Returns a query dict for the given list of Pokémon to compare,
     shortened as much as possible.
@@ -604,13 +601,7 @@ def compare_pokemon(request):
     c.did_anything = False
 
     # Form controls use version group
-    # We join with VGPMM to filter out version groups which we lack move
-    # data for. *coughxycough*
-    c.version_groups = db.pokedex_session.query(t.VersionGroup) \
-        .join(t.VersionGroupPokemonMoveMethod) \
-        .order_by(t.VersionGroup.order.asc()) \
-        .options(joinedload('versions')) \
-        .all()
+    c.version_groups = _move_version_groups().all()
     # Grab the version to use for moves, defaulting to the most current
     try:
         c.version_group = db.pokedex_session.query(t.VersionGroup) \
@@ -654,12 +645,12 @@ def compare_pokemon(request):
             c.did_anything = True
 
             # 1.5: Deal with form matches
+            # Default forms are filled in below, all at once
             if isinstance(result, t.PokemonForm):
                 pokemon = result.pokemon
                 form = result
             else:
                 pokemon = result.default_pokemon
-                form = pokemon.default_form
 
         # 2: Use the other results as suggestions.  Doing this informs the
         # template that this was a multi-match
@@ -719,56 +710,36 @@ def compare_pokemon(request):
     if c.did_anything:
         c.stats = db.pokedex_session.query(t.Stat) \
             .filter(~ t.Stat.is_battle_only) \
+            .order_by(t.Stat.id) \
             .all()
 
-        # Relative numbers -- breeding and stats
-        # Construct a nested dictionary of label => pokemon => (value, pct)
-        # `pct` is percentage from the minimum to maximum value
-        c.relatives = dict()
-        # Use the label from the page as the key, because why not
-        relative_things = [
-            (u'Base EXP',       lambda pokemon: pokemon.base_experience),
-            (u'Base happiness', lambda pokemon: pokemon.species.base_happiness),
-            (u'Capture rate',   lambda pokemon: pokemon.species.capture_rate),
+        # Load everything the table shows in a few queries, rather than a
+        # few per Pokémon
+        unique_pokemon = sorted(
+            set(fp.pokemon for fp in c.found_pokemon if fp.pokemon),
+            key=lambda pokemon: pokemon.id)
+        hydration.load_pokemon(unique_pokemon,
+            ['species', 'default_form'] + _compared_relations)
+        c.found_pokemon = [
+            fp._replace(form=fp.form or fp.pokemon.default_form)
+            if fp.pokemon else fp
+            for fp in c.found_pokemon
         ]
-        def relative_stat_factory(local_stat):
-            return lambda pokemon: pokemon.base_stat(local_stat, 0)
-        for stat in c.stats:
-            relative_things.append((stat.name, relative_stat_factory(stat)))
-
-        relative_things.append((
-            u'Base stat total',
-            lambda pokemon: sum(pokemon.base_stat(stat, 0) for stat in c.stats)
-        ))
 
-        # Assemble the data
-        unique_pokemon = set(fp.pokemon
-            for fp in c.found_pokemon
-            if fp.pokemon
-        )
-        for label, getter in relative_things:
-            c.relatives[label] = dict()
-
-            # Get all the values at once; need to get min and max to figure
-            # out relative position
-            numbers = dict()
-            for pokemon in unique_pokemon:
-                numbers[pokemon] = getter(pokemon)
-
-            min_number = min(numbers.values())
-            max_number = max(numbers.values())
-
-            # Rig a little function to figure out the percentage, making
-            # sure to avoid division by zero
-            if min_number == max_number:
-                calc = lambda n: 1.0
-            else:
-                calc = lambda n: 1.0 * (n - min_number) \
-                                     / (max_number - min_number)
+        key = json.dumps([
+            [_.id for _ in unique_pokemon],
+            c.version_group.id,
+            db.pokedex_session.default_language_id,
+        ])
+        data = _comparison_cache().get_or_search(key,
+            lambda: _comparison_data(unique_pokemon, c.stats,
+                                     c.version_group.id))[0]
 
-            for pokemon in unique_pokemon:
-                c.relatives[label][pokemon] \
-                    = numbers[pokemon], calc(numbers[pokemon])
+        pokemon_by_id = dict((_.id, _) for _ in unique_pokemon)
+        c.relatives = dict(
+            (label, dict((pokemon_by_id[pokemon_id], numbers)
+                         for pokemon_id, numbers in values.items()))
+            for label, values in data['relatives'].items())
 
         ### Relative sizes
         raw_heights = dict(enumerate(
@@ -794,33 +765,39 @@ def compare_pokemon(request):
         # And similarly for level moves, level => pokemon => moves
         c.level_moves = defaultdict(lambda: defaultdict(list))
 
-        # Get all moves — we only need to order by order since we split
-        # everything up by method/level anyway
-        q = db.pokedex_session.query(t.PokemonMove) \
-            .filter(t.PokemonMove.version_group == c.version_group) \
-            .filter(t.PokemonMove.pokemon_id.in_(
-                _.id for _ in unique_pokemon)) \
-            .order_by(t.PokemonMove.order) \
-            .options(
-                joinedload('move'),
-                joinedload('method'),
-            )
-        for pokemon_move in q:
-            c.moves[pokemon_move.method][pokemon_move.move].add(
-                pokemon_move.pokemon)
-
-            if pokemon_move.level:
-                c.level_moves[pokemon_move.level] \
-                    [pokemon_move.pokemon].append(pokemon_move.move)
+        move_ids = sorted(set(row[1] for row in data['learned']))
+        moves = dict((move.id, move) for move in hydration.load_in_order(
+            t.Move, move_ids, joinedload('names_local')))
+        method_ids = sorted(set(row[0] for row in data['learned']))
+        methods = dict((method.id, method) for method
+                       in hydration.load_in_order(t.PokemonMoveMethod,
+                                                  method_ids))
+        for method_id, move_id, pokemon_id, level in data['learned']:
+            move = moves[move_id]
+            pokemon = pokemon_by_id[pokemon_id]
+            c.moves[methods[method_id]][move].add(pokemon)
+
+            if level:
+                c.level_moves[level][pokemon].append(move)
 
         # Get TM/HM numbers for display purposes
         c.machines = dict(
-            (machine.move, machine.machine_number)
-            for machine in c.version_group.machines
+            (moves[move_id], machine_number)
+            for move_id, machine_number in data['machines'].items()
         )
 
     return {}
 
+def _nature_modifier(nature, stat):
+    """Returns the multiplier that `nature` applies to `stat`."""
+    if not nature:
+        return 1.0
+    elif nature.increased_stat == stat:
+        return 1.1
+    elif nature.decreased_stat == stat:
+        return 0.9
+    return 1.0
+
 def stat_calculator(request):
     """Calculates, well, stats."""
     c = request.tmpl_context
@@ -887,175 +864,70 @@ def stat_calculator(request):
         params = c.form.short_formdata
         return redirect(request.current_route_url(_query=params))
 
-    def filter_genes(genes, f):
-        """Teeny helper function to only keep possible genes that fit the
-        given lambda.
-        """
-        genes &= set(gene for gene in genes if f(gene))
-
     # Okay, do some work!
-    # Dumb method for now -- XXX change this to do a binary search.
-    # Run through every possible value for each stat, see if it matches
-    # input, and give the green light if so.
+    # Every possible gene for every stat is checked against every data point
+    # at once; see the genes module.
     pokemon = c.pokemon = c.form.pokemon.data
     nature = c.form.nature.data
     if nature and nature.is_neutral:
         # Neutral nature is equivalent to none at all
         nature = None
-    # Start with lists of possibly valid genes and cut down from there
-    c.valid_range = defaultdict(dict)  # stat => level => (min, max)
-    valid_genes = {}
-    # Stuff for finding the next useful level
-    level_indices = sorted(range(c.num_data_points),
-        key=lambda i: c.form.level[i].data)
-    max_level_index = level_indices[-1]
-    max_given_level = c.form.level[max_level_index].data
-    c.next_useful_level = 100
 
-    for stat in c.stats:
-        ### Bunch of setup, per stat
-        # XXX let me stop typing this, christ
-        if stat.identifier == u'hp':
-            func = pokedex.formulae.calculated_hp
-        else:
-            func = pokedex.formulae.calculated_stat
+    data_points = range(c.num_data_points)
+    solution = genes.solve(
+        base_stats=[pokemon.base_stat(stat, 0) for stat in c.stats],
+        natures=[_nature_modifier(nature, stat) for stat in c.stats],
+        is_hp=[stat.identifier == u'hp' for stat in c.stats],
+        levels=[c.form.level[i].data for i in data_points],
+        stats=[[c.form.stat[i][stat].data for stat in c.stats]
+               for i in data_points],
+        efforts=[[c.form.effort[i][stat].data for stat in c.stats]
+                 for i in data_points],
+    )
 
-        base_stat = pokemon.base_stat(stat, 0)
-        if not base_stat:
-            valid_genes[stat] = set(range(32))
+    c.valid_range = defaultdict(dict)  # stat => level => (min, max)
+    for n, stat in enumerate(c.stats):
+        if not pokemon.base_stat(stat, 0):
             continue
+        for i in data_points:
+            c.valid_range[stat][c.form.level[i].data] = \
+                tuple(solution.ranges[i, n].tolist())
 
-        nature_mod = 1.0
-        if not nature:
-            pass
-        elif nature.increased_stat == stat:
-            nature_mod = 1.1
-        elif nature.decreased_stat == stat:
-            nature_mod = 0.9
-
-        meta_calculate_stat = functools.partial(func,
-            base_stat=base_stat, nature=nature_mod)
-
-        # Start out with everything being considered valid
-        valid_genes[stat] = set(range(32))
-
-        for i in range(c.num_data_points):
-            stat_in = c.form.stat[i][stat].data
-            effort_in = c.form.effort[i][stat].data
-            level = c.form.level[i].data
-
-            calculate_stat = functools.partial(meta_calculate_stat,
-                effort=effort_in, level=level)
-
-            c.valid_range[stat][level] = min_stat, max_stat = \
-                calculate_stat(iv=0), calculate_stat(iv=31)
-
-            ### Actual work!
-            # Quick simple check: if the input is totally outside the valid
-            # range, no need to calculate anything
-            if not min_stat <= stat_in <= max_stat:
-                valid_genes[stat] = set()
-            if not valid_genes[stat]:
-                continue
-
-            # Run through and maybe invalidate each gene
-            filter_genes(valid_genes[stat],
-                lambda gene: calculate_stat(iv=gene) == stat_in)
-
-        # Find the next "useful" level.  This is the lowest level at which
-        # at least two possible genes give different stats, given how much
-        # effort the Pokémon has now.
-        # TODO should this show the *highest* level necessary to get exact?
-        if valid_genes[stat]:
-            min_gene = min(valid_genes[stat])
-            max_gene = max(valid_genes[stat])
-            max_effort = c.form.effort[max_level_index][stat].data
-            while level < c.next_useful_level and \
-                meta_calculate_stat(level=level, effort=max_effort, iv=min_gene) == \
-                meta_calculate_stat(level=level, effort=max_effort, iv=max_gene):
-
-                level += 1
-            c.next_useful_level = level
-
+    max_given_level = max(c.form.level[i].data for i in data_points)
+    c.next_useful_level = solution.next_useful_level
     c.form.level[-1].data = c.next_useful_level
 
-    # Hidden Power type
+    # Hidden Power and characteristics work with bitmasks of possible genes
+    hidden_power_type = None
     if c.form.hp_type.data:
         # Shift the type id to make Fighting (id=2) #0
-        hp_type = c.form.hp_type.data.id - 2
-
-        # See below for how this is calculated.
-        # We know x * 15 // 63 == hp_type, and want a range for x.
-        # hp_type * 63 / 15 is the LOWER bound, though you need to ceil()
-        # it to find the lower integral bound.
-        # The same thing for (hp_type + 1) is the lower bound for the next
-        # type, which is one more than our upper bound.  Cool.
-        min_x = int(math.ceil(hp_type * 63 / 15))
-        max_x = int(math.ceil((hp_type + 1) * 63 / 15) - 1)
-
-        # Now we need to find how many bits from the left will stay the
-        # same throughout this x-range, so we know that those bits must
-        # belong to the corresponding stats.  Easy if you note that, if
-        # min_x and max_x have the same leftmost n bits, so will every
-        # integer between them.
-        first_good_bit = None
-        for n in range(6):
-            # Convert "3" to 0b111000
-            # 3 -> 0b1000 -> 0b111 -> 0b111000
-            mask = 63 ^ ((1 << n) - 1)
-            if min_x & mask == max_x & mask:
-                first_good_bit = n
-                break
-        if first_good_bit is not None:
-            # OK, cool!  Now we know some number of stats are either
-            # definitely odd or definitely even.
-            for stat_id in range(first_good_bit, 6):
-                bit = (min_x >> stat_id) & 1
-                stat = hidden_power_stats[stat_id]
-                filter_genes(valid_genes[stat],
-                    lambda gene: gene & 1 == bit)
-
-    # Characteristic; needs to be last since it imposes a maximum
+        hidden_power_type = c.form.hp_type.data.id - 2
+
+    characteristic = None
     hint = c.form.hint.data
     if hint:
-        # Knock out everything that doesn't match its mod-5
-        filter_genes(valid_genes[hint.stat],
-            lambda gene: gene % 5 == hint.gene_mod_5)
-
-        # Also, the characteristic is only shown for the highest gene.  So,
-        # no other stat can be higher than the new maximum for the hinted
-        # stat.  (Need the extra -1 in case there are actually no valid
-        # genes left; max() dies with an empty sequence.)
-        max_gene = max(itertools.chain(valid_genes[hint.stat], (-1,)))
-        for genes in valid_genes.values():
-            filter_genes(genes, lambda gene: gene <= max_gene)
-
-        # Similarly, this gene can't possibly be lower than the minimum of
-        # any other stat.
-        for genes in valid_genes.values():
-            min_gene = min(itertools.chain(genes, (999,)))
-            filter_genes(
-                valid_genes[hint.stat], lambda gene: gene >= min_gene)
+        characteristic = c.stats.index(hint.stat), hint.gene_mod_5
+
+    gene_bits = dict(zip(c.stats, genes.constrain(
+        solution.genes,
+        [c.stats.index(stat) for stat in hidden_power_stats],
+        hidden_power_type, characteristic)))
+
+    valid_genes = dict((stat, set(genes.to_genes(bits)))
+                       for stat, bits in gene_bits.items())
 
     # Possibly calculate Hidden Power's type and power, if the results are
     # exact
-    c.exact = all(len(genes) == 1 for genes in valid_genes.values())
+    c.exact = all(len(stat_genes) == 1 for stat_genes in valid_genes.values())
     if c.exact:
-        # HP uses bit 0 of each gene for the type, and bit 1 for the power.
-        # These bits are used to make new six-bit numbers, where HP goes to
-        # bit 0, Attack to bit 1, etc.
-        type_det = 0
-        power_det = 0
-        for i, stat in enumerate(hidden_power_stats):
-            stat_value, = valid_genes[stat]
-            type_det += (stat_value & 0x01) << i
-            power_det += (stat_value & 0x02) >> 1 << i
+        hp_type, c.hidden_power_power = genes.hidden_power(
+            [genes.to_genes(gene_bits[stat])[0]
+             for stat in hidden_power_stats])
 
         # Our types are also in the correct order, except that we start
         # from 1 rather than 0, and HP skips Normal
         c.hidden_power_type = db.pokedex_session.query(t.Type) \
-            .get(type_det * 15 // 63 + 2)
-        c.hidden_power_power = power_det * 40 // 63 + 30
+            .get(hp_type + 2)
 
         # Used for a link
         c.hidden_power = db.pokedex_session.query(t.Move) \
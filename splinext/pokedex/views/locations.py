@@ -2,13 +2,13 @@
 
 from collections import defaultdict
 
-from sqlalchemy.orm import (joinedload, joinedload_all, subqueryload, subqueryload_all)
 from sqlalchemy.orm.exc import NoResultFound
 import pyramid.httpexceptions as exc
 
 import pokedex.db.tables as t
 
 from .. import db
+from .. import encounters
 
 # Dict of method identifier => icon path
 encounter_method_icons = {
@@ -115,17 +115,6 @@ def location_view(request):
     # Then by pokemon -- table rows.
     # Then by version -- table columns.
     # Finally, condition values associated with levels/rarity.
-    q = db.pokedex_session.query(t.Encounter) \
-        .options(
-            joinedload_all('condition_values'),
-            joinedload_all('slot.method'),
-            joinedload_all('pokemon.species'),
-            joinedload('version'),
-        ) \
-        .filter(t.Encounter.location_area_id.in_(
-            x.id for areas in c.region_areas.values() for x in areas
-        ))
-
     # area => method => pokemon => version => condition =>
     #     condition_values => encounter_bits
     grouped_encounters = defaultdict(
@@ -133,9 +122,7 @@ def location_view(request):
             lambda: defaultdict(
                 lambda: defaultdict(
                     lambda: defaultdict(
-                        lambda: defaultdict(
-                            list
-                        )
+                        dict
                     )
                 )
             )
@@ -151,35 +138,23 @@ def location_view(request):
     # Got all that?
     area_generations = defaultdict(set)
 
-    for encounter in q.all():
-        # Fetches the list of encounters that match this region, version,
-        # method, etc.
-
+    location_areas = [area for areas in c.region_areas.values()
+                           for area in areas]
+    for summary in encounters.area_encounters(location_areas):
         # n.b.: conditions and values must be tuples because lists aren't
-        # hashable.
-        encounter_bits = grouped_encounters \
-            [encounter.location_area] \
-            [encounter.slot.method] \
-            [encounter.pokemon] \
-            [encounter.version] \
-            [ tuple(cv.condition for cv in encounter.condition_values) ] \
-            [ tuple(encounter.condition_values) ]
-
-        # Combine "level 3-4, 50%" and "level 3-4, 20%" into "level 3-4, 70%".
-        existing_encounter = filter(lambda enc: enc['min_level'] == encounter.min_level
-                                            and enc['max_level'] == encounter.max_level,
-                                    encounter_bits)
-        if existing_encounter:
-            existing_encounter[0]['rarity'] += encounter.slot.rarity
-        else:
-            encounter_bits.append({
-                'min_level': encounter.min_level,
-                'max_level': encounter.max_level,
-                'rarity': encounter.slot.rarity,
-            })
+        # hashable.  Rarities for identical level ranges have already been
+        # combined.
+        grouped_encounters \
+            [summary.location_area] \
+            [summary.method] \
+            [summary.pokemon] \
+            [summary.version] \
+            [ tuple(cv.condition for cv in summary.condition_values) ] \
+            [ summary.condition_values ] = summary.levels
 
         # Remember that this generation appears in this area
-        area_generations[encounter.location_area].add(encounter.version.version_group.generation)
+        area_generations[summary.location_area].add(
+            summary.version.version_group.generation)
 
     c.grouped_encounters = grouped_encounters
 
@@ -12,11 +12,10 @@ import pyramid.httpexceptions as exc
 import pokedex.db.tables as t
 
 from .. import db
+from ..movetables import (move_tutor_version_groups,
+    collapse_pokemon_move_columns, pokemon_move_method_sort_key)
 from . import caching
 
-# XXX(pyramid): move these to a shared module
-from .pokemon import _move_tutor_version_groups, _collapse_pokemon_move_columns, _pokemon_move_method_sort_key
-
 def first(func, iterable):
     """Returns the first element in iterable for which func(elem) is true.
 
@@ -234,7 +233,7 @@ def _do_move(request, cache_key):
 
     # Convert the entire dictionary to a list of tuples and sort it
     c.pokemon = pokemon_methods.items()
-    c.pokemon.sort(key=_pokemon_move_method_sort_key)
+    c.pokemon.sort(key=pokemon_move_method_sort_key)
 
     for method, method_list in c.pokemon:
         # Sort each method's rows by their Pokémon
@@ -242,10 +241,10 @@ def _do_move(request, cache_key):
 
     # Finally, collapse identical columns within the same generation
     c.pokemon_columns \
-        = _collapse_pokemon_move_columns(table=c.pokemon, thing=c.move)
+        = collapse_pokemon_move_columns(table=c.pokemon, thing=c.move)
 
     # Grab list of all the version groups with tutor moves
-    c.move_tutor_version_groups = _move_tutor_version_groups(c.pokemon)
+    c.move_tutor_version_groups = move_tutor_version_groups(c.pokemon)
 
     # Total number of Pokémon that learn this move
     c.pokemon_count = db.pokedex_session.query(t.Pokemon).filter(
@@ -1,26 +1,31 @@
 # encoding: utf8
 from __future__ import absolute_import, division
 
+import json
 import re
+from collections import namedtuple
 from string import Template
 
+import numpy
 from wtforms import Form, fields
-from wtforms.ext.sqlalchemy.fields import QuerySelectField
 
 import pokedex.db.tables as t
 import pyramid.httpexceptions as exc
-from sqlalchemy.orm import aliased, joinedload, joinedload_all
-from sqlalchemy.sql import func, and_, not_, or_
-from sqlalchemy.sql.operators import asc_op
+from sqlalchemy.orm import joinedload, joinedload_all
 
 from .. import db
 from .. import helpers as pokedex_helpers
+from .. import hydration
 from .. import splinehelpers as h
 from .. import magnitude
+from .. import precompute
+from .. import searchindex
+from . import export
 
 from splinext.pokedex.forms import (
-    DuplicateField, MultiCheckboxField, PokedexLookupField,
-    QueryCheckboxSelectMultipleField, RangeTextField, StatField,
+    CachedQuerySelectField, DuplicateField, MultiCheckboxField,
+    PokedexLookupField, QueryCheckboxSelectMultipleField, RangeTextField,
+    StatField,
 )
 
 redirect = exc.HTTPFound
@@ -80,25 +85,105 @@ def version_icons(versions):
 
 ## Forms
 
-def ilike(column, string):
+def wildcard_mask(strings, string, ngrams=None):
+    """Matches a list of already-lowercased strings against a search string,
+    case-insensitively; returns a boolean array.  None never matches.
+
+    `*` and `?` work as wildcards.  If there are none, any string containing
+    the search string matches.
+
+    `ngrams` is an optional `searchindex.NgramIndex` of `strings`, used to
+    only check the strings that could possibly match.
+    """
     string = string.lower()
 
     # If there are no wildcards, assume it's a partial match
     if '*' not in string and '?' not in string:
         string = u"*{0}*".format(string)
 
-    # LIKE wildcards should be escaped: % -> ^%, _ -> ^_, ^ -> ^^
-    # Our wildcards should be changed: * -> %, ? -> _
-    # And all at once.
-    translations = {
-        '%': u'^%',     '_': u'^_',     '^': u'^^',
-        '*': u'%',      '?': u'_',
-    }
-    string = re.sub(ur'([%_*?^])',
-                    lambda match: translations[match.group(0)],
-                    string)
+    pattern = u''.join(
+        u'.*' if char == u'*' else u'.' if char == u'?' else re.escape(char)
+        for char in string)
+    regex = re.compile(pattern + ur'\Z', re.DOTALL | re.UNICODE)
+
+    rows = None
+    if ngrams is not None:
+        rows = ngrams.candidates(string)
+    if rows is None:
+        return numpy.array([other is not None and regex.match(other) is not None
+                            for other in strings], dtype=bool)
+
+    mask = numpy.zeros(len(strings), dtype=bool)
+    for row in rows:
+        if regex.match(strings[row]) is not None:
+            mask[row] = True
+    return mask
+
+def _paginate(request, rows, row_ids, groups=None):
+    """Cuts the sorted `rows` of a search down to the page asked for by the
+    `after` parameter.  Pages don't split runs of rows in the same `groups`,
+    if given.
+    """
+    c = request.tmpl_context
+    try:
+        after = int(request.params['after'])
+    except (KeyError, ValueError):
+        after = None
+
+    rows, next_after = searchindex.page(rows, row_ids, after, groups=groups)
+
+    # The template builds the links from these
+    c.page_query = [(key, value) for (key, value) in request.params.items()
+                    if key != 'after']
+    c.page_after = after
+    c.next_page_after = next_after
+
+    return rows
+
+def _pokemon_eagerloads(display_columns, evolution_chain=False):
+    """Returns the relations to load for a table of Pokémon with the given
+    columns.
+    """
+    eagerloads = []
+
+    if 'icon' in display_columns:
+        eagerloads.append('default_form')
+
+    if 'type' in display_columns:
+        eagerloads.append('types')
 
-    return func.lower(column).like(string, escape='^')
+    if 'ability' in display_columns:
+        eagerloads.append('abilities')
+
+    if 'hidden_ability' in display_columns:
+        eagerloads.append('hidden_ability')
+
+    if 'egg_group' in display_columns:
+        eagerloads.append('species.egg_groups')
+
+    for column in ('color', 'habitat', 'shape'):
+        if column in display_columns:
+            eagerloads.append('species.' + column)
+
+    if any(column[0:5] == 'stat_' for column in display_columns) \
+        or 'effort' in display_columns:
+
+        eagerloads.append('stats.stat')
+
+    if evolution_chain:
+        # Gotta know the chain itself and the parent Pokémon to make the
+        # cool indented tree work
+        eagerloads.append('species.parent_species')
+
+    return eagerloads
+
+def _export_columns(c, default_columns):
+    """Returns the columns to export: whatever the custom table would show,
+    or the default table's.
+    """
+    if c.display_mode == 'custom-table':
+        return c.display_columns
+    return default_columns
 
 
 def in_pokedex_label(pokedex):
@@ -185,7 +270,7 @@ class PokemonSearchForm(BaseSearchForm):
     name = fields.StringField('Name', default=u'')
     ability = PokedexLookupField('Ability', valid_type='ability', allow_blank=True)
     held_item = PokedexLookupField('Held item', valid_type='item', allow_blank=True)
-    growth_rate = QuerySelectField('Growth rate',
+    growth_rate = CachedQuerySelectField('Growth rate',
         query_factory=lambda: db.pokedex_session.query(t.GrowthRate) \
             .options(joinedload('max_experience_obj')),
         get_pk=lambda _: _.max_experience,
@@ -240,7 +325,7 @@ class PokemonSearchForm(BaseSearchForm):
         default='all',
     )
     egg_group = DuplicateField(
-        QuerySelectField(
+        CachedQuerySelectField(
             'Egg group',
             query_factory=lambda: db.pokedex_session.query(t.EggGroup),
             get_label=lambda _: _.name,
@@ -338,19 +423,19 @@ class PokemonSearchForm(BaseSearchForm):
 
     # Flavor
     genus = fields.StringField('Species', default=u'')
-    color = QuerySelectField('Color',
+    color = CachedQuerySelectField('Color',
         query_factory=lambda: db.pokedex_session.query(t.PokemonColor),
         get_label=lambda _: _.name,
         allow_blank=True,
         get_pk=lambda table: table.identifier,
     )
-    habitat = QuerySelectField('Habitat',
+    habitat = CachedQuerySelectField('Habitat',
         query_factory=lambda: db.pokedex_session.query(t.PokemonHabitat),
         get_label=lambda _: _.name,
         allow_blank=True,
         get_pk=lambda table: table.identifier,
     )
-    shape = QuerySelectField('Shape',
+    shape = CachedQuerySelectField('Shape',
         query_factory=lambda: db.pokedex_session.query(t.PokemonShape)
             .order_by(t.PokemonShape.identifier.asc()),
         get_label=lambda _: _.name,
@@ -462,7 +547,7 @@ class MoveSearchForm(BaseSearchForm):
         get_pk=lambda table: table.id,
     )
 
-    target = QuerySelectField('Target',
+    target = CachedQuerySelectField('Target',
         query_factory=lambda: (db.pokedex_session.query(t.MoveTarget)
             .filter(t.MoveTarget.identifier != u'selected-pokemon-me-first')),
         get_pk=lambda _: _.id,
@@ -582,14 +667,35 @@ class MoveSearchForm(BaseSearchForm):
     format = fields.StringField('Custom list format', default=u'$name')
 
 
-def pokemon_search(request):
-    c = request.tmpl_context
+## Search form classes
+# Some fields are generated from the database, so the form classes are built
+# on first use, once per data version and language, and shared after that
+
+# Stand-in for a Stat, which doesn't go stale when the session is discarded
+StatInfo = namedtuple('StatInfo', ['id', 'identifier', 'name'])
 
+@precompute.index
+def _search_forms():
+    """Returns a dict of built search forms; see `_search_form`."""
+    return {}
+
+def _search_form(kind, build):
+    """Returns the result of `build()`, cached by `kind` and language."""
+    key = kind, db.pokedex_session.default_language_id
+    forms = _search_forms()
+    if key not in forms:
+        forms[key] = build()
+    return forms[key]
+
+def _build_pokemon_search_form():
+    """Returns a PokemonSearchForm subclass with fields for base stats and
+    effort, and a list of `(stat_id, field_name)` for those fields.
+    """
     class F(PokemonSearchForm):
         pass
 
     # Add stat-based fields dynamically
-    c.stat_fields = []
+    stat_fields = []
     for stat in db.pokedex_session.query(t.Stat) \
                                .filter(~t.Stat.is_battle_only) \
                                .order_by(t.Stat.id):
@@ -598,167 +704,145 @@ def pokemon_search(request):
         stat_field = RangeTextField(stat.name, inflator=int)
         effort_field = RangeTextField(stat.name, inflator=int)
 
-        c.stat_fields.append((stat.id, field_name))
+        stat_fields.append((stat.id, field_name))
 
         setattr(F, 'stat_' + field_name, stat_field)
         setattr(F, 'effort_' + field_name, effort_field)
 
+    return F, stat_fields
 
-    ### Parse form, etc etc
-    c.form = F(request.params)
-    c.form.validate()
+def _build_move_search_form():
+    """Returns a MoveSearchForm subclass with fields for stat changes and
+    flags, and a list of `(field_name, flag_id)` for the latter.
+    """
+    stats = [StatInfo(stat.id, stat.identifier, stat.name)
+             for stat in db.pokedex_session.query(t.Stat)]
 
-    # Rendering needs to know which version groups go with which
-    # generations for the move-version-group list
-    c.generations = db.pokedex_session.query(t.Generation) \
-        .options(joinedload('version_groups')) \
-        .order_by(t.Generation.id.asc())
+    class F(MoveSearchForm):
+        stat_change = StatField(stats, RangeTextField('', inflator=int, signed=True))
 
-    # Rendering also needs an example Pokémon, to make the custom list docs
-    # reliable
-    c.eevee = db.pokedex_session.query(t.Pokemon).get(133)
+    # Add flag fields dynamically
+    flag_fields = []
+    for flag in db.pokedex_session.query(t.MoveFlag) \
+                                  .order_by(t.MoveFlag.id):
+        field_name = 'flag_' + flag.identifier
+        field = fields.SelectField(flag.name,
+            choices=[
+                (u'any',    u''),
+                (u'yes',    u'Yes'),
+                (u'no',     u'No'),
+            ],
+            default=u'any',
+        )
 
-    # If this is the first time the form was submitted, redirect to a URL
-    # with only non-default values
-    if c.form.is_valid and c.form.was_submitted and c.form.needs_shortening:
-        return redirect(request.current_route_url(_query=c.form.cleansed_data.mixed()))
+        flag_fields.append((field_name, flag.id))
+        setattr(F, field_name, field)
 
-    if not c.form.was_submitted or not c.form.is_valid:
-        # Either blank, or errortastic.  Skip the logic and just send the
-        # form back
-        return {}
+    return F, flag_fields
 
 
-    ### Do the searching!
-    me = t.Pokemon
-    my_species = t.PokemonSpecies
-    query = db.pokedex_session.query(me).join((my_species, me.species))
-    query = query.join(my_species.names_local)
-
-    # Several joins need to know the default form
-    default_form = t.PokemonForm
-    query = query.outerjoin((default_form, me.default_form))
-
-    # Sorting and filtering by stat both need to join to the stat table for
-    # the specific stat in question.  Keep track of these joins to avoid
-    # doing them multiple times
-    stat_aliases = {}
-    def join_to_stat(stat):
-        # stat can be an id, object, or identifier
-        if isinstance(stat, basestring):
-            stat = db.pokedex_session.query(t.Stat) \
-                .filter_by(identifier=stat).one()
-        elif isinstance(stat, int):
-            stat = db.pokedex_session.query(t.Stat).get(stat)
-
-        if stat not in stat_aliases:
-            stat_alias = aliased(t.PokemonStat)
-            new_query = query.join(stat_alias)
-            new_query = new_query.filter(stat_alias.stat_id == stat.id)
-            stat_aliases[stat] = stat_alias
-        else:
-            new_query = query
+## Searching
+
+# What a search finds: `rows` of the search index, in order, and some counts.
+# `original_results` is the set of ids that actually matched, when sorting
+# by evolution chain pads the results out with whole families.
+SearchResults = namedtuple('SearchResults',
+    ['rows', 'species_count', 'total_count', 'original_results'])
 
-        return new_query, stat_aliases[stat]
+# Parameters that only change how results are shown, not what they are
+_display_only_params = frozenset(
+    [u'after', u'column', u'export', u'format', u'shorten'])
 
-    stat_total_subquery = None
-    def join_to_stat_total():
-        new_query = query
-        subquery = stat_total_subquery
+def _search_key(request, kind):
+    """Returns a string identifying the search in `request`.
 
-        if subquery is None:
-            alias = aliased(t.PokemonStat)
-            subquery = db.pokedex_session.query(
-                alias.pokemon_id,
-                func.sum(alias.base_stat).label('stat_total'),
-                func.sum(alias.effort).label('effort_total')
-            ).group_by(alias.pokemon_id).subquery()
+    Much like the form's `cleansed_data`: parameters left at their defaults
+    are dropped, and the rest are sorted, so the same search always gets the
+    same key.
+    """
+    form = request.tmpl_context.form
+    params = []
+    for name, value in request.params.items():
+        if name in _display_only_params:
+            continue
+        if name in form and form[name].data == form[name].default:
+            continue
+        params.append((name, value))
+    params.sort()
 
-            new_query = new_query.outerjoin(subquery,
-                me.id == subquery.c.pokemon_id)
+    return json.dumps([kind, db.pokedex_session.default_language_id, params])
 
-        return new_query, subquery
+def _cached_search(request, kind, search):
+    """Returns the `SearchResults` from `search()`, or from the result cache
+    if the same search has been run recently.
 
-    # Same applies to a couple other t...
-    joins = []
-    def join_once(relation):
-        if relation in joins:
-            return query
+    As with the content cache, c.timer.from_cache says which it was.
+    """
+    results, hit = searchindex.result_cache().get_or_search(
+        _search_key(request, kind), search)
 
-        new_query = query.join(relation)
-        joins.append(relation)
-        return new_query
+    timer = getattr(request.tmpl_context, 'timer', None)
+    if timer is not None:
+        timer.from_cache = hit
+
+    return results
+
+def _search_pokemon(c, index):
+    """Runs the Pokémon search described by `c.form` against `index`, and
+    returns a `SearchResults`.
+    """
+    ### Do the searching!
+    # Everything we can search on is already in memory; each criterion just
+    # narrows down a mask of the rows of the index
+    mask = index.everything()
 
     # ID
     if c.form.id.data:
-        query = query.filter(c.form.id.data(my_species.id))
+        mask &= c.form.id.data.mask(index.species_ids)
 
     # Name
     if c.form.name.data:
         name = c.form.name.data.strip().lower()
 
-        query = query.outerjoin(default_form.names_local)
-        query = query.filter(
-            or_(
-                # Either it was a form name...
-                ilike(default_form.names_table.pokemon_name, name),
-                # ...or not.
-                ilike(my_species.names_table.name, name),
-            )
-        )
+        # Either it was a form name, or not
+        mask &= (wildcard_mask(index.form_names, name,
+                               index.form_name_ngrams) |
+                 wildcard_mask(index.names, name, index.name_ngrams))
 
     # Ability
     if c.form.ability.data:
-        query = query.filter(
-            me.all_abilities.any(
-                t.Ability.id == c.form.ability.data.id
-            )
-        )
+        mask &= searchindex.any_of(index.abilities, index.ability_columns,
+                                   [c.form.ability.data.id])
 
     # Held item
     if c.form.held_item.data:
-        item_subquery = db.pokedex_session.query(
-                t.PokemonItem.pokemon_id
-            ) \
-            .filter_by(item_id=c.form.held_item.data.id) \
-            .subquery()
-
-        query = query.join((item_subquery,
-            me.id == item_subquery.c.pokemon_id))
+        mask &= index.rows_mask(
+            index.held_item_rows.get(c.form.held_item.data.id, []))
 
     # Growth rate
     if c.form.growth_rate.data:
-        query = query.filter(my_species.growth_rate == c.form.growth_rate.data)
+        mask &= index.growth_rate_id == c.form.growth_rate.data.id
 
     # Type
     if c.form.type.data:
         type_ids = [_.id for _ in c.form.type.data]
 
         if c.form.type_operator.data == u'any':
-            # Well, this is easy; be lazy and use EXISTS
-            query = query.filter(
-                me.types.any( t.Type.id.in_(type_ids) )
-            )
+            mask &= searchindex.any_of(
+                index.types, index.type_columns, type_ids)
 
         elif c.form.type_operator.data == u'only':
             # None of this Pokémon's types can be not selected.  Right.
-            query = query.filter(
-                ~ me.types.any( ~ t.Type.id.in_(type_ids) )
-            )
+            mask &= searchindex.only(
+                index.types, index.type_columns, type_ids)
 
         elif c.form.type_operator.data == u'exact':
-            # This one is interesting, and not quite so easy to express
-            # with set operations.  It's like 'only', except every selected
-            # type also must be one of the Pokémon's types.  Thus we
-            # combine the above two approaches:
-            query = query.filter(
-                ~ me.types.any( ~ t.Type.id.in_(type_ids) )
-            )
-
-            for type_id in type_ids:
-                query = query.filter(
-                    me.types.any( t.Type.id == type_id )
-                )
+            # Like 'only', except every selected type also must be one of
+            # the Pokémon's types
+            mask &= searchindex.only(
+                index.types, index.type_columns, type_ids)
+            mask &= searchindex.all_of(
+                index.types, index.type_columns, type_ids)
 
     # Gender distribution
     if c.form.gender_rate.data:
@@ -767,214 +851,73 @@ def pokemon_search(request):
 
         # Genderless ignores the operator
         if gender_rate == -1 or gender_rate_op == 'equal':
-            clause = my_species.gender_rate == gender_rate
+            clause = index.gender_rate == gender_rate
         elif gender_rate_op == 'less_equal':
-            clause = my_species.gender_rate <= gender_rate
+            clause = index.gender_rate <= gender_rate
         elif gender_rate_op == 'more_equal':
-            clause = my_species.gender_rate >= gender_rate
+            clause = index.gender_rate >= gender_rate
 
         if gender_rate != -1:
             # No amount of math should make "<= 1/4 female" include
             # genderless
-            clause = and_(clause, my_species.gender_rate != -1)
+            clause &= index.gender_rate != -1
 
-        query = query.filter(clause)
+        mask &= clause
 
     # Egg groups
     if any(c.form.egg_group.data):
-        clauses = []
-        for egg_group in c.form.egg_group.data:
-            if not egg_group:
-                continue
-            subclause = my_species.egg_groups.any(
-                t.EggGroup.id == egg_group.id
-            )
-            clauses.append(subclause)
+        egg_group_ids = [egg_group.id for egg_group in c.form.egg_group.data
+                         if egg_group]
 
         if c.form.egg_group_operator.data == 'any':
-            clause = or_(*clauses)
+            mask &= searchindex.any_of(
+                index.egg_groups, index.egg_group_columns, egg_group_ids)
         elif c.form.egg_group_operator.data == 'all':
-            clause = and_(*clauses)
-
-        query = query.filter(clause)
+            mask &= searchindex.all_of(
+                index.egg_groups, index.egg_group_columns, egg_group_ids)
 
     # Evolution stuff
-    # Try to limit our joins without duplicating too much code
-    # Stage and position generally need to know parents:
-    if c.form.evolution_stage.data or c.form.evolution_position.data or \
-       c.form.evolution_special.data:
-        # NOTE: This makes the assumption that evolution chains are never
-        # more than three Pokémon long.  So far, this is pretty safe, as in
-        # 10+ years no Pokémon has ever been able to evolve more than
-        # twice.  If this changes, then either this query will need a
-        # greatgrandparent, or (likely) the table structure will change
-        parent_species = aliased(t.PokemonSpecies)
-        grandparent_species = aliased(t.PokemonSpecies)
-
-        query = query.outerjoin(
-            # If we're a specific form, check the base form, too
-            (t.PokemonEvolution,
-                t.PokemonEvolution.evolved_species_id == my_species.id),
-            (parent_species, my_species.parent_species),
-
-            # No Pokémon ever evolve, gain forms, then evolve again
-            (grandparent_species, parent_species.parent_species)
-        )
-
-    # ...whereas position and special tend to need children
-    if c.form.evolution_position.data or c.form.evolution_special.data:
-        child_species = aliased(t.PokemonSpecies)
-        child_subquery = db.pokedex_session.query(
-                child_species.evolves_from_species_id.label('parent_id'),
-                func.count('*').label('child_count'),
-            ) \
-            .group_by(child_species.evolves_from_species_id) \
-            .subquery()
-
-        query = query.outerjoin((child_subquery,
-            my_species.id == child_subquery.c.parent_id))
-
+    # Every species' place in its chain is worked out ahead of time, so these
+    # are straight comparisons
     if c.form.evolution_stage.data:
-        # Collect clauses for the requested stages and add to the query
-        clauses = []
-        if u'baby' in c.form.evolution_stage.data:
-            # Baby form: is_baby.  Cool, easy.
-            clauses.append( my_species.is_baby == True )
-
-        if u'basic' in c.form.evolution_stage.data:
-            # Basic: this is not a baby.  Either there's no parent, or
-            # parent is a baby
-            clauses.append(
-                and_(
-                    my_species.is_baby == False,
-                    or_(
-                        parent_species.id == None,
-                        parent_species.is_baby == True,
-                    )
-                )
-            )
-
-        if u'stage1' in c.form.evolution_stage.data:
-            # Stage 1: parent exists and is not a baby.  Grandparent either
-            # doesn't exist or is a baby
-            clauses.append(
-                and_(
-                    parent_species.id != None,
-                    parent_species.is_baby == False,
-                    or_(
-                        grandparent_species.id == None,
-                        grandparent_species.is_baby == True,
-                    ),
-                )
-            )
-
-        if u'stage2' in c.form.evolution_stage.data:
-            # Stage 2: grandparent exists and is not a baby
-            clauses.append(
-                and_(
-                    grandparent_species.id != None,
-                    grandparent_species.is_baby == False,
-                )
-            )
-
-        query = query.filter(or_(*clauses))
+        mask &= numpy.in1d(index.evolution_stage,
+                           c.form.evolution_stage.data)
 
     if c.form.evolution_position.data:
-        # Same story
-        clauses = []
-
-        if u'first' in c.form.evolution_position.data:
-            # No parent; at least one child
-            clauses.append(
-                and_(
-                    parent_species.id == None,
-                    child_subquery.c.child_count != None,
-                )
-            )
-
-        if u'middle' in c.form.evolution_position.data:
-            # Has a parent AND a child
-            clauses.append(
-                and_(
-                    parent_species.id != None,
-                    child_subquery.c.child_count != None,
-                )
-            )
-
-        if u'last' in c.form.evolution_position.data:
-            # Has a parent but no children
-            clauses.append(
-                and_(
-                    parent_species.id != None,
-                    child_subquery.c.child_count == None
-                )
-            )
-
-        if u'only' in c.form.evolution_position.data:
-            # No parent or children
-            clauses.append(
-                and_(
-                    parent_species.id == None,
-                    child_subquery.c.child_count == None,
-                )
-            )
-
-        query = query.filter(or_(*clauses))
+        mask &= numpy.in1d(index.evolution_position,
+                           c.form.evolution_position.data)
 
     if c.form.evolution_special.data:
-        clauses = []
+        special_mask = numpy.zeros(len(index), dtype=bool)
 
         if u'branching' in c.form.evolution_special.data:
             # Branching means: multiple children.  Easy!
-            clauses.append( child_subquery.c.child_count > 1 )
+            special_mask |= index.branching
 
         if u'branched' in c.form.evolution_special.data:
-            # Need to join to..  siblings.  Ugh.
-            sibling_species = aliased(t.PokemonSpecies)
-            sibling_subquery = db.pokedex_session.query(
-                sibling_species.evolves_from_species_id.label('parent_id'),
-                func.count('*').label('sibling_count'),
-            ) \
-                .group_by(sibling_species.evolves_from_species_id) \
-                .subquery()
-
-            query = query.outerjoin((
-                sibling_subquery,
-                parent_species.id == sibling_subquery.c.parent_id
-            ))
+            # Branched means the parent has multiple children
+            special_mask |= index.branched
 
-            clauses.append( sibling_subquery.c.sibling_count > 1 )
-
-        query = query.filter(or_(*clauses))
+        mask &= special_mask
 
     # Generation
     if c.form.introduced_in.data:
-        query = query.filter(
-            my_species.generation_id.in_(data.id for data in c.form.introduced_in.data)
-        )
+        mask &= numpy.in1d(index.generation_id,
+            [data.id for data in c.form.introduced_in.data])
 
     # Regional dex inclusion
     if c.form.in_pokedex.data:
-        pokedex_query = db.pokedex_session.query(
-                t.PokemonDexNumber.species_id) \
-            .filter(t.PokemonDexNumber.pokedex_id.in_(
-                data.id for data in c.form.in_pokedex.data))
-
-        query = query.filter(my_species.id.in_(pokedex_query.subquery()))
+        mask &= searchindex.any_of(index.pokedexes, index.pokedex_columns,
+            [data.id for data in c.form.in_pokedex.data])
 
     # Moves
-    # To avoid stupid group-by-having-count tricks, each move needs to
-    # check a separate subquery of Pokémon that learn the given move
-    # under the given conditions.
-    pokemoves_filter = []
-    if c.form.move_version_group.data:
-        pokemoves_filter.append(t.PokemonMove.version_group_id.in_(
-            [_.id for _ in c.form.move_version_group.data]))
-    if c.form.move_method.data:
-        pokemoves_filter.append(
-            t.PokemonMove.pokemon_move_method_id.in_(
-                [_.id for _ in c.form.move_method.data])
-        )
+    # Each move narrows the results down to the Pokémon that learn it under
+    # the given conditions
+    if c.form.move.data:
+        learnsets = searchindex.learnset_index()
+        version_group_ids = [_.id for _ in c.form.move_version_group.data]
+        method_ids = [_.id for _ in c.form.move_method.data]
+
     for move in c.form.move.data:
         # Apply fuzzing
         if c.form.move_fuzz.data == 'same-effect':
@@ -985,76 +928,129 @@ def pokemon_search(request):
         else:
             move_ids = [move.id]
 
-        query = query.filter(me.pokemon_moves.any(
-            and_(t.PokemonMove.move_id.in_(move_ids),
-                *pokemoves_filter)
-        ))
+        mask &= index.rows_for_ids(learnsets.pokemon_learning(
+            move_ids, version_group_ids, method_ids))
 
     # Numbers
     for stat_id, field_name in c.stat_fields:
         stat_field = c.form['stat_' + field_name]
         effort_field = c.form['effort_' + field_name]
+        column = index.stat_columns[stat_id]
 
-        if stat_field.data or effort_field.data:
-            query, stat_alias = join_to_stat(stat_id)
+        if stat_field.data:
+            mask &= stat_field.data.mask(index.base_stats[:, column])
 
-            if stat_field.data:
-                query = query.filter(stat_field.data(stat_alias.base_stat))
-
-            if effort_field.data:
-                query = query.filter(effort_field.data(stat_alias.effort))
+        if effort_field.data:
+            mask &= effort_field.data.mask(index.efforts[:, column])
 
     if c.form.stat_total.data:
-        query, stat_total_subquery = join_to_stat_total()
-        query = query.filter(c.form.stat_total.data(
-            stat_total_subquery.c.stat_total))
+        mask &= c.form.stat_total.data.mask(index.stat_total)
 
     if c.form.effort_total.data:
-        query, stat_total_subquery = join_to_stat_total()
-        query = query.filter(c.form.effort_total.data(
-            stat_total_subquery.c.effort_total))
+        mask &= c.form.effort_total.data.mask(index.effort_total)
 
     if c.form.hatch_counter.data:
-        query = query.filter(c.form.hatch_counter.data(my_species.hatch_counter))
+        mask &= c.form.hatch_counter.data.mask(index.hatch_counter)
 
     if c.form.base_experience.data:
-        query = query.filter(c.form.base_experience.data(me.base_experience))
+        mask &= c.form.base_experience.data.mask(index.base_experience)
 
     if c.form.capture_rate.data:
-        query = query.filter(c.form.capture_rate.data(my_species.capture_rate))
+        mask &= c.form.capture_rate.data.mask(index.capture_rate)
 
     if c.form.base_happiness.data:
-        query = query.filter(c.form.base_happiness.data(my_species.base_happiness))
+        mask &= c.form.base_happiness.data.mask(index.base_happiness)
 
     if c.form.height.data:
-        query = query.filter(c.form.height.data(me.height))
+        mask &= c.form.height.data.mask(index.height)
 
     if c.form.weight.data:
-        query = query.filter(c.form.weight.data(me.weight))
+        mask &= c.form.weight.data.mask(index.weight)
 
     # Genus string
     if c.form.genus.data:
-        query = query.filter(ilike(my_species.names_table.genus, c.form.genus.data))
+        mask &= wildcard_mask(index.genera, c.form.genus.data,
+                              index.genus_ngrams)
 
     # Color
     if c.form.color.data:
-        query = query.filter( my_species.color_id == c.form.color.data.id )
+        mask &= index.color_id == c.form.color.data.id
 
     # Habitat
     if c.form.habitat.data:
-        query = query.filter( my_species.habitat_id == c.form.habitat.data.id )
+        mask &= index.habitat_id == c.form.habitat.data.id
 
     # Shape
     if c.form.shape.data:
-        query = query.filter( my_species.shape_id == c.form.shape.data.id )
+        mask &= index.shape_id == c.form.shape.data.id
+
+    ### Sorting
+    # nb: the index sorts ascending for words (a->z) and descending for
+    # numbers (9->1), because that's how it should be, okay
+    # Default fallback sort is by name, then by form
+    species_count = len(numpy.unique(index.species_ids[mask]))
+    total_count = int(mask.sum())
+    original_results = None
+
+    if c.form.sort.data == 'evolution-chain':
+        # This one is very special!  It affects sorting, but if the display
+        # is a table, sorting by chain will also show other Pokémon from
+        # each family, even if they don't match the search criteria.
+        # E.g., a search that produces Bulbasaur will display Bulbasaur,
+        # followed by Ivysaur and Venusaur dimmed.
+        # XXX doing this for lists would be nice, too, but would sort of
+        # break copy/paste, which is what lists are designed for
+
+        # Let the template know which Pokémon are actually in the original
+        # result set
+        original_results = set(index.pokemon_ids[mask].tolist())
+
+        # Pokémon are sorted by the id number of the first form of their
+        # chain to actually appear in the results.  This is wonky, but
+        # makes sure that fake results don't affect sorting
+        rows = index.family_rows(mask,
+            whole_families=c.display_mode in ('custom-table',))
+
+    else:
+        rows = index.sorted_rows(mask, c.form.sort.data,
+                                 backwards=c.form.sort_backwards.data)
+
+    return SearchResults(rows, species_count, total_count, original_results)
+
+
+def pokemon_search(request):
+    c = request.tmpl_context
+
+    F, c.stat_fields = _search_form('pokemon', _build_pokemon_search_form)
+
+    ### Parse form, etc etc
+    c.form = F(request.params)
+    c.form.validate()
+
+    # Rendering needs to know which version groups go with which
+    # generations for the move-version-group list
+    c.generations = db.pokedex_session.query(t.Generation) \
+        .options(joinedload('version_groups')) \
+        .order_by(t.Generation.id.asc())
+
+    # Rendering also needs an example Pokémon, to make the custom list docs
+    # reliable
+    c.eevee = db.pokedex_session.query(t.Pokemon).get(133)
+
+    # If this is the first time the form was submitted, redirect to a URL
+    # with only non-default values
+    if c.form.is_valid and c.form.was_submitted and c.form.needs_shortening:
+        return redirect(request.current_route_url(_query=c.form.cleansed_data.mixed()))
+
+    if not c.form.was_submitted or not c.form.is_valid:
+        # Either blank, or errortastic.  Skip the logic and just send the
+        # form back
+        return {}
 
 
     ### Display
     c.display_mode = c.form.display.data
     c.display_columns = []
-    c.original_results = None  # evolution chain thing
-    c.species_count = None
-    c.total_count = None
 
     if c.display_mode == 'smart-table':
         # Based on the standard table, but a little more clever.  For
@@ -1088,7 +1084,10 @@ def pokemon_search(request):
         # format and allows user HTML, and using h.escape() here likewise
         # escapes even legitimate $icon's.  Solution is to use h.escape,
         # then cast back to a string to remove infectious magic
-        c.display_template = Template( unicode(h.escape(list_format)) )
+        # Compiling the template works out which fields it uses, so only
+        # those get filled in, and only their relations get loaded
+        c.display_template = pokedex_helpers.compile_pokemon_template(
+            Template( unicode(h.escape(list_format)) ))
 
     else:
         # icons and sprites don't need any special behavior
@@ -1099,419 +1098,196 @@ def pokemon_search(request):
     if c.display_mode == 'custom-table' and 'name' not in c.display_columns:
         c.display_columns.append('link')
 
-    ### Sorting
-    # nb: the below sort ascending for words (a->z) and descending for
-    # numbers (9->1), because that's how it should be, okay
-    # Default fallback sort is by name, then by form
-    # XXX: Use name, not identifier
-    sort_clauses = [my_species.identifier.asc(), default_form.order.asc(),
-                    default_form.form_identifier.asc()]
-
-    if c.form.sort.data == 'id':
-        # Sorting by both name and national ID is redundant, since both are
-        # the same for two species.
-        sort_clauses[0] = my_species.id.asc()
-
-    elif c.form.sort.data == 'evolution-chain':
-        # This one is very special!  It affects sorting, but if the display
-        # is a table, sorting by chain will also show other Pokémon from
-        # each family, even if they don't match the search criteria.
-        # E.g., a search that produces Bulbasaur will display Bulbasaur,
-        # followed by Ivysaur and Venusaur dimmed.
-        # XXX doing this for lists would be nice, too, but would sort of
-        # break copy/paste, which is what lists are designed for
-
+    if c.form.sort.data == 'evolution-chain':
         # DO NOT allow sorting backwards!  It breaks the template's
         # indenting magic.  XXX fix me!
         c.form.sort_backwards.data = False
 
-        # Grab the results first; needed for sorting even if the query is
-        # otherwise left alone, boo
-        pokemon_ids = {}
-        species_ids = set()  # For result count
-        evolution_chain_ids = set()
-        for id, chain_id, species_id in query.values(me.id,
-          my_species.evolution_chain_id, my_species.id):
-            evolution_chain_ids.add(chain_id)
-            species_ids.add(species_id)
-            pokemon_ids[id] = None
-
-        c.species_count = len(species_ids)
-        c.total_count = len(pokemon_ids.keys())
-
-        # Rebuild the query
-        if c.display_mode in ('custom-table',):
-            query = db.pokedex_session.query(me).filter(
-                my_species.evolution_chain_id.in_( list(evolution_chain_ids) )
-            )
-        else:
-            query = db.pokedex_session.query(me) \
-                .filter(me.id.in_(pokemon_ids.keys()))
-
-        # Join the new query to pokemon & forms again; needed for sorting
-        query = query.join((me, my_species.pokemon))
-        query = query.outerjoin((default_form, me.default_form))
-
-        # Let the template know which Pokémon are actually in the original
-        # result set
-        c.original_results = pokemon_ids
-
-        # Pokémon should be sorted by the id number of the first form of
-        # their chain to actually appear in the results.  This is wonky,
-        # but makes sure that fake results don't affect sorting
-        chain_sorting_alias = aliased(t.Pokemon)
-        chain_sorting_species = aliased(t.PokemonSpecies)
-        chain_sorting_forms = aliased(t.PokemonForm)
-        chain_sorting_subquery = db.pokedex_session.query(
-                chain_sorting_species.evolution_chain_id,
-                func.min(chain_sorting_species.id).label('chain_position')
-            ).select_from(chain_sorting_alias) \
-            .filter(chain_sorting_alias.id.in_(pokemon_ids)) \
-            .outerjoin((chain_sorting_species, chain_sorting_alias.species)) \
-            .outerjoin((chain_sorting_forms, chain_sorting_alias.default_form)) \
-            .group_by(chain_sorting_species.evolution_chain_id) \
-            .subquery()
-
-        query = query.join((
-            chain_sorting_subquery,
-            chain_sorting_subquery.c.evolution_chain_id
-                == my_species.evolution_chain_id
-        ))
-
-        # Sort by ID instead of name within families
-        sort_clauses[0] = my_species.order
-
-        sort_clauses = [
-            chain_sorting_subquery.c.chain_position,
-            my_species.is_baby.desc()
-        ] + sort_clauses
-
-    elif c.form.sort.data == 'name':
-        # Name is fallback, so don't do anything
-        pass
-
-    elif c.form.sort.data == 'type':
-        # Sort by type1, then type2.  Unfortunately, need to left-join
-        # independently for each type to make this work right
-        type_sort_clauses = []
-        for type_slot in [1, 2]:
-            pokemon_type_alias = aliased(t.PokemonType)
-            type_alias = aliased(t.Type)
-
-            query = query \
-                .outerjoin((pokemon_type_alias,
-                    and_(pokemon_type_alias.pokemon_id == me.id,
-                         pokemon_type_alias.slot == type_slot))) \
-                .outerjoin((type_alias,
-                    pokemon_type_alias.type_id == type_alias.id))
-
-            # Single-type should come first; i.e., sorting by type2 asc
-            # means NULL should come first.  This isn't the default in
-            # postgres (and elsewhere?), so do it explicitly
-            if type_slot == 2:
-                # Booleans sort by false, true -- so this should be desc to
-                # put NULL first
-                type_sort_clauses.append((type_alias.id == None).desc())
-
-            type_sort_clauses.append(type_alias.identifier.asc())
-
-        sort_clauses = type_sort_clauses + sort_clauses
-
-    elif c.form.sort.data == 'growth-rate':
-        query = query.outerjoin(my_species.growth_rate)
-        query = query.outerjoin(t.Experience, t.GrowthRate.max_experience_obj)
-        sort_clauses.insert(0, t.Experience.experience.desc())
-
-    elif c.form.sort.data == 'height':
-        sort_clauses.insert(0, me.height.desc())
-
-    elif c.form.sort.data == 'weight':
-        sort_clauses.insert(0, me.weight.desc())
-
-    elif c.form.sort.data == 'gender':
-        sort_clauses.insert(0, my_species.gender_rate.asc())
-
-    elif c.form.sort.data == 'genus':
-        sort_clauses.insert(0, my_species.names_table.genus.asc())
-
-    elif c.form.sort.data == 'color':
-        query = query.outerjoin(my_species.color)
-        sort_clauses.insert(0, t.PokemonColor.identifier.asc())
-
-    elif c.form.sort.data == 'habitat':
-        query = query.outerjoin(my_species.habitat)
-        sort_clauses.insert(0, t.PokemonHabitat.identifier.asc())
-
-    elif c.form.sort.data == 'shape':
-        query = query.outerjoin(my_species.shape)
-        query = query.order_by(t.PokemonShape.identifier.asc())
-
-    elif c.form.sort.data == 'hatch-counter':
-        sort_clauses.insert(0, my_species.hatch_counter.desc())
-
-    elif c.form.sort.data == 'base-experience':
-        sort_clauses.insert(0, me.base_experience.desc())
-
-    elif c.form.sort.data == 'capture-rate':
-        sort_clauses.insert(0, my_species.capture_rate.desc())
-
-    elif c.form.sort.data == 'base-happiness':
-        sort_clauses.insert(0, my_species.base_happiness.desc())
-
-    elif c.form.sort.data == 'stat-total':
-        query, stat_total_subquery = join_to_stat_total()
-        sort_clauses.insert(0, stat_total_subquery.c.stat_total.desc())
-
-    elif c.form.sort.data.startswith('stat-'):
-        stat_ident = c.form.sort.data[5:]
-        query, stat_alias = join_to_stat(stat_ident)
-        sort_clauses.insert(0, stat_alias.base_stat.desc())
-
-    # Reverse sort
-    if c.form.sort_backwards.data:
-        for i, clause in enumerate(sort_clauses):
-            # This is some semi-black SQLA magic...
-            if clause.modifier == asc_op:
-                sort_clauses[i] = clause.element.desc()
-            else:
-                sort_clauses[i] = clause.element.asc()
-
-    query = query.order_by(*sort_clauses)
-
+    ### Do the searching!
+    # Repeat searches skip straight to fetching the results
+    index = searchindex.pokemon_index()
+    results = _cached_search(request, 'pokemon',
+                             lambda: _search_pokemon(c, index))
+    rows = results.rows
+    c.species_count = results.species_count
+    c.total_count = results.total_count
+    c.original_results = results.original_results  # evolution chain thing
+
+    ### Export
+    # Skips the template entirely, and streams every result rather than a
+    # page at a time
+    export_format = request.params.get('export')
+    if export_format in export.FORMATS:
+        columns = _export_columns(c, default_pokemon_table_columns)
+        return export.pokemon_response(export_format,
+            index.pokemon_ids[rows].tolist(), columns,
+            _pokemon_eagerloads(columns))
+
+    # The template indents each family from its first member, so a page
+    # mustn't start partway through one
+    groups = None
+    if c.form.sort.data == 'evolution-chain':
+        groups = index.evolution_root_ids
+    rows = _paginate(request, rows, index.pokemon_ids, groups)
+
+    ### Fetch the results
     # We always want the species
-    query = query.options(joinedload('species'))
-
-    ### Run the query!
-    c.results = query.all()
-
-    # Count the results (which we've already done if we're family-sorting)
-    if c.species_count is None:
-        c.species_count = len(set(result.species_id for result in c.results))
-        c.total_count = len(c.results)
+    c.results = hydration.load_in_order(t.Pokemon,
+        index.pokemon_ids[rows].tolist(), joinedload('species'))
 
     ### Eagerloading
-    # SQLAlchemy is guaranteed to only have one copy of a particular object
-    # around at a time.  So if I run queries with the same results several
-    # times, but eagerload something different each time, I'll only have
-    # one set of obects with all of the eagerloads present on each.
-    # For simplicity, and because all of the conditional eagerloads are
-    # has-manies, this code abuses the above property to eagerload
-    # everything after-the-fact, based on which table columns are visible.
-    # TODO doesn't apply so much to lists at the moment...
+    # Which relations are needed depends on which table columns are visible.
+    # Each one is fetched by itself, in batches, and attached to the results
+    # we already have; joining them all at once would multiply the rows.
+    # Lists need whatever their template's fields need.
     if c.results and c.display_mode == 'custom-table':
-        eagerloads = []
-
-        if 'icon' in c.display_columns:
-            eagerloads.append('default_form')
-
-        if 'type' in c.display_columns:
-            eagerloads.append('types')
-
-        if 'ability' in c.display_columns:
-            eagerloads.append('abilities')
-
-        if 'hidden_ability' in c.display_columns:
-            eagerloads.append('hidden_ability')
-
-        if 'egg_group' in c.display_columns:
-            eagerloads.append('species.egg_groups')
-
-        if any(column[0:5] == 'stat_' for column in c.display_columns) \
-            or 'effort' in c.display_columns:
-
-            eagerloads.append('stats.stat')
-
-        if c.form.sort.data == 'evolution-chain':
-            # Gotta know the chain itself and the parent Pokémon to make
-            # the cool indented tree work
-            eagerloads.append('species.parent_species')
-
-
-        ids = [_.id for _ in c.results]
-        for relation in eagerloads:
-            # Run the query again, selecting only by id this time, but
-            # eagerloading some relation
-            (db.pokedex_session.query(t.Pokemon) \
-                .filter(t.Pokemon.id.in_(ids)) \
-                .options(joinedload_all(relation)) \
-                .all())
+        hydration.load_pokemon(c.results, _pokemon_eagerloads(
+            c.display_columns, c.form.sort.data == 'evolution-chain'))
+    elif c.results and c.display_mode in ('custom-list',
+                                          'custom-list-bullets'):
+        hydration.load_pokemon(c.results, c.display_template.relations)
 
     ### Done.
     return {}
 
-def move_search(request):
-    c = request.tmpl_context
-
-    ### First tack some database-driven fields onto the form
-    c.stats = db.pokedex_session.query(t.Stat).all()
-
-    class F(MoveSearchForm):
-        stat_change = StatField(c.stats, RangeTextField('', inflator=int, signed=True))
-
-    # Add flag fields dynamically
-    c.flag_fields = []
-    c.flags = db.pokedex_session.query(t.MoveFlag) \
-        .order_by(t.MoveFlag.id)
-    for flag in c.flags:
-        field_name = 'flag_' + flag.identifier
-        field = fields.SelectField(flag.name,
-            choices=[
-                (u'any',    u''),
-                (u'yes',    u'Yes'),
-                (u'no',     u'No'),
-            ],
-            default=u'any',
-        )
-
-        c.flag_fields.append((field_name, flag.id))
-        setattr(F, field_name, field)
-
-
-    ### Parse form, etc etc
-    c.form = F(request.params)
-    c.form.validate()
-
-    # Rendering needs to know which version groups go with which
-    # generations for the move-version-group list
-    c.generations = db.pokedex_session.query(t.Generation) \
-        .order_by(t.Generation.id.asc())
-
-    # Rendering also needs an example move, to make the custom list docs
-    # reliable
-    c.surf = db.pokedex_session.query(t.Move).get(57)
-
-    # If this is the first time the form was submitted, redirect to a URL
-    # with only non-default values
-    if c.form.is_valid and c.form.was_submitted and c.form.needs_shortening:
-        return redirect(request.current_route_url(_query=c.form.cleansed_data.mixed()))
-
-    if not c.form.was_submitted or not c.form.is_valid:
-        # Either blank, or errortastic.  Skip the logic and just send the
-        # form back
-        return {}
-
-
+def _search_moves(c, index):
+    """Runs the move search described by `c.form` against `index`, and
+    returns a `SearchResults`.
+    """
     ### Do the searching!
-    me = t.Move
-    query = db.pokedex_session.query(me) \
-        .join(me.names_local) \
-        .join(t.MoveEffect) \
-        .outerjoin(t.MoveMeta)
+    # As with Pokémon, everything is already in memory, and each criterion
+    # narrows down a mask of the rows of the index
+    mask = index.everything()
 
     # Name
     if c.form.name.data:
-        query = query.filter( ilike(me.names_table.name, c.form.name.data) )
+        mask &= wildcard_mask(index.names, c.form.name.data,
+                              index.name_ngrams)
 
     # Damage class
     if c.form.damage_class.data:
-        query = query.filter(
-            me.damage_class_id.in_(_.id for _ in c.form.damage_class.data)
-        )
+        mask &= numpy.in1d(index.damage_class_id,
+                           [_.id for _ in c.form.damage_class.data])
 
     # Generation
     if c.form.introduced_in.data:
-        query = query.filter(
-            me.generation_id.in_(_.id for _ in c.form.introduced_in.data)
-        )
+        mask &= numpy.in1d(index.generation_id,
+                           [_.id for _ in c.form.introduced_in.data])
 
     # Target
     if c.form.target.data:
-        query = query.filter(me.target_id == c.form.target.data.id)
+        mask &= index.target_id == c.form.target.data.id
 
     # Effect
     if c.form.similar_to.data:
-        query = query.filter(me.effect_id == c.form.similar_to.data.effect_id)
+        mask &= index.effect_id == c.form.similar_to.data.effect_id
 
     # Type
     if c.form.type.data:
         type_ids = [_.id for _ in c.form.type.data]
-        query = query.filter( me.type_id.in_(type_ids) )
+        mask &= numpy.in1d(index.type_id, type_ids)
 
     if not c.form.shadow_moves.data:
-        query = query.filter(me.type_id != 10002)
+        mask &= index.type_id != 10002
 
     # Flags
     for field, flag_id in c.flag_fields:
         if c.form[field].data != u'any':
-            # Join to a move-flag table that's cut down to just this flag
-            flag_alias = aliased(t.MoveFlagMap)
-            subq = db.pokedex_session.query(flag_alias) \
-                .filter(flag_alias.move_flag_id == flag_id) \
-                .subquery()
-
-            # Then join or nega-join against it
+            has_flag = searchindex.any_of(index.flags, index.flag_columns,
+                                          [flag_id])
             if c.form[field].data == u'yes':
-                query = query.join((subq, me.id == subq.c.move_id))
+                mask &= has_flag
             else:
-                query = query.outerjoin((subq, me.id == subq.c.move_id)) \
-                    .filter(subq.c.move_id == None)
+                mask &= ~has_flag
 
     # Meta stuff
     if c.form.category.data:
-        query = query.filter(t.MoveMeta.meta_category_id.in_(
-            row.id for row in c.form.category.data))
+        mask &= numpy.in1d(index.meta_category_id,
+                           [row.id for row in c.form.category.data])
 
     if c.form.ailment.data:
-        query = query.filter(t.MoveMeta.meta_ailment_id.in_(
-            row.id for row in c.form.ailment.data))
+        mask &= numpy.in1d(index.meta_ailment_id,
+                           [row.id for row in c.form.ailment.data])
 
     if c.form.crit_rate.data:
-        query = query.filter(t.MoveMeta.crit_rate > 0)
+        mask &= index.increased_crit_rate
 
     if c.form.multi_hit.data:
-        query = query.filter(t.MoveMeta.min_hits != None)
+        mask &= index.multi_hit
 
     if c.form.multi_turn.data:
-        query = query.filter(t.MoveMeta.min_turns != None)
+        mask &= index.multi_turn
 
     for stat_field in c.form.stat_change:
         if not stat_field.data:
             continue
 
-        query = query.filter(me.meta_stat_changes.any(and_(
-            t.MoveMetaStatChange.stat == stat_field.stat,
-            stat_field.data(t.MoveMetaStatChange.change),
-        )))
+        # Moves that don't change this stat are NaN, which never matches
+        column = index.stat_change_columns[stat_field.stat.id]
+        mask &= stat_field.data.mask(index.stat_changes[:, column])
 
     ### Numbers
     # These are all ranges:
-    for form_field, column in [
-        (c.form.accuracy,           me.accuracy),
-        (c.form.pp,                 me.pp),
-        (c.form.power,              me.power),
-        (c.form.priority,           me.priority),
-        (c.form.recoil,             t.MoveMeta.recoil),
-        (c.form.healing,            t.MoveMeta.healing),
-        (c.form.ailment_chance,     t.MoveMeta.ailment_chance),
-        (c.form.flinch_chance,      t.MoveMeta.flinch_chance),
-        (c.form.stat_chance,        t.MoveMeta.stat_chance),
+    for form_field, values in [
+        (c.form.accuracy,           index.accuracy),
+        (c.form.pp,                 index.pp),
+        (c.form.power,              index.power),
+        (c.form.priority,           index.priority),
+        (c.form.recoil,             index.recoil),
+        (c.form.healing,            index.healing),
+        (c.form.ailment_chance,     index.ailment_chance),
+        (c.form.flinch_chance,      index.flinch_chance),
+        (c.form.stat_chance,        index.stat_chance),
     ]:
         if not form_field.data:
             continue
-        query = query.filter(form_field.data(column))
+        mask &= form_field.data.mask(values)
 
-    # Pokémon -- they're ORed, so only one subquery is necessary
-    #for pokemon in c.form.pokemon.data:
+    # Pokémon -- they're ORed, so they can all be looked up at once
     if c.form.pokemon.data:
-        pokemoves_alias = aliased(t.PokemonMove)
+        learnsets = searchindex.learnset_index()
+        mask &= index.rows_for_ids(learnsets.moves_learned_by(
+            [_.id for _ in c.form.pokemon.data],
+            [_.id for _ in c.form.pokemon_version_group.data],
+            [_.id for _ in c.form.pokemon_method.data],
+        ))
 
-        ids = [_.id for _ in c.form.pokemon.data]
-        pokemoves_subq = db.pokedex_session.query(pokemoves_alias.move_id) \
-            .filter(pokemoves_alias.pokemon_id.in_(ids))
+    ### Sorting
+    # nb: the index sorts ascending for words (a->z) and descending for
+    # numbers (9->1), because that's how it should be, okay
+    # Default fallback sort is by name, then by id
+    rows = index.sorted_rows(mask, c.form.sort.data,
+                             backwards=c.form.sort_backwards.data)
+
+    return SearchResults(rows, None, len(rows), None)
+
+def move_search(request):
+    c = request.tmpl_context
+
+    F, c.flag_fields = _search_form('move', _build_move_search_form)
+
+    ### Parse form, etc etc
+    c.form = F(request.params)
+    c.form.validate()
 
-        if c.form.pokemon_method.data:
-            ids = [_.id for _ in c.form.pokemon_method.data]
-            pokemoves_subq = pokemoves_subq.filter(
-                pokemoves_alias.pokemon_move_method_id.in_(ids))
+    # Rendering needs to know which version groups go with which
+    # generations for the move-version-group list
+    c.generations = db.pokedex_session.query(t.Generation) \
+        .order_by(t.Generation.id.asc())
 
-        if c.form.pokemon_version_group.data:
-            ids = [_.id for _ in c.form.pokemon_version_group.data]
-            pokemoves_subq = pokemoves_subq.filter(
-                pokemoves_alias.version_group_id.in_(ids))
+    # Rendering also needs an example move, to make the custom list docs
+    # reliable
+    c.surf = db.pokedex_session.query(t.Move).get(57)
 
-        pokemoves_subq = pokemoves_subq.subquery()
+    # If this is the first time the form was submitted, redirect to a URL
+    # with only non-default values
+    if c.form.is_valid and c.form.was_submitted and c.form.needs_shortening:
+        return redirect(request.current_route_url(_query=c.form.cleansed_data.mixed()))
 
-        query = query.filter(me.id.in_(pokemoves_subq))
+    if not c.form.was_submitted or not c.form.is_valid:
+        # Either blank, or errortastic.  Skip the logic and just send the
+        # form back
+        return {}
 
 
     ### Display
@@ -1548,71 +1324,41 @@ def move_search(request):
         # See super-duper long comment for Pokémon search.  Doesn't matter
         # so much for moves, which have no literal() template things, but
         # avoids bugs in the future.
-        c.display_template = Template( unicode(h.escape(list_format)) )
+        c.display_template = pokedex_helpers.compile_move_template(
+            Template( unicode(h.escape(list_format)) ))
 
     # "Name" is the field that actually links to the page.  If it's
     # missing, add a little link column
     if c.display_mode == 'custom-table' and 'name' not in c.display_columns:
         c.display_columns.append('link')
 
-    ### Sorting
-    # nb: the below sort ascending for words (a->z) and descending for
-    # numbers (9->1), because that's how it should be, okay
-    # Default fallback sort is by name, then by id (in case of form)
-    sort_clauses = [ me.names_table.name.asc(), me.id.asc() ]
-    if c.form.sort.data == 'id':
-        sort_clauses.insert(0,
-            me.id.asc()
-        )
-
-    elif c.form.sort.data == 'name':
-        # Name is fallback, so don't do anything
-        pass
-
-    elif c.form.sort.data == 'type':
-        # Sort by type name
-        query = query.join(me.type)
-        sort_clauses.insert(0, t.Type.identifier.asc())
-
-    elif c.form.sort.data == 'class':
-        sort_clauses.insert(0, me.damage_class_id.asc())
-
-    elif c.form.sort.data == 'pp':
-        sort_clauses.insert(0, me.pp.desc())
-
-    elif c.form.sort.data == 'power':
-        sort_clauses.insert(0, me.power.desc())
-
-    elif c.form.sort.data == 'accuracy':
-        sort_clauses.insert(0, me.accuracy.desc())
-
-    elif c.form.sort.data == 'priority':
-        sort_clauses.insert(0, t.Move.priority.desc())
-
-    elif c.form.sort.data == 'effect':
-        query = query.join(t.MoveEffect.prose)
-        sort_clauses.insert(0, t.MoveEffect.prose_table.effect.desc())
-
-    # Reverse sort
-    if c.form.sort_backwards.data:
-        for i, clause in enumerate(sort_clauses):
-            # This is some semi-black SQLA magic...
-            if clause.modifier == asc_op:
-                sort_clauses[i] = clause.element.desc()
-            else:
-                sort_clauses[i] = clause.element.asc()
-
-    query = query.order_by(*sort_clauses)
-
-    # Eagerload the obvious stuff: type and damage class
-    query = query.options(
-        joinedload('type'),
-        joinedload('damage_class'),
-        joinedload('move_effect'),
-        joinedload('move_effect.prose_local'),
-    )
+    ### Do the searching!
+    index = searchindex.move_index()
+    results = _cached_search(request, 'move',
+                             lambda: _search_moves(c, index))
+    rows = results.rows
+    c.total_count = results.total_count
+
+    ### Export
+    export_format = request.params.get('export')
+    if export_format in export.FORMATS:
+        return export.move_response(export_format,
+            index.move_ids[rows].tolist(),
+            _export_columns(c, default_move_table_columns))
+
+    rows = _paginate(request, rows, index.move_ids)
+
+    ### Fetch the results
+    # Eagerload the obvious stuff: type and damage class.  Lists only need
+    # whatever their template's fields need.
+    if c.display_mode in ('custom-list', 'custom-list-bullets'):
+        eagerloads = c.display_template.relations
+    else:
+        eagerloads = ['type', 'damage_class',
+                      'move_effect', 'move_effect.prose_local']
 
-    c.results = query.all()
+    c.results = hydration.load_in_order(t.Move, index.move_ids[rows].tolist(),
+        *[joinedload(relation) for relation in eagerloads])
 
     ### Done.
     return {}
@@ -2,8 +2,6 @@
 
 from __future__ import division
 
-from collections import defaultdict
-
 from sqlalchemy.orm import (contains_eager)
 from sqlalchemy.orm import (joinedload, joinedload_all, subqueryload, subqueryload_all)
 from sqlalchemy.orm.exc import NoResultFound
@@ -12,6 +10,7 @@ import pyramid.httpexceptions as exc
 import pokedex.db.tables as t
 
 from .. import db
+from .. import typechart
 from . import caching
 
 def type_list(request):
@@ -22,7 +21,6 @@ def type_list(request):
         .filter(t.Type.damage_efficacies.any()) \
         .order_by(t.Type.names_table.name) \
         .options(contains_eager(t.Type.names_local)) \
-        .options(joinedload('damage_efficacies')) \
         .all()
 
     if 'secondary' in request.params:
@@ -30,45 +28,34 @@ def type_list(request):
             c.secondary_type = db.get_by_name_query(
                     t.Type, request.params['secondary'].lower()) \
                 .filter(t.Type.damage_efficacies.any()) \
-                .options(joinedload('target_efficacies')) \
                 .one()
         except NoResultFound:
             raise exc.HTTPNotFound()
-
-        c.secondary_efficacy = dict(
-            (efficacy.damage_type, efficacy.damage_factor)
-            for efficacy in c.secondary_type.target_efficacies
-        )
+        secondary_id = c.secondary_type.id
     else:
         c.secondary_type = None
-        c.secondary_efficacy = defaultdict(lambda: 100)
+        secondary_id = None
+
+    # The factor of each attacking type against each defending type (plus
+    # the secondary type, if any), with defenders sorted by name
+    chart = typechart.type_chart()
+    factors = chart.with_secondary(secondary_id)
+    targets = [chart.index[type.id]
+               for type in sorted(c.types, key=lambda type: type.name)]
+    c.damage_factors = dict(
+        (type, [int(f) for f in factors[chart.index[type.id], targets]])
+        for type in c.types)
 
     # Count up a relative score for each type, both attacking and
-    # defending.  Normal damage counts for 0; super effective counts for
-    # +1; not very effective counts for -1.  Ineffective counts for -2.
-    # With dual types, x4 is +2 and x1/4 is -2; ineffective is -4.
-    # Everything is of course the other way around for defense.
-    attacking_score_conversion = {
-        400: +2,
-        200: +1,
-        100:  0,
-         50: -1,
-         25: -2,
-          0: -2,
-    }
-    if c.secondary_type:
-        attacking_score_conversion[0] = -4
-
-    c.attacking_scores = defaultdict(int)
-    c.defending_scores = defaultdict(int)
-    for attacking_type in c.types:
-        for efficacy in attacking_type.damage_efficacies:
-            defending_type = efficacy.target_type
-            factor = efficacy.damage_factor * \
-                c.secondary_efficacy[attacking_type] // 100
-
-            c.attacking_scores[attacking_type] += attacking_score_conversion[factor]
-            c.defending_scores[defending_type] -= attacking_score_conversion[factor]
+    # defending; see typechart.SCORE_CONVERSION.  Everything is of course
+    # the other way around for defense.
+    attacking_scores, defending_scores = chart.scores(secondary_id)
+    c.attacking_scores = dict(
+        (type, int(attacking_scores[chart.index[type.id]]))
+        for type in c.types)
+    c.defending_scores = dict(
+        (type, int(defending_scores[chart.index[type.id]]))
+        for type in c.types)
 
     return {}
 
@@ -100,15 +87,22 @@ def type_view(request):
 def _do_type(request, cache_key):
     c = request.tmpl_context
 
+    ### Damage dealt and taken, as (type, factor) lists sorted by name
+    chart = typechart.type_chart()
+    if c.type.id in chart:
+        c.damage_dealt = sorted(
+            typechart.type_factor_dict(chart.attack(c.type.id)).items(),
+            key=lambda (type, factor): type.name)
+        c.damage_taken = sorted(
+            typechart.type_factor_dict(chart.defense(c.type.id)).items(),
+            key=lambda (type, factor): type.name)
+    else:
+        c.damage_dealt = c.damage_taken = []
+
     # Eagerload a bit of type stuff
     db.pokedex_session.query(t.Type) \
         .filter_by(id=c.type.id) \
         .options(
-            subqueryload('damage_efficacies'),
-            joinedload('damage_efficacies.target_type'),
-            subqueryload('target_efficacies'),
-            joinedload('target_efficacies.damage_type'),
-
             # Move stuff
             subqueryload('moves'),
             joinedload('moves.damage_class'),